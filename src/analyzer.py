@@ -1,115 +1,93 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+import cPickle
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+
 import CairoPlot
 
+from .base import BugzillaDB
+from .table import BugTable
+
 
 class AbstractAnalyzer(object):
     """ This is a base class that represents database interface.
     All other classes which represent concrete implementations of database
     must be derived from this class.
+
+    Severities and their weights are shared by all analyzers, so scores
+    they calculate can be compared. Derived classes only have to count bugs
+    by severity, everything else is computed from those counts.
     """
-    def calculateProductScore(self, qry):
-        raise Exception("You must implement this method in a derived class!")
+    #private:
+    _severities = ['enhancement', 'trivial', 'minor', 'normal',
+                   'major', 'critical', 'blocker']
+    _weights = {'enhancement': 0.143,
+                'trivial': 0.286,
+                'minor': 0.429,
+                'normal': 0.571,
+                'major': 0.714,
+                'critical': 0.857,
+                'blocker': 1}
 
-    def getNumberOfBugs(self, qry):
-        raise Exception("You must implement this method in a derived class!")
+    def _score(self, bugs_by_type):
+        score = 0
+        for severity in self._severities:
+            score += bugs_by_type[severity]*self._weights[severity]
 
-    def getNumberOfBugsByType(self, qry):
-        raise Exception("You must implement this method in a derived class!")
+        return score
 
-    def plotSeverityDistribution(self, dist, product):
-        raise Exception("You must implement this method in a derived class!")
+    def _statistics(self, bugs_by_type):
+        """ Makes product statistics out of number of bugs of each severity.
+        Severities we don't know about are ignored.
+        """
+        counts = {}
+        for severity in self._severities:
+            counts[severity] = bugs_by_type.get(severity, 0)
 
+        return {'bugs_by_type': counts,
+                'num_of_bugs': sum(counts.values()),
+                'score': self._score(counts)}
 
-class MongoAnalyzer(AbstractAnalyzer):
-    """ This is concrete implementation of database using the strategy
-    interface.
-    """
-    #private:
-    _enhan_weight = 0.143
-    _trivial_weight = 0.286
-    _minor_weight = 0.429
-    _normal_weight = 0.571
-    _major_weight = 0.714
-    _critical_weight = 0.857
-    _blocker_weight = 1
-
-    _enhan_num = 0
-    _trivial_num = 0
-    _minor_num = 0
-    _normal_num = 0
-    _major_num = 0
-    _critical_num = 0
-    _blocker_num = 0
-
-    def _reset(self):
-        self._enhan_num = 0
-        self._trivial_num = 0
-        self._minor_num = 0
-        self._normal_num = 0
-        self._major_num = 0
-        self._critical_num = 0
-        self._blocker_num = 0
+    def _countBugs(self, qry):
+        """ Returns number of bugs of each severity """
+        raise Exception("You must implement this method in a derived class!")
 
-    def _countBugs(self, query):
-        for bug in query.find():
-            if bug['severity'] == 'enhancement':
-                self._enhan_num += 1
-            elif bug['severity'] == 'trivial':
-                self._trivial_num += 1
-            elif bug['severity'] == 'minor':
-                self._minor_num += 1
-            elif bug['severity'] == 'normal':
-                self._normal_num += 1
-            elif bug['severity'] == 'major':
-                self._major_num += 1
-            elif bug['severity'] == 'critical':
-                self._critical_num += 1
-            elif bug['severity'] == 'blocker':
-                self._blocker_num += 1
+    def query(self, database, product):
+        """ Returns bugs of a product in a form this analyzer works with.
+        Database can be either BugzillaDB or a concrete database.
+        """
+        return database.queryProductBugs(str(product))
 
     def calculateProductScore(self, qry):
-        self._countBugs(qry)
-        score = self._enhan_num*self._enhan_weight + \
-                self._trivial_num*self._trivial_weight + \
-                self._minor_num*self._minor_weight + \
-                self._normal_num*self._normal_weight + \
-                self._major_num*self._major_weight + \
-                self._critical_num*self._critical_weight + \
-                self._blocker_num*self._blocker_weight
-
-        self._reset()
-        return score
+        return self._score(self._countBugs(qry))
 
     def getNumberOfBugs(self, qry):
-        self._countBugs(qry)
-        numOfBugs = self._enhan_num + \
-                    self._trivial_num + \
-                    self._minor_num + \
-                    self._normal_num + \
-                    self._major_num + \
-                    self._critical_num + \
-                    self._blocker_num
-
-        self._reset()
-        return numOfBugs
+        return sum(self._countBugs(qry).values())
 
     def getNumberOfBugsByType(self, qry):
-        self._countBugs(qry)
-        bugs_by_type = {'enhancement': self._enhan_num,
-                        'trivial': self._trivial_num,
-                        'minor': self._minor_num,
-                        'normal': self._normal_num,
-                        'major': self._major_num,
-                        'critical': self._critical_num,
-                        'blocker': self._blocker_num}
-        self._reset()
-        return bugs_by_type
+        return self._countBugs(qry)
+
+    def getProductStatistics(self, qry):
+        """ Returns number of bugs by type, total number of bugs and score
+        of a product, all computed from a single query.
+        """
+        return self._statistics(self._countBugs(qry))
+
+    def plotFile(self, product):
+        """ Returns name of the file a plot of a product is rendered to.
+        CairoPlot picks the format by the extension of the name it is given
+        and adds .svg to names that have none it knows.
+        """
+        name = str(product)
+        if name.rsplit('.', 1)[-1].lower() not in ['svg', 'png', 'ps', 'pdf']:
+            name += ".svg"
+
+        return name
 
     def plotProductSeverityDistribution(self, dist, product):
-        severity_list = ['enhancement', 'trivial', 'minor', 'normal',
-                         'major', 'critical', 'blocker']
+        severity_list = self._severities
         values_list = []
 
         for severity in severity_list:
@@ -123,40 +101,373 @@ class MongoAnalyzer(AbstractAnalyzer):
                            h_labels=severity_list, v_labels=vlabels)
 
 
+class MongoAnalyzer(AbstractAnalyzer):
+    """ This is concrete implementation of database using the strategy
+    interface.
+
+    Bugs are counted by MongoDB itself, with an aggregation that groups
+    them by severity, so only seven numbers are sent back to us.
+    """
+    #private:
+    def _countBugs(self, query):
+        """ Returns number of bugs of each severity """
+        bugs_by_type = dict.fromkeys(self._severities, 0)
+        groups = query.aggregate([{'$group': {'_id': '$severity',
+                                              'count': {'$sum': 1}}}])
+
+        for group in groups['result']:
+            if group['_id'] in bugs_by_type:
+                bugs_by_type[group['_id']] = group['count']
+
+        return bugs_by_type
+
+
+class SQLiteAnalyzer(AbstractAnalyzer):
+    """ This is concrete implementation of database using the strategy
+    interface.
+
+    Works with products of SQLiteDatabase. Bugs are counted by SQLite,
+    grouped by severity over an index, and score is calculated from those
+    counts the same way MongoAnalyzer does it, so scores of both match.
+    """
+    #private:
+    def _countBugs(self, query):
+        """ Returns number of bugs of each severity """
+        bugs_by_type = dict.fromkeys(self._severities, 0)
+        groups = query.conn.execute("SELECT severity, COUNT(*) FROM bugs "
+                                    "WHERE product = ? GROUP BY severity",
+                                    (query.product,))
+
+        for severity, count in groups:
+            if severity in bugs_by_type:
+                bugs_by_type[severity] = count
+
+        return bugs_by_type
+
+
+class StreamAnalyzer(AbstractAnalyzer):
+    """ This is concrete implementation of database using the strategy
+    interface.
+
+    Works with any database. Only severities of bugs are queried and they
+    are counted in a single pass as bugs are read, one at a time, so memory
+    use doesn't depend on the number of bugs. Counts, and so the score,
+    are the same as those of MongoAnalyzer.
+    """
+    #private:
+    def _countBugs(self, query):
+        """ Returns number of bugs of each severity """
+        bugs_by_type = dict.fromkeys(self._severities, 0)
+
+        for bug in query:
+            severity = bug.get('severity')
+            if severity in bugs_by_type:
+                bugs_by_type[severity] += 1
+
+        return bugs_by_type
+
+    def query(self, database, product):
+        return database.queryProductBugs(str(product), fields=['severity'])
+
+
+_worker = None
+
+
+def _initWorker(state):
+    """ Sets up a process of a pool, see Analyzer.getProductsStatistics.
+    Database is unpickled here, so the process opens its own connections
+    even if it was forked with those of its parent.
+    """
+    global _worker
+    _worker = cPickle.loads(state)
+
+
+def _countWorker(product):
+    """ Counts bugs of a product by severity in a process of a process pool
+    and returns them as a tuple, in the order of severities, which is all
+    that is sent back.
+    """
+    database, analyzer, cached = _worker
+
+    if cached:
+        bugs_by_type = database.getProductStatistics(product)['bugs_by_type']
+    else:
+        bugs_by_type = analyzer._countBugs(analyzer.query(database, product))
+
+    return product, tuple(bugs_by_type.get(severity, 0)
+                          for severity in analyzer._severities)
+
+
 class Analyzer(object):
     """ This class is actually a Context that is configured with
     a ConcreteStrategy object and maintains a reference to a Strategy object.
+
+    If cached is set, numbers of bugs are taken from product statistics
+    that the database keeps up to date, instead of going through bugs.
+
+    Analysis is timed in metrics of the database, if it has them, see
+    BugzillaDB.
+
+    If a cache is given (see cache.ResultCache), statistics of products and
+    their plots are kept there, under the name of the product and its data
+    version: its number of bugs and time of its latest change, which the
+    database keeps in product statistics. Asking for them again, until the
+    product changes, neither goes through bugs nor renders the plot.
     """
-    def __init__(self, database, analyzer):
+    def __init__(self, database, analyzer, cached=True, cache=None):
         self.db = database
         self.an = analyzer
+        self.cached = cached
+        self.cache = cache
+        self.metrics = database.metrics
+
+    #private:
+    def _cacheKey(self, kind, product):
+        """ Returns the key results of a product are cached under. It
+        changes whenever bugs of the product are written.
+        """
+        stats = self.db.getProductStatistics(str(product))
+        return [kind, str(product), stats['num_of_bugs'],
+                stats.get('last_change_time', ''), type(self.an).__name__]
+
+    def _countStatistics(self, product):
+        if self.cached:
+            stats = self.db.getProductStatistics(str(product))
+            return self.an._statistics(stats['bugs_by_type'])
+
+        q = self.an.query(self.db, product)
+        with self.metrics.phase('count_bugs'):
+            stats = self.an.getProductStatistics(q)
+        return stats
 
+    #public:
     def calculateProductScore(self, product):
-        q = self.db.queryProductBugs(str(product))
-        scr = self.an.calculateProductScore(q)
+        if self.cached or self.cache is not None:
+            return self.getProductStatistics(product)['score']
+
+        q = self.an.query(self.db, product)
+        with self.metrics.phase('count_bugs'):
+            scr = self.an.calculateProductScore(q)
         return scr
 
     def getNumberOfBugs(self, product):
-        q = self.db.queryProductBugs(str(product))
-        num = self.an.getNumberOfBugs(q)
+        if self.cached or self.cache is not None:
+            return self.getProductStatistics(product)['num_of_bugs']
+
+        q = self.an.query(self.db, product)
+        with self.metrics.phase('count_bugs'):
+            num = self.an.getNumberOfBugs(q)
         return num
 
     def getNumberOfBugsByType(self, product):
-        q = self.db.queryProductBugs(str(product))
-        typ = self.an.getNumberOfBugsByType(q)
+        if self.cached or self.cache is not None:
+            return self.getProductStatistics(product)['bugs_by_type']
+
+        q = self.an.query(self.db, product)
+        with self.metrics.phase('count_bugs'):
+            typ = self.an.getNumberOfBugsByType(q)
         return typ
 
+    def getProductStatistics(self, product):
+        """ Returns number of bugs by type, total number of bugs and score
+        of a product in one go.
+        """
+        if self.cache is None:
+            return self._countStatistics(product)
+
+        key = self._cacheKey('statistics', product)
+        found, stats = self.cache.get(key)
+        if not found:
+            stats = self._countStatistics(product)
+            self.cache.put(key, stats)
+        return stats
+
+    def loadBugTable(self, products=None):
+        """ Loads given products, or all products we are tracking, into
+        a compact in-memory table of bugs, see BugTable.
+        """
+        if products is None:
+            products = self.db.listTrackedProducts()
+
+        table = BugTable(self.an._severities)
+        with self.metrics.phase('load_bug_table'):
+            for product in products:
+                table.load(self.db, product)
+
+        return table
+
     def plotProductSeverityDistribution(self, product):
+        """ Renders a bar plot of product's bugs by severity. With a cache,
+        a plot of the same data is rendered only once, and then copied from
+        the cache.
+        """
+        if self.cache is not None:
+            key = self._cacheKey('plot', product)
+            found, image = self.cache.get(key)
+            if found:
+                with open(self.an.plotFile(product), 'wb') as f:
+                    f.write(image)
+                return
+
         severity_dist = self.getNumberOfBugsByType(product)
-        self.an.plotProductSeverityDistribution(severity_dist, product)
+        with self.metrics.phase('plot'):
+            self.an.plotProductSeverityDistribution(severity_dist, product)
+
+        if self.cache is not None:
+            with open(self.an.plotFile(product), 'rb') as f:
+                self.cache.put(key, f.read())
+
+    def _productsStatistics(self, products, clone=False):
+        """ Returns statistics of given products. If clone is set, they
+        are computed with a copy of our database, so it can be done from
+        another thread.
+        """
+        analyzer = self
+        if clone:
+            analyzer = Analyzer(self.db.clone(), self.an, self.cached)
+
+        return [(product, analyzer._countStatistics(product))
+                for product in products]
+
+    def _processProductsStatistics(self, products, processes):
+        """ Returns statistics of given products, computed by a pool of
+        processes. See getProductsStatistics.
+        """
+        database = self.db
+        if isinstance(database, BugzillaDB):
+            database = database.db
+        state = cPickle.dumps((database, self.an, self.cached),
+                              cPickle.HIGHEST_PROTOCOL)
+
+        # biggest products go first, so no process is left with a big one
+        # when the others are done
+        sizes = dict((product, database.productSize(product))
+                     for product in products)
+        order = sorted(products, key=lambda product: (-sizes[product],
+                                                      product))
+
+        counts = {}
+        pool = Pool(processes, _initWorker, (state,))
+        try:
+            for product, histogram in pool.imap_unordered(_countWorker,
+                                                          order):
+                counts[product] = histogram
+        finally:
+            pool.close()
+            pool.join()
+
+        return [(product, self.an._statistics(dict(zip(
+            self.an._severities, counts[product])))) for product in products]
+
+    def getProductsStatistics(self, products=None, workers=1, processes=1):
+        """ Returns statistics of given products, or of all products we are
+        tracking, as a list of (product, statistics) pairs in the order of
+        products, see getProductStatistics.
+
+        If workers is more than one, products are analyzed by that many
+        threads at the same time. If processes is more than one, they are
+        analyzed by a pool of that many processes instead, which pays off
+        when counting takes CPU time, like parsing XML does. Every process
+        opens its own connections to the database and sends back only the
+        number of bugs of each severity. Biggest products are handed out
+        first, and results don't depend on which process finished first.
+
+        With a cache, only products whose statistics are not cached are
+        analyzed.
+        """
+        if products is None:
+            products = self.db.listTrackedProducts()
+        products = [str(product) for product in products]
+
+        statistics = {}
+        keys = {}
+        if self.cache is not None:
+            for product in products:
+                keys[product] = self._cacheKey('statistics', product)
+                found, stats = self.cache.get(keys[product])
+                if found:
+                    statistics[product] = stats
+        missing = [product for product in products
+                   if product not in statistics]
+
+        if processes > 1 and len(missing) > 1:
+            results = self._processProductsStatistics(missing, processes)
+        elif workers > 1 and len(missing) > 1:
+            chunks = [missing[i::workers] for i in range(workers)]
+            pool = ThreadPool(workers)
+            try:
+                chunks = pool.map(
+                    lambda chunk: self._productsStatistics(chunk, True),
+                    chunks)
+            finally:
+                pool.close()
+            results = [item for chunk in chunks for item in chunk]
+        else:
+            results = self._productsStatistics(missing)
+
+        for product, stats in results:
+            statistics[product] = stats
+            if self.cache is not None:
+                self.cache.put(keys[product], stats)
+
+        return [(product, statistics[product]) for product in products]
+
+    def rankProducts(self, products=None, workers=1, processes=1):
+        """ Scores given products, or all products we are tracking, and
+        returns them ranked from the best to the worst.
+
+        Every product is analyzed once and, if workers or processes is more
+        than one, products are analyzed by that many threads or processes at
+        the same time, see getProductsStatistics.
+
+        Scores are normalized the same way cmpTwoProducts does it: every
+        score is scaled down as if the product had as many bugs as the
+        product with the fewest bugs. Returns a list with a row for every
+        product, holding its rank, number of bugs and score, both as they
+        are and by severity, score per bug and normalized score.
+        """
+        with self.metrics.phase('rank_products'):
+            statistics = self.getProductsStatistics(products, workers,
+                                                    processes)
+
+        counts = [stats['num_of_bugs'] for product, stats in statistics
+                  if stats['num_of_bugs']]
+        fewest = min(counts) if counts else 0
+
+        table = []
+        for product, stats in statistics:
+            num_of_bugs = stats['num_of_bugs']
+            row = {'product': product,
+                   'num_of_bugs': num_of_bugs,
+                   'score': stats['score'],
+                   'bugs_by_type': stats['bugs_by_type'],
+                   'score_by_type': {},
+                   'score_per_bug': 0.0,
+                   'normalized_score': 0.0}
+
+            for severity, num in stats['bugs_by_type'].items():
+                row['score_by_type'][severity] = \
+                    num*self.an._weights[severity]
+
+            if num_of_bugs:
+                row['score_per_bug'] = stats['score']/float(num_of_bugs)
+                row['normalized_score'] = row['score_per_bug']*fewest
+
+            table.append(row)
+
+        table.sort(key=lambda row: (row['normalized_score'], row['product']))
+        for rank, row in enumerate(table):
+            row['rank'] = rank + 1
+
+        return table
 
     def cmpTwoProducts(self, prod1, prod2):
-        q = self.db.queryProductBugs(str(prod1))
-        score1 = self.an.calculateProductScore(q)
-        num_of_bugs1 = self.an.getNumberOfBugs(q)
-        q = self.db.queryProductBugs(str(prod2))
-        score2 = self.an.calculateProductScore(q)
-        num_of_bugs2 = self.an.getNumberOfBugs(q)
+        stats = self.getProductStatistics(prod1)
+        score1 = stats['score']
+        num_of_bugs1 = stats['num_of_bugs']
+        stats = self.getProductStatistics(prod2)
+        score2 = stats['score']
+        num_of_bugs2 = stats['num_of_bugs']
 
         compared = {}
         # now we have to normalize the score,
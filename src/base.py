@@ -4,12 +4,50 @@
 import os
 import glob
 import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
 import errno
 import datetime
+import json
+import shutil
+import sqlite3
 
 from pymongo import MongoClient
 from pyzilla import BugZilla
 
+from .harvester import Harvester
+from .metrics import nullMetrics
+from .snapshot import Snapshot
+
+
+def parseTime(value):
+    """ Converts time from Bugzilla's format (20020822T16:38:00) to datetime.
+
+    Times Bugzilla sends are always of the same width, so instead of
+    strptime, which has to parse its format string on every call, we simply
+    slice the string. XML-RPC DateTime keeps that string in its value.
+    """
+    if isinstance(value, datetime.datetime):
+        return value
+
+    value = getattr(value, 'value', value)
+    if len(value) != 17 or value[8] != 'T':
+        return datetime.datetime.strptime(value, '%Y%m%dT%H:%M:%S')
+
+    return datetime.datetime(int(value[0:4]), int(value[4:6]),
+                             int(value[6:8]), int(value[9:11]),
+                             int(value[12:14]), int(value[15:17]))
+
+
+def timeString(value):
+    """ Returns time in Bugzilla's format (20020822T16:38:00), whether it
+    is given as XML-RPC DateTime, datetime or a string that is already in
+    that format.
+    """
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y%m%dT%H:%M:%S')
+
+    return str(value)
+
 
 class Database(object):
     """ This is a base class that represents database interface.
@@ -18,10 +56,251 @@ class Database(object):
 
     The Context (BugzillaDB class) uses this to call concrete strategy.
     """
+    #private:
+    _pageSize = 0
+    _transport = None
+    metrics = nullMetrics
+    index = None
+    changelog = None
+    _statsVersion = 2
+    _timeFields = ['creation_time', 'last_change_time', 'cf_last_closed']
+    _connections = ['bzilla']
+
+    def _newStatistics(self):
+        return {'version': self._statsVersion, 'bugs_by_type': {},
+                'num_of_bugs': 0, 'creation_time': '',
+                'last_change_time': ''}
+
+    def _addToStatistics(self, stats, bugs):
+        """ Adds given bugs to product's statistics: number of bugs of
+        each severity, total number of bugs and the newest creation and
+        change times.
+        """
+        bugs_by_type = stats['bugs_by_type']
+
+        for bug in bugs:
+            severity = bug.get('severity')
+            if severity is not None:
+                bugs_by_type[severity] = bugs_by_type.get(severity, 0) + 1
+
+            creation_time = timeString(bug.get('creation_time', ''))
+            if creation_time > stats['creation_time']:
+                stats['creation_time'] = creation_time
+
+            last_change_time = timeString(bug.get('last_change_time') or '')
+            if last_change_time > stats.get('last_change_time', ''):
+                stats['last_change_time'] = last_change_time
+
+            stats['num_of_bugs'] += 1
+
+    def _removeFromStatistics(self, stats, bugs):
+        """ Takes given bugs out of product's statistics. Creation and
+        change times of the newest bugs are left as they are.
+        """
+        bugs_by_type = stats['bugs_by_type']
+
+        for bug in bugs:
+            severity = bug.get('severity')
+            if bugs_by_type.get(severity):
+                bugs_by_type[severity] -= 1
+
+            stats['num_of_bugs'] -= 1
+
+    def _validStatistics(self, stats, num_of_bugs):
+        """ Statistics are valid if they were made by this version of the
+        code and they account for every bug that we have.
+        """
+        return (stats is not None and
+                stats.get('version') == self._statsVersion and
+                stats['num_of_bugs'] == num_of_bugs)
+
+    def _matches(self, bug, query):
+        """ Tells whether a bug matches a query, see queryProductBugs """
+        for field, condition in query.items():
+            value = bug.get(field)
+
+            if isinstance(condition, tuple):
+                start, end = condition
+                if value is None:
+                    return False
+                if start is not None and value < start:
+                    return False
+                if end is not None and value >= end:
+                    return False
+            elif isinstance(condition, list):
+                if value not in condition:
+                    return False
+            elif value != condition:
+                return False
+
+        return True
+
+    def _searchBugs(self, query):
+        """ Searches Bugzilla with a single call """
+        with self.metrics.phase('bugzilla_search'):
+            bugs = self.bzilla.Bug.search(query)
+        self.metrics.count('bugs_fetched', len(bugs['bugs']))
+
+        return bugs
+
+    def searchProductBugs(self, product, params=None, offset=0):
+        """ Searches Bugzilla for bugs of a given product.
+
+        This is a generator. If page size is set, Bugzilla is queried in
+        chunks of that size using limit/offset and every chunk is yielded
+        as soon as it arrives, together with the offset of the next chunk.
+        Otherwise all bugs are fetched with a single call.
+        """
+        query = {'product': str(product)}
+        if params:
+            query.update(params)
+
+        if not self._pageSize:
+            bugs = self._searchBugs(query)
+            yield bugs, offset + len(bugs['bugs'])
+            return
+
+        while True:
+            query['limit'] = self._pageSize
+            query['offset'] = offset
+            bugs = self._searchBugs(query)
+
+            # Bugzilla may return less than we asked for if page size exceeds
+            # its maximum number of search results, so only an empty page
+            # tells us we are done.
+            if not bugs['bugs']:
+                break
+
+            offset += len(bugs['bugs'])
+            yield bugs, offset
+
+    def convertDateTimes(self, bugs):
+        """ Converts times of given bugs to datetime objects, bug by bug,
+        as they are requested. Only the known top-level time fields are
+        looked at.
+        """
+        for bug in bugs:
+            for field in self._timeFields:
+                if field in bug:
+                    bug[field] = parseTime(bug[field])
+            yield bug
+
+    def setMetrics(self, metrics):
+        """ Makes database, and its transport, record what they are doing,
+        see metrics.MetricsRegistry.
+        """
+        self.metrics = metrics
+        if self._transport is not None:
+            self._transport.setMetrics(metrics)
+
+    def setIndex(self, index):
+        """ Makes database add bugs it writes to a search index, see
+        search.SearchIndex.
+        """
+        self.index = index
+
+    def _indexBugs(self, product, bugs):
+        if self.index is not None:
+            with self.metrics.phase('index'):
+                self.index.add(product, bugs)
+
+    def _pruneIndex(self, product, ids=None):
+        """ Takes bugs product doesn't have any more out of the search
+        index, once a download has replaced product's bugs. Downloaded bugs
+        are indexed as they arrive, over their old copies, so until then
+        the index holds every bug the product has, even if the download
+        fails. Ids of product's bugs are read from the database, unless they
+        are given.
+        """
+        if self.index is None:
+            return
+
+        if ids is None:
+            ids = (bug['id'] for bug in
+                   self.queryProductBugs(product, fields=['id']))
+        self.index.retainBugs(product, ids)
+
+    def setChangeLog(self, changelog):
+        """ Makes database log what changed in bugs it writes, see
+        changelog.ChangeLog.
+        """
+        self.changelog = changelog
+
+    def _loggedRecords(self, product):
+        """ Returns an iterator over the fields the change log tracks of
+        every bug product has now, or nothing if there is no change log or
+        no such product. Downloads compare them with the bugs they are about
+        to replace them with, see changelog.ChangeLog.record.
+        """
+        if self.changelog is None or \
+                str(product) not in self.getListOfProducts():
+            return []
+
+        return self.queryProductBugs(product,
+                                     fields=self.changelog.recordFields)
+
+    def _logChanges(self, product, old, bugs, replace=False, ordered=False):
+        if self.changelog is not None:
+            with self.metrics.phase('changelog'):
+                self.changelog.record(product, old, bugs, replace, ordered)
+
+    def _bugzilla(self):
+        """ Returns a new Bugzilla client, made by our transport if we have
+        one, see transport.Transport.
+        """
+        if self._transport is None:
+            return BugZilla(self._url, verbose=False)
+
+        return self._transport.connect(self._url)
+
+    def clone(self):
+        """ Returns a copy of this database with its own Bugzilla client.
+        XML-RPC connections can't be shared between threads, so every thread
+        that talks to Bugzilla should work on its own copy.
+        """
+        # copy.copy would go through __getstate__, which leaves out what
+        # copies in the same process share, like metrics and transport
+        other = self.__class__.__new__(self.__class__)
+        other.__dict__.update(self.__dict__)
+        other.bzilla = other._bugzilla()
+        return other
+
+    def __getstate__(self):
+        """ Databases are sent to other processes without their connections,
+        metrics, search index, change log and transport, which can't be
+        shared between processes. Connections are opened again on the other
+        side, see __setstate__.
+        """
+        state = self.__dict__.copy()
+        for name in self._connections + ['metrics', 'index', 'changelog',
+                                         '_transport']:
+            state.pop(name, None)
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.bzilla = self._bugzilla()
+
+    def productSize(self, product):
+        """ Returns how many bytes product's bugs take, so the biggest
+        products can be analyzed first, or 0 if database can't tell.
+        """
+        return 0
+
+    def loadMetadata(self, kind, product):
+        raise Exception("You must implement this method in a derived class!")
+
+    def saveMetadata(self, kind, product, data):
+        raise Exception("You must implement this method in a derived class!")
+
+    def removeMetadata(self, kind, product):
+        raise Exception("You must implement this method in a derived class!")
+
     def getListOfProducts(self, dbtype=''):
         raise Exception("You must implement this method in a derived class!")
 
-    def downloadProductBugs(self, product):
+    def downloadProductBugs(self, product, strict=False):
         raise Exception("You must implement this method in a derived class!")
 
     def downloadAllProductsBugs(self):
@@ -33,12 +312,15 @@ class Database(object):
     def updateAllProductsBugs(self):
         raise Exception("You must implement this method in a derived class!")
 
-    def queryProductBugs(self, product):
+    def queryProductBugs(self, product, lazy=False, fields=None, query=None):
         raise Exception("You must implement this method in a derived class!")
 
     def listTrackedProducts(self):
         raise Exception("You must implement this method in a derived class!")
 
+    def getProductStatistics(self, product):
+        raise Exception("You must implement this method in a derived class!")
+
 
 class MongoDatabase(Database):
     """ This is concrete implementation of database using the strategy
@@ -47,46 +329,96 @@ class MongoDatabase(Database):
     This class represents MongoDB database and uses it to store data about
     bugs found in a specific product. Each product is a separate collection,
     while each document in that collection represents a bug.
-    """
 
-    def __init__(self, url, dbname='default'):
+    Collections whose names start with a double underscore are not products,
+    they hold metadata (download checkpoints and such), one document per
+    product, or products that are still being downloaded.
+    """
+    #private:
+    _metaPrefix = "__"
+    _stagingTemplate = "__staging.%s"
+    _indexedFields = ['severity', 'id', 'creation_time', 'last_change_time']
+    _batchSize = 1000
+    _connections = ['bzilla', 'client', 'db']
+
+    def __init__(self, url, dbname='default', pagesize=0, batchsize=1000,
+                 transport=None):
         if len(url) == 0:
             raise ValueError("You must provide database URL!")
 
         self.client = MongoClient()
         self.db = self.client[dbname]
-        self.bzilla = BugZilla(url, verbose=False)
+        self._dbname = dbname
+        self._url = url
+        self._transport = transport
+        self.bzilla = self._bugzilla()
+        self._pageSize = pagesize
+        self._batchSize = batchsize
+
+    def __setstate__(self, state):
+        Database.__setstate__(self, state)
+        self.client = MongoClient()
+        self.db = self.client[self._dbname]
+
+    def _ensureIndexes(self, collection):
+        for field in self._indexedFields:
+            collection.create_index(field)
+
+    def _sortedRecords(self, collection):
+        """ Returns a cursor over the fields the change log tracks of bugs
+        in a collection, sorted by id, or nothing if there is no change log.
+        """
+        if self.changelog is None:
+            return []
+
+        projection = dict.fromkeys(self.changelog.recordFields, 1)
+        projection['_id'] = 0
+        return collection.find({}, projection).sort('id', 1).batch_size(
+            self._batchSize)
+
+    def _writeInBatches(self, collection, bugs, upsert=False):
+        """ Writes bugs to a collection in batches of unordered bulk
+        operations. Bugs are inserted or, if upsert is set, written over
+        bugs with the same id.
+        """
+        for i in range(0, len(bugs), self._batchSize):
+            bulk = collection.initialize_unordered_bulk_op()
+
+            for bug in bugs[i:i + self._batchSize]:
+                if upsert:
+                    bulk.find({'id': bug['id']}).upsert().replace_one(bug)
+                else:
+                    bulk.insert(bug)
+
+            with self.metrics.phase('mongo_write'):
+                bulk.execute()
+
+        self.metrics.count('bugs_written', len(bugs))
+
+    def loadMetadata(self, kind, product):
+        data = self.db[self._metaPrefix + kind].find_one({'_id': str(product)})
+        if data is not None:
+            del data['_id']
+        return data
+
+    def saveMetadata(self, kind, product, data):
+        self.db[self._metaPrefix + kind].update({'_id': str(product)},
+                                                dict(data, _id=str(product)),
+                                                upsert=True)
+
+    def removeMetadata(self, kind, product):
+        self.db[self._metaPrefix + kind].remove({'_id': str(product)})
 
     def createDateTimeObjects(self, bugs_dict):
         """ Since Bugzilla doesn't return times in Python datetime format, we
-        have to search through dictionaries for those times and transform them
-        to datetime objects so MongoDB can save them in a BSON format.
-        """
-
-        def _create_datetime(corr_dicts):
-            for k, v in corr_dicts.items():
-                if isinstance(v, dict):
-                    _create_datetime(v)
-                elif k == 'creation_time':
-                    dt = str(v)
-                    corr_dt = datetime.datetime.strptime(dt,
-                                                         '%Y%m%dT%H:%M:%S')
-                    corr_dicts['creation_time'] = corr_dt
-                elif k == 'last_change_time':
-                    dt = str(v)
-                    corr_dt = datetime.datetime.strptime(dt,
-                                                         '%Y%m%dT%H:%M:%S')
-                    corr_dicts['last_change_time'] = corr_dt
-                elif k == 'cf_last_closed':
-                    dt = str(v)
-                    corr_dt = datetime.datetime.strptime(dt,
-                                                         '%Y%m%dT%H:%M:%S')
-                    corr_dicts['cf_last_closed'] = corr_dt
-
+        have to transform them to datetime objects so MongoDB can save them
+        in a BSON format.
+        """
         bugs_list = bugs_dict.values()[0]
 
-        for bug in bugs_list:
-            _create_datetime(bug)
+        with self.metrics.phase('convert_times'):
+            for bug in self.convertDateTimes(bugs_list):
+                pass
 
         return bugs_list
 
@@ -102,22 +434,86 @@ class MongoDatabase(Database):
                 productsList.append(product['name'])
 
         else:
-            productsList = self.db.collection_names(include_system_collections=
-                                                    False)
+            collections = self.db.collection_names(include_system_collections=
+                                                   False)
+            for name in collections:
+                if not name.startswith(self._metaPrefix):
+                    productsList.append(name)
 
         return productsList
 
-    def downloadProductBugs(self, product):
-        collection = self.db[str(product)]
-        if str(product) in self.db.collection_names():
-            collection.drop()
+    def downloadProductBugs(self, product, strict=False):
+        """ Downloads all bugs of a product and stores them in a collection.
+
+        Bugs are written to a staging collection, which replaces product's
+        collection in one step once the download is finished, so product's
+        old bugs are available until then.
+
+        If page size is set, bugs are downloaded and inserted page by page
+        and after every page a checkpoint is recorded. If download gets
+        interrupted, next call resumes from the last inserted page instead
+        of starting over.
+
+        Errors are printed, unless strict is set, in which case they are
+        passed to the caller.
+        """
+        staging = self.db[self._stagingTemplate % str(product)]
+        checkpoint = None
+        if self._pageSize:
+            checkpoint = self.loadMetadata('checkpoint', product)
 
         print "Downloading product: %s" % str(product)
+        if checkpoint is None:
+            checkpoint = {'offset': 0, 'stats': self._newStatistics(),
+                          'last_change_time': ''}
+            staging.drop()
+            self.removeMetadata('checkpoint', product)
+        else:
+            print "Resuming download from bug #%d." % checkpoint['offset']
+            # the page we were writing when we got interrupted may be in
+            # staging, or some of it, so the first page is written over
+            # bugs with the same id instead of being inserted
+            staging.create_index('id')
+
+        resumed = checkpoint['offset'] > 0
         try:
-            bugs = self.bzilla.Bug.search({'product': str(product)})
-            collection.insert(self.createDateTimeObjects(bugs))
+            for bugs, offset in self.searchProductBugs(product,
+                                                       offset=checkpoint[
+                                                           'offset']):
+                if bugs['bugs']:
+                    bugs = self.createDateTimeObjects(bugs)
+                    self._writeInBatches(staging, bugs, upsert=resumed)
+                    resumed = False
+                    self._indexBugs(product, bugs)
+                    self._addToStatistics(checkpoint['stats'], bugs)
+                    checkpoint['last_change_time'] = max(
+                        [checkpoint['last_change_time']] +
+                        [timeString(bug['last_change_time']) for bug in bugs])
+                if self._pageSize:
+                    checkpoint['offset'] = offset
+                    self.saveMetadata('checkpoint', product, checkpoint)
+
+            if checkpoint['stats']['num_of_bugs'] == 0:
+                self.removeMetadata('checkpoint', product)
+                raise ValueError("No bugs found for %s." % str(product))
+
+            self._ensureIndexes(staging)
+            self._logChanges(product,
+                             self._sortedRecords(self.db[str(product)]),
+                             self._sortedRecords(staging), replace=True,
+                             ordered=True)
+            staging.rename(str(product), dropTarget=True)
+            self._pruneIndex(product)
+
+            self.removeMetadata('checkpoint', product)
+            self.saveMetadata('stats', product, checkpoint['stats'])
+            self.saveMetadata('sync', product,
+                              {'last_change_time':
+                               checkpoint['last_change_time']})
             print "Product saved to a database.\n"
         except Exception as e:
+            if strict:
+                raise
             print e
             print "Could not fetch %s bugs.\n" % product
 
@@ -128,34 +524,100 @@ class MongoDatabase(Database):
         for product in listOfProducts:
             self.downloadProductBugs(product)
 
+    def _lastChangeTime(self, product, collection):
+        """ Returns the high-water mark of a product: the time of the latest
+        change we have seen. Products downloaded before we started to keep
+        it get it from their newest bug.
+        """
+        sync = self.loadMetadata('sync', product)
+        if sync is not None and sync['last_change_time']:
+            return sync['last_change_time']
+
+        newest = list(collection.find({}, {'last_change_time': 1}).sort(
+            'last_change_time', -1).limit(1))
+        if newest:
+            return timeString(newest[0]['last_change_time'])
+
+        return None
+
     def updateProductBugs(self, product):
+        """ Synchronizes product with Bugzilla. Every bug that was created or
+        changed since the last synchronization is fetched and written over
+        its old copy, matched by id, or inserted if it is a new one.
+
+        Returns the number of bugs that were written.
+        """
         collection = self.db[str(product)]
-        if str(product) in self.db.collection_names():
-            last_entry = collection.aggregate([{'$sort': {'creation_time': -1}},
-                                               {'$limit': 1}])
-            last_creation_time = last_entry['result'][0]['creation_time']
-            bugs = self.createDateTimeObjects(self.bzilla.Bug.search(
-                {'product': str(product),
-                 'creation_time': last_creation_time}))
-
-            # Bugzilla's search method returns bugs that were created at this
-            # time or later, it seems that 'this time' bug is always first in
-            # the list.
-            bugs.pop(0)
-
-            # if it happens that that's not the case, we will have to
-            # use following piece of code:
-            # for bug in bugs[:]:
-            #     if bug['creation_time'] == last_creation_time:
-            #         bugs.remove(bug)
-            if bugs:
-                collection.insert(bugs)
-                print "%s has been updated with new bug entries." % str(product)
-            else:
-                print "Nothing to update, " \
-                      "%s is already up-to-date." % str(product)
-        else:
+        if str(product) not in self.db.collection_names():
             print "Product doesn't exist in a database."
+            return 0
+
+        self._ensureIndexes(collection)
+        last_change_time = self._lastChangeTime(product, collection)
+        if last_change_time is None:
+            print "Nothing to update, %s is empty." % str(product)
+            return 0
+
+        stats = self.loadMetadata('stats', product)
+        if not self._validStatistics(stats, collection.count()):
+            stats = None
+
+        new = changed = 0
+        newest = last_change_time
+
+        fields = ['id', 'severity', 'last_change_time']
+        if self.changelog is not None:
+            fields = self.changelog.recordFields
+
+        params = {'last_change_time': last_change_time.replace(":", "")}
+        for bugs, offset in self.searchProductBugs(product, params):
+            bugs = self.createDateTimeObjects(bugs)
+
+            old = {}
+            for bug in collection.find(
+                    {'id': {'$in': [bug['id'] for bug in bugs]}},
+                    dict.fromkeys(fields, 1)):
+                old[bug['id']] = bug
+
+            # Bugzilla returns bugs changed at this time or later, so the
+            # ones changed exactly at the high-water mark come back every
+            # time. Those we already have are skipped.
+            bugs = [bug for bug in bugs if bug['id'] not in old or
+                    old[bug['id']].get('last_change_time') !=
+                    bug['last_change_time']]
+            old = [old[bug['id']] for bug in bugs if bug['id'] in old]
+            if not bugs:
+                continue
+
+            self._writeInBatches(collection, bugs, upsert=True)
+            self._indexBugs(product, bugs)
+            self._logChanges(product, old, bugs)
+            for bug in bugs:
+                newest = max(newest, timeString(bug['last_change_time']))
+
+            if stats is not None:
+                self._removeFromStatistics(stats, old)
+                self._addToStatistics(stats, bugs)
+
+            changed += len(old)
+            new += len(bugs) - len(old)
+
+        # statistics we can't trust are dropped, they will be made from
+        # scratch the next time someone asks for them
+        if stats is None:
+            self.removeMetadata('stats', product)
+        else:
+            self.saveMetadata('stats', product, stats)
+        self.saveMetadata('sync', product, {'last_change_time': newest})
+
+        if new or changed:
+            print "%s has been updated with %d new and %d changed " \
+                  "bug entries." % (str(product), new, changed)
+        else:
+            print "Nothing to update, " \
+                  "%s is already up-to-date." % str(product)
+
+        return new + changed
 
     def updateAllProductsBugs(self):
         listOfProducts = self.getListOfProducts()
@@ -164,15 +626,76 @@ class MongoDatabase(Database):
             print product
             self.updateProductBugs(product)
 
-    def queryProductBugs(self, product):
+    def _mongoQuery(self, query):
+        """ Translates our query, see queryProductBugs, to MongoDB's """
+        spec = {}
+        for field, condition in query.items():
+            if isinstance(condition, tuple):
+                start, end = condition
+                spec[field] = {}
+                if start is not None:
+                    spec[field]['$gte'] = start
+                if end is not None:
+                    spec[field]['$lt'] = end
+                if not spec[field]:
+                    # like other databases, bugs whose value is null don't
+                    # match, $exists would let them through
+                    spec[field] = {'$ne': None}
+            elif isinstance(condition, list):
+                spec[field] = {'$in': condition}
+            else:
+                spec[field] = condition
+
+        return spec
+
+    def queryProductBugs(self, product, lazy=False, fields=None, query=None):
+        """ Returns product's collection or, if lazy is set, a cursor
+        over its bugs. Cursors fetch bugs from the server in batches.
+
+        If a list of fields is given, returns an iterator over bugs where
+        every bug is a dictionary that holds only those fields, and only
+        those fields are sent by the server. Query narrows bugs down, see
+        BugzillaDB.queryProductBugs.
+        """
         collection = self.db[str(product)]
         if str(product) not in self.db.collection_names():
             print "Local copy of requested product does not exist.\n" \
                   "Fetching it from Bugzilla..."
             self.downloadProductBugs(product)
 
+        if fields is not None or query is not None:
+            projection = dict.fromkeys(fields or [], 1)
+            projection['_id'] = 0
+            cursor = collection.find(self._mongoQuery(query or {}),
+                                     projection)
+            return cursor.batch_size(self._batchSize)
+
+        if lazy:
+            return collection.find().batch_size(self._batchSize)
+
         return collection
 
+    def getProductStatistics(self, product):
+        """ Returns statistics of a product: number of bugs of each
+        severity, total number of bugs, creation time of the newest bug and
+        time of the latest change.
+
+        Statistics are kept up to date whenever bugs are written, so this is
+        just a lookup. If they are missing or stale, they are made from
+        scratch and saved.
+        """
+        collection = self.queryProductBugs(product)
+        stats = self.loadMetadata('stats', product)
+
+        if not self._validStatistics(stats, collection.count()):
+            stats = self._newStatistics()
+            self._addToStatistics(stats, collection.find(
+                {}, {'severity': 1, 'creation_time': 1,
+                     'last_change_time': 1}))
+            self.saveMetadata('stats', product, stats)
+
+        return stats
+
     def listTrackedProducts(self):
         trackedProducts = self.getListOfProducts()
 
@@ -193,20 +716,56 @@ class XMLDatabase(Database):
     This class represents XML database which is actually a directory that
     holds XML files where every XML file represents bugs found in that specific
     product.
+
+    Besides XML files, directory holds metadata files named after the
+    product, e.g. gnote.checkpoint, that store small JSON documents.
+
+    Updates never rewrite a product's XML file. New bugs are appended as
+    segments, small XML files in a <product>.segments directory, and the
+    product's manifest (gnote.manifest), which is replaced atomically, tells
+    which segments belong to the product, how many bugs it has and when the
+    newest one was created. Segments are merged back into the XML file once
+    there are too many of them.
+
+    Bugs are written as they are, one element per field. Nested dictionaries
+    become nested elements, and empty ones are marked with type="dict".
+    Lists are marked with type="list" and hold an <item> element for every
+    value. Integers, floats and booleans are marked with type="int",
+    type="float" and type="bool", so bugs read back are the same as those
+    that were written.
+
+    If snapshots are enabled, every product also gets a binary snapshot
+    (gnote.snapshot) that holds its ids, severities, statuses, times and
+    such in columns, see Snapshot. Queries that ask only for those fields
+    read the snapshot instead of parsing XML. Snapshots are written along
+    with XML files and segments, and those that are missing or stale are
+    built from XML when they are first needed.
     """
     #private:
     _dbdir = ""
     _fileTemplate = "%s.xml"
+    _metaTemplate = "%s.%s"
+    _pagesTemplate = "%s.pages/"
+    # fields that files written before booleans were marked hold as
+    # True or False
+    _boolFields = ['is_open']
+    _segmentsTemplate = "%s.segments/"
+    _maxSegments = 32
     _productName = ""
-    _numOfBugs = 0
+    _snapshots = False
 
     #constructor
-    def __init__(self, url, dbname=''):
+    def __init__(self, url, dbname='', pagesize=0, transport=None,
+                 snapshots=False):
 
         if len(url) == 0:
             raise ValueError("You must provide database URL!")
 
-        self.bzilla = BugZilla(url, verbose=False)
+        self._url = url
+        self._transport = transport
+        self.bzilla = self._bugzilla()
+        self._pageSize = pagesize
+        self._snapshots = snapshots
         self.createDatabasePath(dbname)
         self.createNewDBDir()
 
@@ -220,6 +779,141 @@ class XMLDatabase(Database):
 
         return filename
 
+    def _metadataFile(self, kind, product):
+        return self._dbdir + self._metaTemplate % (str(product), kind)
+
+    def _segmentsDir(self):
+        return self._dbdir + self._segmentsTemplate % self._productName
+
+    def _commitXMLFile(self, tmpname):
+        """ Replaces product's XML file with a freshly written temporary
+        file, dropping product's manifest and segments which are now
+        contained in the new file.
+
+        Manifest goes first, so if we get interrupted, we are left with
+        the old XML file alone, which is older, but consistent.
+        """
+        self.removeMetadata('stats', self._productName)
+        self.removeMetadata('snapshot', self._productName)
+        self.removeMetadata('manifest', self._productName)
+        os.rename(tmpname, self._createNewXMLFile())
+        shutil.rmtree(self._segmentsDir(), ignore_errors=True)
+
+    def _loadSnapshot(self, manifest, fields=Snapshot.fields):
+        """ Returns product's snapshot if it holds the bugs the manifest
+        tells about and none of the given fields is damaged, otherwise None.
+        """
+        snapshot = Snapshot.load(self._metadataFile('snapshot',
+                                                    self._productName))
+        if snapshot is None or manifest is None:
+            return None
+        if snapshot.info.get('num_of_bugs') != manifest['num_of_bugs'] or \
+                snapshot.info.get('creation_time') != \
+                manifest['creation_time']:
+            return None
+
+        try:
+            for field in fields:
+                snapshot.column(field)
+        except ValueError:
+            return None
+
+        return snapshot
+
+    def _saveSnapshot(self, snapshot, manifest):
+        snapshot.info = {'num_of_bugs': manifest['num_of_bugs'],
+                         'creation_time': manifest['creation_time']}
+        with self.metrics.phase('snapshot_write'):
+            snapshot.save(self._metadataFile('snapshot', self._productName))
+
+    def _iterFile(self, path):
+        """ Parses XML file incrementally and yields its <bug> elements one
+        by one. Every element is cleared as soon as the next one is requested,
+        so memory use doesn't depend on the size of the file.
+        """
+        with open(path, 'rb') as f:
+            depth = 0
+            root = None
+
+            for event, elem in ET.iterparse(f, events=('start', 'end')):
+                if event == 'start':
+                    if root is None:
+                        root = elem
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 1 and elem.tag == 'bug':
+                        yield elem
+                        root.clear()
+
+    def _downloadInPages(self):
+        """ Downloads bugs page by page. Every page is written to its own
+        file in a <product>.pages directory as a sequence of <bug> elements
+        and a checkpoint is saved. Once all pages are here, they are
+        concatenated into the product's XML file.
+        """
+        pagesdir = self._dbdir + self._pagesTemplate % self._productName
+        checkpoint = self.loadMetadata('checkpoint', self._productName)
+
+        if checkpoint is None:
+            checkpoint = {'offset': 0, 'pages': 0,
+                          'stats': self._newStatistics()}
+            shutil.rmtree(pagesdir, ignore_errors=True)
+            os.makedirs(pagesdir)
+        else:
+            print "Resuming download from bug #%d." % checkpoint['offset']
+
+        # pages downloaded before we were interrupted are not in memory any
+        # more, so their snapshot is built from XML when it is needed
+        snapshot = None
+        if self._snapshots and checkpoint['offset'] == 0:
+            snapshot = Snapshot()
+
+        for bugs, offset in self.searchProductBugs(
+                self._productName, offset=checkpoint['offset']):
+            with self.metrics.phase('serialize'):
+                with open(pagesdir + "%06d.xml" % checkpoint['pages'],
+                          'wb') as f:
+                    self.serialize(f, bugs['bugs'])
+            if snapshot is not None:
+                snapshot.append(self.convertDateTimes(bugs['bugs']))
+            self._indexBugs(self._productName, bugs['bugs'])
+
+            checkpoint['offset'] = offset
+            checkpoint['pages'] += 1
+            self._addToStatistics(checkpoint['stats'], bugs['bugs'])
+            self.saveMetadata('checkpoint', self._productName, checkpoint)
+
+        stats = checkpoint['stats']
+        if stats['num_of_bugs'] == 0:
+            shutil.rmtree(pagesdir, ignore_errors=True)
+            self.removeMetadata('checkpoint', self._productName)
+            raise ValueError("No bugs found for %s." % self._productName)
+
+        filename = self._createNewXMLFile() + ".tmp"
+        with open(filename, 'wb') as f:
+            f.write('<bugs creation_time="%s" num_of_bugs="%d">' %
+                    (stats['creation_time'], stats['num_of_bugs']))
+            for i in range(checkpoint['pages']):
+                with open(pagesdir + "%06d.xml" % i, 'rb') as page:
+                    shutil.copyfileobj(page, f)
+            f.write('</bugs>')
+        if self.changelog is not None:
+            self._logChanges(self._productName,
+                             self._loggedRecords(self._productName),
+                             (self._record(bug, self.changelog.recordFields)
+                              for bug in self._iterFile(filename)),
+                             replace=True)
+        self._commitXMLFile(filename)
+        self.saveMetadata('stats', self._productName, stats)
+        if snapshot is not None:
+            self._saveSnapshot(snapshot, stats)
+        self._pruneIndex(self._productName)
+
+        shutil.rmtree(pagesdir, ignore_errors=True)
+        self.removeMetadata('checkpoint', self._productName)
+        print "Serialized:", self._productName
+
     #public:
     def createDatabasePath(self, dbname):
         """ Creates a path to a database directory based on provided dbname """
@@ -240,69 +934,218 @@ class XMLDatabase(Database):
                 #TODO specify this exeption
                 raise
 
-    def serialize(self, bugsDict):
-        """ Serializes retrieved bugs in a form of XML tree.
-
-        We receive a list of dictionaries. Each dictionary in a list
-        represents one bug. Bug itself contains other dictionaries
-        that hold some information. That is why we use recursive
-        function: every nested dictionary is new subelement in XML tree.
-
-        Based on that, we build entire XML tree and return it, ready
-        to be written to a hard disk in a form of XML file.
-        """
-        def _serialize(tag, root):
-            for k, v in tag.items():
-                if isinstance(v, dict):
-                    node = ET.SubElement(root, k)
-                    _serialize(v, node)
-                elif isinstance(v, list):
-                    # value = ';'.join(v)
-                    # node = ET.SubElement(root, k)
-                    # node.text = value
-
-                    # or even better, pass because we don't
-                    # know what that list contains
-                    pass
-                elif isinstance(v, basestring):
-                    node = ET.SubElement(root, k)
-                    node.text = v
-                else:
-                    node = ET.SubElement(root, k)
-                    node.text = str(v)
+    def _writeValue(self, parts, tag, value):
+        """ Appends a field of a bug, as XML, to a list of strings """
+        if isinstance(value, basestring):
+            parts.append('<%s>%s</%s>' % (tag, escape(value), tag))
+        elif isinstance(value, dict) and not value:
+            parts.append('<%s type="dict" />' % tag)
+        elif isinstance(value, dict):
+            parts.append('<%s>' % tag)
+            for k, v in value.iteritems():
+                self._writeValue(parts, k, v)
+            parts.append('</%s>' % tag)
+        elif isinstance(value, list):
+            parts.append('<%s type="list">' % tag)
+            for item in value:
+                self._writeValue(parts, 'item', item)
+            parts.append('</%s>' % tag)
+        elif isinstance(value, datetime.datetime):
+            parts.append('<%s>%s</%s>' % (tag, timeString(value), tag))
+        elif isinstance(value, bool):
+            parts.append('<%s type="bool">%s</%s>' % (tag, value, tag))
+        elif isinstance(value, (int, long)):
+            parts.append('<%s type="int">%d</%s>' % (tag, value, tag))
+        elif isinstance(value, float):
+            parts.append('<%s type="float">%r</%s>' % (tag, value, tag))
+        else:
+            parts.append('<%s>%s</%s>' % (tag, escape(str(value)), tag))
 
-        k, v = bugsDict.items()[0]
-        root = ET.Element(k)
-        self._numOfBugs = len(v)
+    def serialize(self, f, bugs):
+        """ Writes bugs to a file as a sequence of <bug> elements.
 
-        create_time = v[0]['creation_time']
+        Every bug is turned into a string and written as soon as it is
+        converted, so no XML tree is ever built and memory use doesn't depend
+        on the number of bugs. Text is written as UTF-8.
+        """
+        for bug in bugs:
+            parts = []
+            self._writeValue(parts, 'bug', bug)
+            data = ''.join(parts)
+            if isinstance(data, unicode):
+                data = data.encode('utf-8')
+            f.write(data)
+
+    def _writeXMLFile(self, filename, bugs, creation_time, num_of_bugs):
+        """ Writes bugs to a file with a root element that tells creation
+        time of the newest bug and the number of bugs.
+        """
+        with open(filename, 'wb') as f:
+            f.write('<bugs creation_time="%s" num_of_bugs="%d">' %
+                    (creation_time, num_of_bugs))
+            self.serialize(f, bugs)
+            f.write('</bugs>')
+
+    def writeToXMLFile(self, bugs, stats):
+        """ Writes bugs to product's XML file on the hard disk, given their
+        statistics.
+        """
+        filename = self._createNewXMLFile() + ".tmp"
+        self._writeXMLFile(filename, bugs, stats['creation_time'],
+                           stats['num_of_bugs'])
+        self._commitXMLFile(filename)
+        print "Serialized:", self._productName
+
+    def readManifest(self):
+        """ Returns product's manifest. If product has no segments, there
+        is no manifest file, so it is made up from the attributes of the
+        root element of the XML file, which is the only thing we parse.
+        Returns None if product doesn't exist.
+        """
+        manifest = self.loadMetadata('manifest', self._productName)
+        if manifest is not None:
+            return manifest
 
-        for bug in v:
-            node = ET.Element("bug")
+        PATH = self._createNewXMLFile()
+        if not os.path.isfile(PATH):
+            return None
 
-            if bug['creation_time'] > create_time:
-                create_time = bug['creation_time']
+        with open(PATH, 'rb') as f:
+            event, root = ET.iterparse(f, events=('start',)).next()
 
-            _serialize(bug, node)
-            root.append(node)
-            root.attrib["creation_time"] = str(create_time)
+        return {'creation_time': root.attrib.get("creation_time"),
+                'num_of_bugs': int(root.attrib.get("num_of_bugs")),
+                'segments': []}
 
-        root.attrib["num_of_bugs"] = str(self._numOfBugs)
+    def iterBugs(self):
+        """ Yields <bug> elements of a product one by one, first those from
+        XML file and then those from the segments. Elements are cleared
+        once the next one is requested, so callers must not hold on to them.
+        """
+        manifest = self.readManifest()
+        if manifest is None:
+            return iter([])
+
+        files = [self._createNewXMLFile()]
+        for segment in manifest['segments']:
+            files.append(self._segmentsDir() + segment)
+
+        return (bug for ffile in files for bug in self._iterFile(ffile))
+
+    def _fromXML(self, node):
+        """ Turns XML element back into a value of a bug's field """
+        kind = node.get('type')
+        if kind == 'list':
+            return [self._fromXML(child) for child in node]
+        elif kind == 'dict' or len(node):
+            return dict((child.tag, self._fromXML(child)) for child in node)
+
+        text = node.text or ''
+        if kind == 'int':
+            return int(text)
+        elif kind == 'float':
+            return float(text)
+        elif kind == 'bool' or (node.tag in self._boolFields and
+                                text in ('True', 'False')):
+            return text == 'True'
+        elif node.tag in self._timeFields:
+            return parseTime(text)
+        elif node.tag == 'id':
+            return int(text)
+
+        return text
+
+    def _record(self, bug, fields):
+        """ Turns <bug> element into a dictionary that holds given fields,
+        or all of them if fields is None.
+        """
+        if fields is None:
+            return dict((node.tag, self._fromXML(node)) for node in bug)
 
-        return root
+        record = {}
+        for field in fields:
+            node = bug.find(field)
+            if node is not None:
+                record[field] = self._fromXML(node)
 
-    def writeToXMLFile(self, ser):
-        """ Receives XML tree and writes it to XML file on the hard disk """
-        ET.ElementTree(ser).write(self._createNewXMLFile())
-        print "Serialized:", self._productName
+        return record
+
+    def readSnapshot(self, fields=None):
+        """ Returns product's snapshot, building it from XML file and
+        segments if it is missing, stale or any of the given fields is
+        damaged. Returns None if product doesn't exist.
+        """
+        manifest = self.readManifest()
+        if manifest is None:
+            return None
+
+        snapshot = self._loadSnapshot(manifest, fields or [])
+        if snapshot is None:
+            snapshot = Snapshot()
+            with self.metrics.phase('snapshot_build'):
+                snapshot.append(self._record(bug, Snapshot.fields)
+                                for bug in self.iterBugs())
+            self._saveSnapshot(snapshot, manifest)
+
+        return snapshot
+
+    def iterRecords(self, fields=None, query=None):
+        """ Returns an iterator over bugs of a product, where every bug is
+        a dictionary that holds only the given fields, or all of them if
+        there are no fields. Fields a bug doesn't have are left out. If query
+        is given, only bugs that match it are returned, see
+        BugzillaDB.queryProductBugs.
+
+        Bugs are parsed one at a time and only the fields that are asked for
+        are converted, so memory use doesn't depend on the size of a product.
+        If snapshots are enabled and all the fields are in the snapshot,
+        bugs are read from the snapshot instead.
+        """
+        # fields we query by are read as well, and dropped after matching
+        extra = [f for f in (query or []) if fields is not None and
+                 f not in fields]
+        needed = fields + extra if extra else fields
+
+        snapshot = None
+        if self._snapshots and needed is not None and \
+                all(field in Snapshot.fields for field in needed):
+            snapshot = self.readSnapshot(needed)
+
+        if snapshot is not None:
+            records = snapshot.records(needed)
+        else:
+            records = (self._record(bug, needed) for bug in self.iterBugs())
+
+        if not query:
+            return records
+
+        def _matching():
+            for record in records:
+                if not self._matches(record, query):
+                    continue
+                for field in extra:
+                    record.pop(field, None)
+                yield record
+
+        return _matching()
 
     def loadXMLFile(self):
-        """ Loads XML file and returns it in a form of tree (ElementTree) """
+        """ Loads XML file and returns it in a form of tree (ElementTree).
+        Bugs from segments are appended to the tree, so it always holds all
+        the bugs of a product.
+        """
         PATH = "%s%s.xml" % (self._dbdir, self._productName)
 
         if os.path.isfile(PATH):
             tree = ET.parse(PATH)
             root = tree.getroot()
+
+            manifest = self.readManifest()
+            for segment in manifest['segments']:
+                root.extend(ET.parse(self._segmentsDir() + segment).getroot())
+            root.set('creation_time', manifest['creation_time'])
+            root.set('num_of_bugs', str(manifest['num_of_bugs']))
+
             return root
         else:
             return None
@@ -313,31 +1156,161 @@ class XMLDatabase(Database):
         return create_time.replace(":", "")
 
     def update(self, bugsDict):
-        """ Based on the creation time of the newest bug in XML file
+        """ Based on the creation time of the newest bug in a product
         and creation time of the newest bug in remote Bugzilla
-        database it either updates XML file with a new bug, or
-        does nothing since there is nothing to update.
+        database it either appends new bugs to the product as a new
+        segment, or does nothing since there is nothing to update.
+
+        Existing bugs are neither parsed nor rewritten, only the small
+        manifest file is replaced. Returns the number of new bugs.
         """
-        root = self.loadXMLFile()
-        root_creation_time = root.attrib.get("creation_time")
+        manifest = self.readManifest()
+        v = bugsDict.values()[0]
 
-        newBugs = self.serialize(bugsDict)
-        new_creation_time = newBugs.attrib.get("creation_time")
+        # Bugzilla returns bugs created at the time of our newest bug
+        # or later, so we have to skip those we already have.
+        bugs = [bug for bug in v
+                if str(bug['creation_time']) > manifest['creation_time']]
 
-        no_of_new_bugs = (int(newBugs.attrib.get("num_of_bugs")) +
-                          int(root.attrib.get("num_of_bugs")) - 1)
+        if not bugs:
+            return 0
 
-        if root_creation_time == new_creation_time:
-            pass
+        stats = self.loadMetadata('stats', self._productName)
+        if not self._validStatistics(stats, manifest['num_of_bugs']):
+            stats = None
+
+        snapshot = None
+        if self._snapshots:
+            snapshot = self._loadSnapshot(manifest)
+
+        creation_time = max(timeString(bug['creation_time'])
+                            for bug in bugs)
+
+        segment = "%06d.xml" % (len(manifest['segments']) + 1)
+        try:
+            os.makedirs(self._segmentsDir())
+        except OSError as exception:
+            if exception.errno != errno.EEXIST:
+                raise
+        with self.metrics.phase('serialize'):
+            self._writeXMLFile(self._segmentsDir() + segment, bugs,
+                               creation_time, len(bugs))
+
+        manifest['segments'].append(segment)
+        manifest['creation_time'] = creation_time
+        manifest['num_of_bugs'] += len(bugs)
+        self.saveMetadata('manifest', self._productName, manifest)
+
+        if stats is None:
+            self.removeMetadata('stats', self._productName)
         else:
-            for child in newBugs.findall('bug'):
-                if child.find('creation_time').text == root_creation_time:
-                    continue
-                root.append(child)
+            self._addToStatistics(stats, bugs)
+            self.saveMetadata('stats', self._productName, stats)
+
+        if len(manifest['segments']) >= self._maxSegments:
+            self.compact()
+
+        if snapshot is not None:
+            snapshot.append(self.convertDateTimes(bugs))
+            self._saveSnapshot(snapshot, manifest)
+        self._indexBugs(self._productName, bugs)
+        self._logChanges(self._productName, [], bugs)
 
-            root.set('creation_time', new_creation_time)
-            root.set('num_of_bugs', str(no_of_new_bugs))
-            self.writeToXMLFile(root)
+        print "Appended %d bugs to: %s" % (len(bugs), self._productName)
+
+        return len(bugs)
+
+    def readStatistics(self):
+        """ Returns product's statistics, making them from scratch if they
+        are missing or stale. Product that doesn't exist has no bugs.
+        """
+        manifest = self.readManifest()
+        if manifest is None:
+            return self._newStatistics()
+        stats = self.loadMetadata('stats', self._productName)
+
+        if not self._validStatistics(stats, manifest['num_of_bugs']):
+            stats = self._newStatistics()
+            if self._snapshots:
+                fields = ['severity', 'creation_time', 'last_change_time']
+                self._addToStatistics(stats, self.readSnapshot(
+                    fields).records(fields))
+            else:
+                self._addToStatistics(stats, (
+                    {'severity': bug.findtext('severity'),
+                     'creation_time': bug.findtext('creation_time'),
+                     'last_change_time': bug.findtext('last_change_time')}
+                    for bug in self.iterBugs()))
+            self.saveMetadata('stats', self._productName, stats)
+
+        return stats
+
+    def compact(self):
+        """ Merges product's segments into its XML file. Bugs are streamed
+        from the old files to the new one, one by one.
+        """
+        manifest = self.readManifest()
+        if manifest is None or not manifest['segments']:
+            return
+
+        # bugs stay the same, so do their statistics and snapshot
+        stats = self.loadMetadata('stats', self._productName)
+        snapshot = None
+        if self._snapshots:
+            snapshot = self._loadSnapshot(manifest)
+
+        filename = self._createNewXMLFile() + ".tmp"
+        with open(filename, 'wb') as f:
+            f.write('<bugs creation_time="%s" num_of_bugs="%d">' %
+                    (manifest['creation_time'], manifest['num_of_bugs']))
+            for bug in self.iterBugs():
+                f.write(ET.tostring(bug))
+            f.write('</bugs>')
+        self._commitXMLFile(filename)
+
+        if self._validStatistics(stats, manifest['num_of_bugs']):
+            self.saveMetadata('stats', self._productName, stats)
+        if snapshot is not None:
+            self._saveSnapshot(snapshot, manifest)
+
+    def productSize(self, product):
+        """ Returns size of product's XML file and segments in bytes """
+        self._productName = str(product)
+
+        manifest = self.readManifest()
+        if manifest is None:
+            return 0
+
+        size = os.path.getsize(self._createNewXMLFile())
+        for segment in manifest['segments']:
+            size += os.path.getsize(self._segmentsDir() + segment)
+
+        return size
+
+    def loadMetadata(self, kind, product):
+        filename = self._metadataFile(kind, product)
+
+        if os.path.isfile(filename):
+            with open(filename, 'rb') as f:
+                return json.load(f)
+        else:
+            return None
+
+    def saveMetadata(self, kind, product, data):
+        """ Metadata is first written to a temporary file which is then
+        renamed, so a crash never leaves a half-written file behind.
+        """
+        filename = self._metadataFile(kind, product)
+
+        with open(filename + ".tmp", 'wb') as f:
+            json.dump(data, f)
+        os.rename(filename + ".tmp", filename)
+
+    def removeMetadata(self, kind, product):
+        filename = self._metadataFile(kind, product)
+
+        if os.path.isfile(filename):
+            os.remove(filename)
 
     def getListOfProducts(self, dbtype=''):
         """ Depending on the second argument it either queries Bugzilla
@@ -366,16 +1339,40 @@ class XMLDatabase(Database):
         return productsList
 
     #interface methods
-    def downloadProductBugs(self, product):
+    def downloadProductBugs(self, product, strict=False):
         self._productName = str(product)
 
         print "Downloading: %s" % str(product)
 
         try:
-            bugs = self.bzilla.Bug.search({"product": str(product)})
-            serialized = self.serialize(bugs)
-            self.writeToXMLFile(serialized)
+            if self._pageSize:
+                self._downloadInPages()
+            else:
+                bugs = self._searchBugs({"product": str(product)})['bugs']
+                if not bugs:
+                    raise ValueError("No bugs found for %s." % str(product))
+
+                stats = self._newStatistics()
+                self._addToStatistics(stats, bugs)
+                self._logChanges(product, self._loggedRecords(product), bugs,
+                                 replace=True)
+                with self.metrics.phase('serialize'):
+                    self.writeToXMLFile(bugs, stats)
+                self.saveMetadata('stats', self._productName, stats)
+                self._indexBugs(product, bugs)
+                self._pruneIndex(product, [bug['id'] for bug in bugs])
+
+                if self._snapshots:
+                    snapshot = Snapshot()
+                    snapshot.append(self.convertDateTimes(bugs))
+                    self._saveSnapshot(snapshot, stats)
+
+                shutil.rmtree(self._dbdir + self._pagesTemplate %
+                              self._productName, ignore_errors=True)
+                self.removeMetadata('checkpoint', self._productName)
         except Exception as e:
+            if strict:
+                raise
             print e
             print "Could not fetch %s bugs" % product
 
@@ -389,11 +1386,15 @@ class XMLDatabase(Database):
     def updateProductBugs(self, product):
         self._productName = str(product)
 
-        create_time = self.getCreationTime(
-            self.loadXMLFile())
-        bugs = self.bzilla.Bug.search({"product": str(product),
-                                       "creation_time": create_time})
-        self.update(bugs)
+        manifest = self.readManifest()
+        if manifest is None:
+            print "Product doesn't exist in a database."
+            return 0
+
+        create_time = manifest['creation_time'].replace(":", "")
+        bugs = self._searchBugs({"product": str(product),
+                                 "creation_time": create_time})
+        return self.update(bugs)
 
     def updateAllProductsBugs(self):
         listOfProducts = self.getListOfProducts()
@@ -402,17 +1403,534 @@ class XMLDatabase(Database):
             print product
             self.updateProductBugs(product)
 
-    def queryProductBugs(self, product):
+    def queryProductBugs(self, product, lazy=False, fields=None, query=None):
+        """ Returns root of the product's XML tree or, if lazy is set,
+        an iterator over its <bug> elements, see iterBugs.
+
+        If a list of fields or a query is given, returns an iterator over
+        bugs where every bug is a dictionary that holds those fields, or all
+        of them if there are no fields. Query narrows bugs down, see
+        BugzillaDB.queryProductBugs.
+        """
         self._productName = str(product)
-        bugs = self.loadXMLFile()
 
-        if bugs is None:
+        if not os.path.isfile(self._createNewXMLFile()):
             print "Local copy of requested product does not exist.\n" \
                   "Fetching it from Bugzilla..."
             self.downloadProductBugs(product)
-            bugs = self.loadXMLFile()
+            self._productName = str(product)
 
-        return bugs
+        if fields is not None or query is not None:
+            return self.iterRecords(fields, query)
+
+        if lazy:
+            return self.iterBugs()
+
+        return self.loadXMLFile()
+
+    def getProductStatistics(self, product):
+        """ Returns statistics of a product: number of bugs of each
+        severity, total number of bugs, creation time of the newest bug and
+        time of the latest change.
+
+        Statistics are kept up to date whenever bugs are written, so this is
+        just a lookup.
+        """
+        self.queryProductBugs(product, lazy=True)
+        return self.readStatistics()
+
+    def listTrackedProducts(self):
+        trackedProducts = self.getListOfProducts()
+
+        print "Currently we are tracking " \
+              "%d products." % len(trackedProducts)
+        print "Tracked products:"
+
+        for p in trackedProducts:
+            print p
+
+        return trackedProducts
+
+
+class SQLiteDatabase(Database):
+    """ This is concrete implementation of database using the strategy
+    interface.
+
+    This class represents SQLite database, a single file that needs no
+    server. All bugs live in one table, with a column for each of the fields
+    we search and analyze by, and the whole bug as JSON. Times are kept in
+    Bugzilla's format (20020822T16:38:00), which sorts the same way times do.
+
+    Downloads go to a staging table first and replace product's bugs in one
+    transaction when they are finished, so readers never see a product half
+    downloaded.
+    """
+    #private:
+    _columns = ['id', 'product', 'severity', 'status', 'resolution',
+                'component', 'priority', 'summary', 'assigned_to', 'is_open',
+                'creation_time', 'last_change_time', 'cf_last_closed']
+    _indexedColumns = [['product', 'severity'], ['product', 'status'],
+                       ['product', 'creation_time'],
+                       ['product', 'last_change_time'],
+                       ['product', 'cf_last_closed']]
+    _batchSize = 1000
+    _connections = ['bzilla', 'conn']
+
+    def __init__(self, url, dbname='default', pagesize=0, batchsize=1000,
+                 transport=None):
+        if len(url) == 0:
+            raise ValueError("You must provide database URL!")
+
+        self._url = url
+        self._transport = transport
+        self.bzilla = self._bugzilla()
+        self._pageSize = pagesize
+        self._batchSize = batchsize
+        self._path = "./%s.sqlite" % dbname
+        self._connect()
+
+    def __setstate__(self, state):
+        Database.__setstate__(self, state)
+        self._connect()
+
+    def _connect(self):
+        self.conn = sqlite3.connect(self._path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+
+        for table in ['bugs', 'staging']:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS %s (id INTEGER, %s, data TEXT, "
+                "PRIMARY KEY (product, id))" % (table,
+                                                ", ".join(self._columns[1:])))
+        for columns in self._indexedColumns:
+            self.conn.execute("CREATE INDEX IF NOT EXISTS bugs_%s ON bugs "
+                              "(%s)" % ("_".join(columns),
+                                        ", ".join(columns)))
+        self.conn.execute("CREATE TABLE IF NOT EXISTS metadata (kind TEXT, "
+                          "product TEXT, data TEXT, "
+                          "PRIMARY KEY (kind, product))")
+        self.conn.commit()
+
+    def _row(self, bug):
+        """ Turns a bug into a row of bugs table """
+        row = []
+        for column in self._columns:
+            value = bug.get(column)
+            if column in self._timeFields and value is not None:
+                value = timeString(value)
+            elif column == 'is_open' and value is not None:
+                value = int(value)
+            row.append(value)
+
+        row.append(json.dumps(bug, default=timeString))
+        return row
+
+    def _fromRow(self, column, value):
+        """ Turns a value from bugs table back into a value of a field """
+        if value is None:
+            return None
+        elif column in self._timeFields:
+            return parseTime(value)
+        elif column == 'is_open':
+            return bool(value)
+
+        return value
+
+    def _bug(self, data):
+        """ Turns JSON from bugs table back into a bug """
+        bug = json.loads(data)
+        for field in self._timeFields:
+            if field in bug:
+                bug[field] = parseTime(bug[field])
+
+        return bug
+
+    def _writeInBatches(self, table, bugs):
+        """ Writes bugs to a table in batches, over bugs with the same id """
+        sql = "INSERT OR REPLACE INTO %s (%s, data) VALUES (%s)" % (
+            table, ", ".join(self._columns),
+            ", ".join("?" * (len(self._columns) + 1)))
+
+        for i in range(0, len(bugs), self._batchSize):
+            rows = [self._row(bug) for bug in bugs[i:i + self._batchSize]]
+            with self.metrics.phase('sqlite_write'):
+                self.conn.executemany(sql, rows)
+
+        self.metrics.count('bugs_written', len(bugs))
+
+    def _sqlQuery(self, product, query):
+        """ Translates our query, see BugzillaDB.queryProductBugs, to SQL
+        conditions and their parameters. Conditions on fields that have no
+        column are returned as a query that has to be checked on every bug.
+        """
+        conditions = ["product = ?"]
+        params = [str(product)]
+        rest = {}
+
+        for field, condition in (query or {}).items():
+            if field not in self._columns:
+                rest[field] = condition
+                continue
+
+            def _value(value):
+                if field in self._timeFields:
+                    return timeString(value)
+                elif field == 'is_open':
+                    return int(value)
+                return value
+
+            if isinstance(condition, tuple):
+                start, end = condition
+                conditions.append("%s IS NOT NULL" % field)
+                if start is not None:
+                    conditions.append("%s >= ?" % field)
+                    params.append(_value(start))
+                if end is not None:
+                    conditions.append("%s < ?" % field)
+                    params.append(_value(end))
+            elif isinstance(condition, list):
+                conditions.append("%s IN (%s)" % (
+                    field, ", ".join("?" * len(condition))))
+                params.extend(_value(value) for value in condition)
+            else:
+                conditions.append("%s = ?" % field)
+                params.append(_value(condition))
+
+        return " AND ".join(conditions), params, rest
+
+    def _hasProduct(self, product):
+        return self.conn.execute("SELECT 1 FROM bugs WHERE product = ? "
+                                 "LIMIT 1", (str(product),)).fetchone() \
+            is not None
+
+    def _countProductBugs(self, product):
+        return self.conn.execute("SELECT COUNT(*) FROM bugs WHERE "
+                                 "product = ?", (str(product),)).fetchone()[0]
+
+    def clone(self):
+        """ SQLite connections can't be shared between threads either, so
+        copy gets its own connection as well.
+        """
+        other = Database.clone(self)
+        other._connect()
+        return other
+
+    def loadMetadata(self, kind, product):
+        row = self.conn.execute("SELECT data FROM metadata WHERE kind = ? "
+                                "AND product = ?",
+                                (kind, str(product))).fetchone()
+        if row is None:
+            return None
+
+        return json.loads(row[0])
+
+    def saveMetadata(self, kind, product, data):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO metadata VALUES "
+                              "(?, ?, ?)", (kind, str(product),
+                                            json.dumps(data)))
+
+    def removeMetadata(self, kind, product):
+        with self.conn:
+            self.conn.execute("DELETE FROM metadata WHERE kind = ? AND "
+                              "product = ?", (kind, str(product)))
+
+    def getListOfProducts(self, dbtype=''):
+        productsList = []
+
+        if dbtype.lower() == "bugzilla":
+            productsIDs = self.bzilla.Product.get_selectable_products()
+            productsDict = self.bzilla.Product.get({'ids': productsIDs['ids'],
+                                                   'include_fields': ['name']})
+
+            for product in productsDict['products']:
+                productsList.append(product['name'])
+
+        else:
+            for row in self.conn.execute("SELECT DISTINCT product FROM bugs "
+                                         "ORDER BY product"):
+                productsList.append(str(row[0]))
+
+        return productsList
+
+    def downloadProductBugs(self, product, strict=False):
+        """ Downloads all bugs of a product and stores them in the database.
+
+        If page size is set, bugs are downloaded and stored page by page
+        and after every page a checkpoint is recorded. If download gets
+        interrupted, next call resumes from the last stored page instead
+        of starting over.
+
+        Errors are printed, unless strict is set, in which case they are
+        passed to the caller.
+        """
+        checkpoint = None
+        if self._pageSize:
+            checkpoint = self.loadMetadata('checkpoint', product)
+
+        print "Downloading product: %s" % str(product)
+        if checkpoint is None:
+            checkpoint = {'offset': 0, 'stats': self._newStatistics(),
+                          'last_change_time': ''}
+            with self.conn:
+                self.conn.execute("DELETE FROM staging WHERE product = ?",
+                                  (str(product),))
+            self.removeMetadata('checkpoint', product)
+        else:
+            print "Resuming download from bug #%d." % checkpoint['offset']
+
+        try:
+            for bugs, offset in self.searchProductBugs(product,
+                                                       offset=checkpoint[
+                                                           'offset']):
+                with self.metrics.phase('convert_times'):
+                    bugs = list(self.convertDateTimes(bugs['bugs']))
+                with self.conn:
+                    self._writeInBatches('staging', bugs)
+                self._indexBugs(product, bugs)
+                self._addToStatistics(checkpoint['stats'], bugs)
+                checkpoint['last_change_time'] = max(
+                    [checkpoint['last_change_time']] +
+                    [timeString(bug['last_change_time']) for bug in bugs])
+
+                if self._pageSize:
+                    checkpoint['offset'] = offset
+                    self.saveMetadata('checkpoint', product, checkpoint)
+
+            if checkpoint['stats']['num_of_bugs'] == 0:
+                self.removeMetadata('checkpoint', product)
+                raise ValueError("No bugs found for %s." % str(product))
+
+            self._logChanges(product, self._sortedRecords('bugs', product),
+                             self._sortedRecords('staging', product),
+                             replace=True, ordered=True)
+            with self.conn:
+                self.conn.execute("DELETE FROM bugs WHERE product = ?",
+                                  (str(product),))
+                self.conn.execute("INSERT OR REPLACE INTO bugs SELECT * FROM "
+                                  "staging WHERE product = ?",
+                                  (str(product),))
+                self.conn.execute("DELETE FROM staging WHERE product = ?",
+                                  (str(product),))
+            self._pruneIndex(product)
+
+            self.removeMetadata('checkpoint', product)
+            self.saveMetadata('stats', product, checkpoint['stats'])
+            self.saveMetadata('sync', product,
+                              {'last_change_time':
+                               checkpoint['last_change_time']})
+            print "Product saved to a database.\n"
+        except Exception as e:
+            if strict:
+                raise
+            print e
+            print "Could not fetch %s bugs.\n" % product
+
+    def downloadAllProductsBugs(self):
+        listOfProducts = self.getListOfProducts('bugzilla')
+        print "Found %d products for download." % len(listOfProducts)
+
+        for product in listOfProducts:
+            self.downloadProductBugs(product)
+
+    def updateProductBugs(self, product):
+        """ Synchronizes product with Bugzilla. Every bug that was created or
+        changed since the last synchronization is fetched and written over
+        its old copy, or inserted if it is a new one.
+
+        Returns the number of bugs that were written.
+        """
+        if not self._hasProduct(product):
+            print "Product doesn't exist in a database."
+            return 0
+
+        sync = self.loadMetadata('sync', product)
+        if sync is not None and sync['last_change_time']:
+            last_change_time = sync['last_change_time']
+        else:
+            last_change_time = self.conn.execute(
+                "SELECT MAX(last_change_time) FROM bugs WHERE product = ?",
+                (str(product),)).fetchone()[0]
+
+        stats = self.loadMetadata('stats', product)
+        if not self._validStatistics(stats, self._countProductBugs(product)):
+            stats = None
+
+        new = changed = 0
+        newest = last_change_time
+
+        fields = ['id', 'severity', 'last_change_time']
+        if self.changelog is not None:
+            fields = self.changelog.recordFields
+
+        params = {'last_change_time': last_change_time.replace(":", "")}
+        for bugs, offset in self.searchProductBugs(product, params):
+            with self.metrics.phase('convert_times'):
+                bugs = list(self.convertDateTimes(bugs['bugs']))
+
+            old = {}
+            for i in range(0, len(bugs), 500):
+                ids = [bug['id'] for bug in bugs[i:i + 500]]
+                for row in self.conn.execute(
+                        "SELECT %s FROM bugs WHERE product = ? AND id IN "
+                        "(%s)" % (", ".join(fields),
+                                  ", ".join("?" * len(ids))),
+                        [str(product)] + ids):
+                    old[row[0]] = dict(
+                        (field, self._fromRow(field, value))
+                        for field, value in zip(fields, row))
+
+            # Bugzilla returns bugs changed at this time or later, so the
+            # ones changed exactly at the high-water mark come back every
+            # time. Those we already have are skipped.
+            bugs = [bug for bug in bugs if bug['id'] not in old or
+                    old[bug['id']]['last_change_time'] !=
+                    bug['last_change_time']]
+            old = [old[bug['id']] for bug in bugs if bug['id'] in old]
+            if not bugs:
+                continue
+
+            with self.conn:
+                self._writeInBatches('bugs', bugs)
+            self._indexBugs(product, bugs)
+            self._logChanges(product, old, bugs)
+            for bug in bugs:
+                newest = max(newest, timeString(bug['last_change_time']))
+
+            if stats is not None:
+                self._removeFromStatistics(stats, old)
+                self._addToStatistics(stats, bugs)
+
+            changed += len(old)
+            new += len(bugs) - len(old)
+
+        if stats is None:
+            self.removeMetadata('stats', product)
+        else:
+            self.saveMetadata('stats', product, stats)
+        self.saveMetadata('sync', product, {'last_change_time': newest})
+
+        if new or changed:
+            print "%s has been updated with %d new and %d changed " \
+                  "bug entries." % (str(product), new, changed)
+        else:
+            print "Nothing to update, " \
+                  "%s is already up-to-date." % str(product)
+
+        return new + changed
+
+    def updateAllProductsBugs(self):
+        listOfProducts = self.getListOfProducts()
+
+        for product in listOfProducts:
+            print product
+            self.updateProductBugs(product)
+
+    def _sortedRecords(self, table, product):
+        """ Returns an iterator over the fields the change log tracks of
+        product's bugs in a table, sorted by id, or nothing if there is no
+        change log.
+        """
+        if self.changelog is None:
+            return []
+
+        fields = self.changelog.recordFields
+        cursor = self.conn.execute("SELECT %s FROM %s WHERE product = ? "
+                                   "ORDER BY id" % (", ".join(fields), table),
+                                   (str(product),))
+
+        return (dict((field, self._fromRow(field, value))
+                     for field, value in zip(fields, row)
+                     if value is not None) for row in cursor)
+
+    def iterRecords(self, product, fields=None, query=None):
+        """ Returns an iterator over bugs of a product that match a query,
+        backed by a database cursor. Bugs are dictionaries that hold given
+        fields or, if there are no fields, whole bugs.
+        """
+        where, params, rest = self._sqlQuery(product, query)
+
+        if fields is not None and not rest and \
+                all(field in self._columns for field in fields):
+            cursor = self.conn.execute("SELECT %s FROM bugs WHERE %s" % (
+                ", ".join(fields), where), params)
+
+            def _records():
+                for row in cursor:
+                    record = {}
+                    for field, value in zip(fields, row):
+                        if value is not None:
+                            record[field] = self._fromRow(field, value)
+                    yield record
+
+            return _records()
+
+        cursor = self.conn.execute("SELECT data FROM bugs WHERE %s" % where,
+                                   params)
+
+        def _bugs():
+            for row in cursor:
+                bug = self._bug(row[0])
+                if rest and not self._matches(bug, rest):
+                    continue
+                if fields is not None:
+                    bug = dict((field, bug[field]) for field in fields
+                               if field in bug)
+                yield bug
+
+        return _bugs()
+
+    def queryProductBugs(self, product, lazy=False, fields=None, query=None):
+        """ Returns product's bugs as a SQLiteProduct, which is what
+        SQLiteAnalyzer works with, or, if lazy is set, as an iterator
+        backed by a database cursor.
+
+        If a list of fields is given, returns an iterator over bugs where
+        every bug is a dictionary that holds only those fields. Query
+        narrows bugs down, see BugzillaDB.queryProductBugs.
+        """
+        if not self._hasProduct(product):
+            print "Local copy of requested product does not exist.\n" \
+                  "Fetching it from Bugzilla..."
+            self.downloadProductBugs(product)
+
+        if fields is not None or query is not None or lazy:
+            return self.iterRecords(product, fields, query)
+
+        return SQLiteProduct(self, product)
+
+    def getProductStatistics(self, product):
+        """ Returns statistics of a product: number of bugs of each
+        severity, total number of bugs, creation time of the newest bug and
+        time of the latest change.
+
+        Statistics are kept up to date whenever bugs are written, so this is
+        just a lookup. If they are missing or stale, they are made from
+        scratch, by SQLite, and saved.
+        """
+        if not self._hasProduct(product):
+            self.queryProductBugs(product)
+
+        stats = self.loadMetadata('stats', product)
+
+        if not self._validStatistics(stats, self._countProductBugs(product)):
+            stats = self._newStatistics()
+            for severity, num, creation_time, last_change_time in \
+                    self.conn.execute(
+                        "SELECT severity, COUNT(*), MAX(creation_time), "
+                        "MAX(last_change_time) FROM bugs WHERE product = ? "
+                        "GROUP BY severity", (str(product),)):
+                if severity is not None:
+                    stats['bugs_by_type'][severity] = num
+                stats['num_of_bugs'] += num
+                stats['creation_time'] = max(stats['creation_time'],
+                                             creation_time or '')
+                stats['last_change_time'] = max(stats['last_change_time'],
+                                                last_change_time or '')
+            self.saveMetadata('stats', product, stats)
+
+        return stats
 
     def listTrackedProducts(self):
         trackedProducts = self.getListOfProducts()
@@ -427,51 +1945,195 @@ class XMLDatabase(Database):
         return trackedProducts
 
 
+class SQLiteProduct(object):
+    """ Bugs of a product in SQLiteDatabase. Iterating over it yields whole
+    bugs, while SQLiteAnalyzer uses its connection to let SQLite do the
+    counting.
+    """
+    def __init__(self, database, product):
+        self.conn = database.conn
+        self.product = str(product)
+        self._database = database
+
+    def __iter__(self):
+        return self._database.iterRecords(self.product)
+
+
 class BugzillaDB(object):
     """ Storing of collected information to a local database is implemented as
     Startegy pattern. This class is actually a Context that is configured with
     a ConcreteStrategy object and maintains a reference to a Strategy object.
+
+    If metrics are given (see metrics.MetricsRegistry), every operation, and
+    the phases the database goes through, are timed and counted there.
+
+    If a search index is given (see search.SearchIndex), every bug that is
+    downloaded or updated is added to it, so bugs of all products can be
+    searched at once.
+
+    If a change log is given (see changelog.ChangeLog), whatever changed in
+    bugs that are downloaded or updated is logged there, so changes can be
+    followed, and distributions of the past made, without old copies of
+    products.
     """
-    def __init__(self, database):
+    def __init__(self, database, metrics=None, index=None, changelog=None):
         self.db = database
+        if metrics is not None:
+            self.db.setMetrics(metrics)
+        if index is not None:
+            self.db.setIndex(index)
+        if changelog is not None:
+            self.db.setChangeLog(changelog)
+        self.metrics = self.db.metrics
+        self.index = self.db.index
+        self.changelog = self.db.changelog
+
+    def clone(self):
+        """ Returns a copy that works on a copy of our database, so it can
+        be used from another thread, see Database.clone.
+        """
+        return BugzillaDB(self.db.clone())
 
     def downloadProductBugs(self, product):
         """ Queries Bugzilla database for information about specific product,
         pulls that information and stores it in our local database.
         """
-        self.db.downloadProductBugs(product)
+        with self.metrics.phase('download'):
+            self.db.downloadProductBugs(product)
 
     def downloadAllProductsBugs(self):
         """ Queries Bugzilla database for information about *all* products,
         pulls that information and stores it in our local database.
         """
-        self.db.downloadAllProductsBugs()
+        with self.metrics.phase('download_all'):
+            self.db.downloadAllProductsBugs()
 
     def updateProductBugs(self, product):
         """ Updates our local database with newest bugs and information
         from Bugzilla database on a specific product. It does nothing
         if everything is up to date.
         """
-        self.db.updateProductBugs(product)
+        with self.metrics.phase('update'):
+            updated = self.db.updateProductBugs(product)
+        self.metrics.count('bugs_updated', updated)
+        return updated
 
     def updateAllProductsBugs(self):
         """ Updates our local database with newest bugs and information
         from Bugzilla database on *all* products we have in our local
         database. It does nothing if everything is up to date.
         """
-        self.db.updateAllProductsBugs()
+        with self.metrics.phase('update_all'):
+            self.db.updateAllProductsBugs()
+
+    def harvestProducts(self, products=None, update=False, harvester=None):
+        """ Downloads or, if update is set, updates given products
+        concurrently, using a Harvester (a default one if none is given).
+
+        Without a list of products it harvests *all* products, those found
+        in Bugzilla when downloading, or those in our local database when
+        updating. Returns a per-product report of successes and failures.
+        """
+        if products is None:
+            if update:
+                products = self.db.getListOfProducts()
+            else:
+                products = self.db.getListOfProducts('bugzilla')
 
-    def queryProductBugs(self, product):
+        if harvester is None:
+            harvester = Harvester()
+
+        with self.metrics.phase('harvest'):
+            return harvester.harvest(self.db, products, update)
+
+    def queryProductBugs(self, product, lazy=False, fields=None, query=None):
         """ Queries our local database for bugs on a specific product.
 
         If information regarding requested product is not available locally
         method will try to fetch that information from Bugzilla and
-        return it.
+        return it. If lazy is set, bugs are returned as an iterator that
+        reads them from the database one by one.
+
+        If a list of fields or a query is given, bugs are returned as an
+        iterator over dictionaries, whatever the database. Every dictionary
+        holds only the given fields (all fields if there are none) and times
+        are datetime objects. Databases read only the fields that are asked
+        for wherever they can, so analysis pays only for what it uses.
+
+        Query is a dictionary that maps fields to conditions bugs must meet:
+        a list of allowed values, a (start, end) tuple for values from start
+        up to, but not including, end (either can be None), or a value.
         """
-        bugs = self.db.queryProductBugs(product)
+        with self.metrics.phase('query'):
+            bugs = self.db.queryProductBugs(product, lazy, fields, query)
         return bugs
 
     def listTrackedProducts(self):
         """ List all products that we are tracking in our local database. """
         trackedProducts = self.db.listTrackedProducts()
         return trackedProducts
+
+    def buildSearchIndex(self, products=None):
+        """ Adds bugs of given products, or of all products we are tracking,
+        from our local database to the search index. Only needed for bugs
+        that were stored before the index was given to us.
+        """
+        if self.index is None:
+            raise ValueError("You must provide a search index!")
+
+        if products is None:
+            products = self.db.getListOfProducts()
+
+        with self.metrics.phase('build_search_index'):
+            for product in products:
+                self.index.removeProduct(product)
+                self.index.add(product, self.db.queryProductBugs(
+                    str(product), fields=self.index.fields))
+
+    def searchBugs(self, text=None, filters=None, facets=None, limit=20,
+                   offset=0):
+        """ Searches bugs of all products in the search index by text in
+        their fields and filters, and returns ranked bugs, their total
+        number and facet counts, see search.SearchIndex.search.
+        """
+        if self.index is None:
+            raise ValueError("You must provide a search index!")
+
+        with self.metrics.phase('search'):
+            result = self.index.search(text, filters, facets, limit, offset)
+        return result
+
+    def getProductChanges(self, product, cursor=0, since=None, until=None):
+        """ Returns an iterator over changes of a product that were logged
+        after the given cursor, as (cursor, change) pairs, optionally only
+        those that happened from since up to until, see
+        changelog.ChangeLog.changes. Pass the last cursor you got to get
+        only what changed since.
+        """
+        if self.changelog is None:
+            raise ValueError("You must provide a change log!")
+
+        return self.changelog.changes(product, cursor, since, until)
+
+    def getProductDistribution(self, product, when=None, field='severity'):
+        """ Returns number of bugs of a product of each severity (or
+        another field the change log tracks) as it was at a given time, made
+        from the change log.
+        """
+        if self.changelog is None:
+            raise ValueError("You must provide a change log!")
+
+        with self.metrics.phase('distribution'):
+            distribution = self.changelog.distribution(product, when, field)
+        return distribution
+
+    def getProductStatistics(self, product):
+        """ Returns statistics of a specific product that are kept in our
+        local database: number of bugs of each severity, total number of
+        bugs, creation time of the newest bug and time of the latest change.
+        They are updated whenever bugs are downloaded or updated, so this
+        doesn't have to go through bugs.
+        """
+        with self.metrics.phase('statistics'):
+            stats = self.db.getProductStatistics(product)
+        return stats
@@ -0,0 +1,352 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import collections
+import cPickle
+import errno
+import hashlib
+import json
+import threading
+import time
+import zlib
+import xmlrpclib
+
+from .transport import Transport
+
+
+class _FileCache(object):
+    """ Stores data in files, one file per key, under a directory. Once
+    files take more than maxsize bytes, those used least recently are
+    removed. DiskCache and ResultCache decide what is stored and how.
+    """
+    def __init__(self, path, maxsize):
+        self.path = path
+        self.maxsize = maxsize
+
+        self._lock = threading.Lock()
+        self._size = None
+        self._statistics = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+        try:
+            os.makedirs(self.path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    #private:
+    def _file(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def _files(self):
+        for directory in os.listdir(self.path):
+            directory = os.path.join(self.path, directory)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if not name.endswith('.tmp'):
+                    yield os.path.join(directory, name)
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._statistics[name] += value
+
+    def _evict(self, added):
+        """ Accounts for added bytes and, if there are too many of them,
+        removes files used least recently until only 90% of maxsize is used.
+        """
+        with self._lock:
+            if self._size is None:
+                self._size = sum(os.path.getsize(f) for f in self._files())
+            else:
+                self._size += added
+            if self._size <= self.maxsize:
+                return
+
+            files = []
+            for ffile in self._files():
+                stat = os.stat(ffile)
+                files.append((stat.st_atime, stat.st_size, ffile))
+            files.sort()
+
+            for atime, size, ffile in files:
+                if self._size <= self.maxsize * 0.9:
+                    break
+                try:
+                    os.remove(ffile)
+                except OSError:
+                    continue
+                self._size -= size
+                self._statistics['evictions'] += 1
+
+    def _write(self, key, data):
+        """ Writes data to the file of a key, replacing it in one step, and
+        makes room for it.
+        """
+        ffile = self._file(key)
+        try:
+            os.makedirs(os.path.dirname(ffile))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        replaced = 0
+        if os.path.isfile(ffile):
+            replaced = os.path.getsize(ffile)
+
+        tmpname = "%s.%d.tmp" % (ffile, threading.current_thread().ident)
+        with open(tmpname, 'wb') as f:
+            f.write(data)
+        os.rename(tmpname, ffile)
+
+        self._evict(len(data) - replaced)
+
+    #public:
+    def clear(self):
+        """ Removes all cached files """
+        with self._lock:
+            for ffile in self._files():
+                os.remove(ffile)
+            self._size = 0
+
+    def getStatistics(self):
+        with self._lock:
+            return dict(self._statistics)
+
+
+class DiskCache(_FileCache):
+    """ Keeps responses of Bugzilla API calls on disk.
+
+    Every response is stored in its own file, named by a hash of Bugzilla's
+    URL, the method and its parameters, so the same call made again, with
+    the same parameters, is answered from disk. Responses expire after the
+    time to live of their method, in seconds; methods that have no time to
+    live aren't cached at all. Once files take more than maxsize bytes,
+    those used least recently are removed.
+
+    If offline is set, nothing is ever sent to Bugzilla and responses never
+    expire, so calls that were cached before can be replayed, e.g. for
+    benchmarks. A call that wasn't cached then fails.
+    """
+    #private:
+    _ttls = {'Product.get_selectable_products': 24*3600,
+             'Product.get': 24*3600,
+             'Bug.search': 600}
+
+    def __init__(self, path='./.bzcache/', ttls=None, maxsize=256*1024*1024,
+                 offline=False):
+        _FileCache.__init__(self, path, maxsize)
+        self.ttls = dict(self._ttls)
+        self.ttls.update(ttls or {})
+        self.offline = offline
+
+    #private:
+    def _key(self, url, method, params):
+        request = json.dumps([url, method, params], sort_keys=True,
+                             default=str)
+        return hashlib.sha1(request).hexdigest()
+
+    #public:
+    def get(self, url, method, params):
+        """ Returns a tuple that holds cached response of a call, or None if
+        there is no response that is still fresh.
+        """
+        ffile = self._file(self._key(url, method, params))
+        ttl = self.ttls.get(method, 0)
+
+        try:
+            stat = os.stat(ffile)
+            if not self.offline and time.time() - stat.st_mtime > ttl:
+                return None
+            with open(ffile, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            return None
+
+        # access time tells which files were used least recently, while
+        # modification time still tells when the response was stored
+        now = time.time()
+        try:
+            os.utime(ffile, (now, stat.st_mtime))
+        except OSError:
+            pass
+
+        response, method = xmlrpclib.loads(zlib.decompress(data))
+        return response
+
+    def put(self, url, method, params, response):
+        """ Stores response of a call, if its method is cached """
+        if not self.ttls.get(method, 0):
+            return
+
+        data = zlib.compress(xmlrpclib.dumps((response,), methodresponse=True,
+                                             allow_none=True))
+        self._write(self._key(url, method, params), data)
+
+    def call(self, url, method, params, function):
+        """ Returns response of a call from the cache or, if it isn't there,
+        makes the call with function and stores its response.
+        """
+        response = self.get(url, method, params)
+        if response is not None:
+            self._count('hits')
+            return response[0]
+
+        if self.offline:
+            raise ValueError("Response of %s%r is not in the cache!" %
+                             (method, params))
+
+        self._count('misses')
+        response = function(*params)
+        self.put(url, method, params, response)
+
+        return response
+
+
+class ResultCache(_FileCache):
+    """ Keeps results of analysis, and rendered plots, in memory and on
+    disk, so asking for them again doesn't go through the database.
+
+    Results are stored under a key, any list that can be turned into JSON,
+    which should hold everything they depend on, e.g. the product and its
+    data version (see Analyzer). A key that holds a new version is a new
+    key, so results of data that has changed are never found again and,
+    as they are used least recently, are the first to go.
+
+    Up to maxentries results are kept in memory, pickled, so whoever gets a
+    result gets their own copy of it, and those used least recently are
+    dropped first. Every result is also written to its own file, and
+    files used least recently are removed once they take more than maxsize
+    bytes, as DiskCache does. Results on disk outlive the process, so the
+    next run of the analysis starts with them.
+    """
+    def __init__(self, path='./.results/', maxentries=256,
+                 maxsize=64*1024*1024):
+        _FileCache.__init__(self, path, maxsize)
+        self.maxentries = maxentries
+
+        self._memory = collections.OrderedDict()
+        self._statistics['disk_hits'] = 0
+
+    #private:
+    def _key(self, key):
+        return hashlib.sha1(json.dumps(key, sort_keys=True,
+                                       default=str)).hexdigest()
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._memory.pop(key, None)
+            self._memory[key] = data
+            while len(self._memory) > self.maxentries:
+                self._memory.popitem(last=False)
+
+    #public:
+    def get(self, key):
+        """ Returns a tuple that tells whether a result is cached, and the
+        result, if it is.
+        """
+        key = self._key(key)
+
+        with self._lock:
+            data = self._memory.pop(key, None)
+            if data is not None:
+                self._memory[key] = data
+                self._statistics['hits'] += 1
+                return True, cPickle.loads(data)
+
+        ffile = self._file(key)
+        try:
+            with open(ffile, 'rb') as f:
+                data = f.read()
+            value = cPickle.loads(data)
+            os.utime(ffile, None)
+        except (IOError, OSError, EOFError, cPickle.UnpicklingError):
+            self._count('misses')
+            return False, None
+
+        self._remember(key, data)
+        self._count('hits')
+        self._count('disk_hits')
+
+        return True, value
+
+    def put(self, key, value):
+        """ Stores a result under a key """
+        key = self._key(key)
+        data = cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)
+        self._remember(key, data)
+        self._write(key, data)
+
+    def call(self, key, function):
+        """ Returns result stored under a key or, if there is none, calls
+        function and stores what it returns.
+        """
+        found, value = self.get(key)
+        if found:
+            return value
+
+        value = function()
+        self.put(key, value)
+
+        return value
+
+    def clear(self):
+        """ Removes all cached results, from memory and from disk """
+        with self._lock:
+            self._memory.clear()
+        _FileCache.clear(self)
+
+
+class _CachedMethod(object):
+    """ Method of a CachedClient, e.g. Bug.search """
+    def __init__(self, client, name):
+        self._client = client
+        self._name = name
+
+    def __getattr__(self, name):
+        return _CachedMethod(self._client, "%s.%s" % (self._name, name))
+
+    def __call__(self, *params):
+        function = self._client._client
+        for name in self._name.split('.'):
+            function = getattr(function, name)
+
+        return self._client._cache.call(self._client._url, self._name,
+                                        params, function)
+
+
+class CachedClient(object):
+    """ Bugzilla client that answers calls from a DiskCache whenever it can
+    and passes the rest on to the client it wraps.
+    """
+    def __init__(self, client, cache, url):
+        self._client = client
+        self._cache = cache
+        self._url = url
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        return _CachedMethod(self, name)
+
+
+class CachingTransport(Transport):
+    """ Transport that puts a DiskCache in front of clients made by another
+    transport, or plain PyZilla clients if there is none.
+    """
+    def __init__(self, cache, transport=None):
+        self.cache = cache
+        self.transport = transport or Transport()
+
+    def connect(self, url):
+        return CachedClient(self.transport.connect(url), self.cache, url)
+
+    def setMetrics(self, metrics):
+        Transport.setMetrics(self, metrics)
+        self.transport.setMetrics(metrics)
+
+    def getStatistics(self):
+        statistics = self.transport.getStatistics()
+        statistics.update(self.cache.getStatistics())
+        return statistics
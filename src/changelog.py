@@ -0,0 +1,311 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import datetime
+import errno
+import glob
+import heapq
+import json
+import os
+import tempfile
+import threading
+
+from .base import timeString
+
+
+class ChangeLog(object):
+    """ Append-only log of what happened to bugs of every product, written
+    as bugs are downloaded and updated, so we can tell what changed between
+    harvests without keeping old copies of products around.
+
+    Log is a directory with a file for every product (gnote.changes) that
+    holds an entry per line, as a JSON document. An entry tells which bug it
+    is about, what happened to it (created, changed or removed), when it
+    happened, when we saw it, and the old and new value of every field we
+    track that changed. Bugs we see for the first time are created, with
+    no old values, and bugs that are gone from a product when it is
+    downloaded again are removed, with no new values.
+
+    Times of entries are times of Bugzilla: creation time for created bugs
+    and time of the last change for changed ones. Bugs that changed more
+    than once between harvests get a single entry, at the time of their
+    last change. Removed bugs get the time we noticed they are gone.
+
+    Lines are only ever appended, so readers can follow the log by the
+    position they have read it to (see changes), and a line that was cut
+    short by a crash is skipped.
+    """
+    #private:
+    _fileTemplate = "%s.changes"
+    _batchSize = 1000
+
+    #public:
+    fields = ['severity', 'status', 'resolution', 'priority', 'component',
+              'is_open']
+    recordFields = ['id', 'creation_time', 'last_change_time'] + fields
+
+    def __init__(self, path='./changes/'):
+        self.path = os.path.join(path, '')
+        self._lock = threading.Lock()
+
+        try:
+            os.makedirs(self.path)
+        except OSError as exception:
+            if exception.errno != errno.EEXIST:
+                raise
+
+    #private:
+    def _file(self, product):
+        return self.path + self._fileTemplate % str(product)
+
+    def _value(self, field, value):
+        """ Returns a value of a field the way it is logged, whatever the
+        database it was read from.
+        """
+        if field == 'is_open' and isinstance(value, basestring):
+            return value == 'True'
+
+        return value
+
+    def _entry(self, event, bug, time, logged, before, after):
+        fields = {}
+        for field in self.fields:
+            old = self._value(field, before.get(field))
+            new = self._value(field, after.get(field))
+            if old != new:
+                fields[field] = [old, new]
+
+        return {'id': bug['id'], 'event': event, 'time': time,
+                'logged': logged, 'fields': fields}
+
+    def _append(self, product, entries):
+        lines = "".join(json.dumps(entry) + "\n" for entry in entries)
+        if not lines:
+            return
+
+        with self._lock:
+            with open(self._file(product), 'ab+') as f:
+                # a line cut short by a crash is ended, so it doesn't
+                # swallow the first entry we append
+                f.seek(0, os.SEEK_END)
+                if f.tell():
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != "\n":
+                        f.write("\n")
+                f.write(lines)
+
+    def _logged(self, record):
+        """ Returns the fields of a record that we log, with times as
+        strings, so it can be kept in a temporary file.
+        """
+        logged = {}
+        for field in self.recordFields:
+            if field in record:
+                value = record[field]
+                if field.endswith('_time'):
+                    value = timeString(value)
+                logged[field] = value
+
+        return logged
+
+    def _spill(self, run):
+        """ Writes a sorted run of records to a temporary file, a record
+        per line, and returns the file.
+        """
+        f = tempfile.TemporaryFile(dir=self.path)
+        for record in run:
+            f.write(json.dumps(record) + "\n")
+        f.seek(0)
+
+        return f
+
+    def _unspill(self, f):
+        for line in f:
+            record = json.loads(line)
+            yield record['id'], record
+
+    def _sortedById(self, records):
+        """ Yields records, holding only the fields we log, sorted by id.
+        They are sorted in runs of _batchSize which, if there is more than
+        one, are kept in temporary files and merged, so memory use doesn't
+        depend on the number of records.
+        """
+        runs = []
+        run = []
+        try:
+            for record in records:
+                run.append(self._logged(record))
+                if len(run) >= self._batchSize:
+                    run.sort(key=lambda record: record['id'])
+                    runs.append(self._spill(run))
+                    run = []
+            run.sort(key=lambda record: record['id'])
+
+            if not runs:
+                for record in run:
+                    yield record
+                return
+
+            runs.append(self._spill(run))
+            del run
+            for bugId, record in heapq.merge(*[self._unspill(f)
+                                               for f in runs]):
+                yield record
+        finally:
+            for f in runs:
+                f.close()
+
+    def _compare(self, before, bug, logged):
+        """ Returns the entry of a bug, given as it was (None if we didn't
+        have it) and as it is now, or None if nothing we log changed.
+        """
+        if before is None:
+            return self._entry('created', bug,
+                               timeString(bug.get('creation_time', '')),
+                               logged, {}, bug)
+
+        entry = self._entry('changed', bug,
+                            timeString(bug.get('last_change_time', '')),
+                            logged, before, bug)
+        if not entry['fields']:
+            return None
+
+        return entry
+
+    def _changed(self, old, new, logged):
+        """ Yields entries of bugs in new, looking them up in old by id """
+        previous = dict((record['id'], record) for record in old)
+        for bug in new:
+            entry = self._compare(previous.get(bug['id']), bug, logged)
+            if entry is not None:
+                yield entry
+
+    def _replaced(self, old, new, logged):
+        """ Yields entries of bugs of a product that was replaced, walking
+        old and new, both sorted by id, side by side. Bugs that are only in
+        old are removed.
+        """
+        old, new = iter(old), iter(new)
+        before, bug = next(old, None), next(new, None)
+        while before is not None or bug is not None:
+            if bug is None or (before is not None and
+                               before['id'] < bug['id']):
+                yield self._entry('removed', before, logged, logged, before,
+                                  {})
+                before = next(old, None)
+                continue
+
+            if before is not None and before['id'] == bug['id']:
+                entry = self._compare(before, bug, logged)
+                before = next(old, None)
+            else:
+                entry = self._compare(None, bug, logged)
+            if entry is not None:
+                yield entry
+            bug = next(new, None)
+
+    #public:
+    def record(self, product, old, new, replace=False, ordered=False):
+        """ Compares bugs of a product as they were (old) with what they
+        are now (new) and logs the differences. Both are iterables of
+        dictionaries that hold at least recordFields, new may hold whole
+        bugs. Bugs that are not in old are logged as created, bugs whose
+        fields changed as changed.
+
+        If replace is set, new holds all bugs of the product, and bugs that
+        are not in it are logged as removed. Old and new are then read side
+        by side in order of ids, so neither is held in memory. If ordered is
+        set, they already come in that order, otherwise they are sorted
+        here, see _sortedById. Without replace, old is looked up by id, so
+        it should be small, such as the old copies of a page of bugs.
+
+        Returns the number of entries that were logged.
+        """
+        logged = timeString(datetime.datetime.utcnow())
+        if replace:
+            if not ordered:
+                old, new = self._sortedById(old), self._sortedById(new)
+            entries = self._replaced(old, new, logged)
+        else:
+            entries = self._changed(old, new, logged)
+
+        batch = []
+        count = 0
+        for entry in entries:
+            batch.append(entry)
+            if len(batch) >= self._batchSize:
+                self._append(product, batch)
+                count += len(batch)
+                batch = []
+        self._append(product, batch)
+
+        return count + len(batch)
+
+    def changes(self, product, cursor=0, since=None, until=None):
+        """ Yields entries of a product that were logged after the given
+        cursor, each with the cursor that follows it, as (cursor, entry).
+        Consumers that remember the last cursor they got and pass it the
+        next time get only the entries that were logged since. If since or
+        until are given, only entries from since up to, but not including,
+        until are yielded.
+        """
+        since = timeString(since) if since is not None else None
+        until = timeString(until) if until is not None else None
+
+        try:
+            f = open(self._file(product), 'rb')
+        except IOError as exception:
+            if exception.errno == errno.ENOENT:
+                return
+            raise
+
+        with f:
+            f.seek(cursor)
+            while True:
+                line = f.readline()
+                # last line may still be being written
+                if not line.endswith("\n"):
+                    return
+                cursor += len(line)
+
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if since is not None and entry['time'] < since:
+                    continue
+                if until is not None and entry['time'] >= until:
+                    continue
+
+                yield cursor, entry
+
+    def distribution(self, product, when=None, field='severity'):
+        """ Returns the number of bugs of a product that had each value of
+        a tracked field at a given time, or now if there is no time, as the
+        log tells it. Bugs are counted from the first time we saw them, by
+        the value they had then.
+        """
+        if field not in self.fields:
+            raise ValueError("Changes of %s are not logged!" % field)
+
+        when = timeString(when) if when is not None else None
+        counts = {}
+        for cursor, entry in self.changes(product):
+            if when is not None and entry['time'] > when:
+                continue
+            if field not in entry['fields']:
+                continue
+
+            old, new = entry['fields'][field]
+            if old is not None:
+                counts[old] = counts.get(old, 0) - 1
+            if new is not None:
+                counts[new] = counts.get(new, 0) + 1
+
+        return dict((value, count) for value, count in counts.items()
+                    if count > 0)
+
+    def products(self):
+        """ Returns products that have a log """
+        return [os.path.basename(path)[:-len(self._fileTemplate % "")]
+                for path in glob.glob(self.path + self._fileTemplate % "*")]
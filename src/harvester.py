@@ -0,0 +1,128 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import threading
+import Queue
+import random
+import time
+import urlparse
+
+
+class Harvester(object):
+    """ Downloads or updates bugs of many products concurrently.
+
+    Products are handed to a bounded pool of worker threads. Every worker
+    works on its own copy of the database (see Database.clone), because
+    XML-RPC connections can't be shared between threads. Number of requests
+    that are in flight against a single Bugzilla host is limited no matter
+    how many harvesters are running in this process.
+
+    Failed products are retried with exponential backoff and every harvest
+    returns a report with the outcome for each product.
+    """
+    #private:
+    _hostSlots = {}
+    _hostSlotsLock = threading.Lock()
+
+    def __init__(self, workers=4, perhost=2, retries=3, backoff=1.0):
+        if workers < 1:
+            raise ValueError("You must use at least one worker!")
+
+        self.workers = workers
+        self.perhost = perhost
+        self.retries = retries
+        self.backoff = backoff
+
+    #private:
+    def _hostSlot(self, url):
+        """ Returns a semaphore shared by everyone who talks to url's host.
+        Its size is set by the first harvester that talks to that host.
+        """
+        host = urlparse.urlparse(url).netloc
+
+        with self._hostSlotsLock:
+            if host not in self._hostSlots:
+                self._hostSlots[host] = threading.BoundedSemaphore(
+                    self.perhost)
+            return self._hostSlots[host]
+
+    def _harvestProduct(self, database, product, update, slot):
+        """ Harvests a single product, retrying on failure, and returns
+        a report entry for it.
+        """
+        entry = {'status': 'ok', 'attempts': 0, 'seconds': 0.0, 'error': None}
+        start = time.time()
+
+        while True:
+            entry['attempts'] += 1
+            try:
+                with slot:
+                    if update:
+                        database.updateProductBugs(product)
+                    else:
+                        database.downloadProductBugs(product, strict=True)
+                break
+            except Exception as e:
+                entry['error'] = "%s: %s" % (type(e).__name__, e)
+                if entry['attempts'] > self.retries:
+                    entry['status'] = 'failed'
+                    break
+
+                # exponential backoff with a bit of jitter, so workers that
+                # failed together don't hit the server together again
+                delay = self.backoff * 2 ** (entry['attempts'] - 1)
+                time.sleep(delay + random.uniform(0, delay / 2.0))
+
+        if entry['status'] == 'ok':
+            entry['error'] = None
+        entry['seconds'] = time.time() - start
+
+        return entry
+
+    def _work(self, database, jobs, update, slot, report, lock):
+        db = database.clone()
+
+        while True:
+            try:
+                product = jobs.get_nowait()
+            except Queue.Empty:
+                return
+
+            entry = self._harvestProduct(db, product, update, slot)
+
+            with lock:
+                report[product] = entry
+
+    #public:
+    def harvest(self, database, products, update=False):
+        """ Downloads (or updates, if update is set) given products into
+        database and returns a report: a dictionary that maps every product
+        to its status ('ok' or 'failed'), number of attempts, time spent and
+        the last error.
+        """
+        jobs = Queue.Queue()
+        for product in products:
+            jobs.put(str(product))
+
+        report = {}
+        lock = threading.Lock()
+        slot = self._hostSlot(database._url)
+
+        threads = []
+        for i in range(min(self.workers, jobs.qsize())):
+            t = threading.Thread(target=self._work,
+                                 args=(database, jobs, update, slot,
+                                       report, lock))
+            t.daemon = True
+            t.start()
+            threads.append(t)
+
+        for t in threads:
+            t.join()
+
+        failed = [p for p, e in report.items() if e['status'] != 'ok']
+        print "Harvested %d products, %d failed." % (len(report), len(failed))
+        for product in sorted(failed):
+            print "%s: %s" % (product, report[product]['error'])
+
+        return report
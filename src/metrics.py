@@ -0,0 +1,239 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import cProfile
+import json
+import pstats
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+class _NoPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class NullMetrics(object):
+    """ Metrics that record nothing. Databases, transports and analyzers use
+    it until they are given a MetricsRegistry, so they can always record.
+    """
+    _noPhase = _NoPhase()
+
+    def phase(self, name):
+        return self._noPhase
+
+    def count(self, name, value=1):
+        pass
+
+
+nullMetrics = NullMetrics()
+
+
+class _Phase(object):
+    def __init__(self, registry, name):
+        self._registry = registry
+        self._name = name
+
+    def __enter__(self):
+        self._registry._enter()
+        self._memory = self._registry._sampleMemory()
+        self._start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        self._registry._exit(self._name, time.time() - self._start,
+                             exc[0] is not None, self._memory)
+        return False
+
+
+class MetricsRegistry(object):
+    """ Records what BugzillaDB, its database and transport, and Analyzer
+    are doing.
+
+    Work is split into phases, e.g. 'download' or 'bugzilla_search', and
+    for every phase we keep number of calls, errors, total and the longest
+    time. Counters hold things like number of bugs fetched and bytes
+    received.
+
+    Memory is sampled whenever a phase starts and ends. For every phase we
+    keep the peak resident memory of the process by the time it ended, and
+    the most a single call raised that peak, which tells which phases need
+    the memory. If memory is set, memory allocated by Python is traced with
+    tracemalloc as well and every phase also gets the most that was traced
+    while it ran. Python 2.7 needs the pytracemalloc backport (and a
+    patched interpreter) for that. Peaks of phases that run at the same
+    time in many threads are shared by all of them.
+
+    If profile is set, outermost phases are also run under cProfile.
+    Profiling and tracing memory both slow things down considerably.
+
+    Metrics can be exported as JSON or in Prometheus text format. Registry
+    can be shared by many threads.
+    """
+    #private:
+    _prefix = "bugzilla_"
+
+    def __init__(self, profile=False, memory=False):
+        if memory and tracemalloc is None:
+            raise ValueError("You must install tracemalloc to trace memory!")
+
+        self.profile = profile
+        self.memory = memory
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._phases = {}
+        self._counters = {}
+        self._profiles = []
+
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    #private:
+    def _enter(self):
+        depth = getattr(self._local, 'depth', 0)
+        self._local.depth = depth + 1
+
+        if self.profile and depth == 0:
+            self._local.profile = cProfile.Profile()
+            self._local.profile.enable()
+
+    def _exit(self, name, seconds, failed, start):
+        self._local.depth -= 1
+        memory = self._sampleMemory()
+
+        if self.profile and self._local.depth == 0:
+            self._local.profile.disable()
+            with self._lock:
+                self._profiles.append(self._local.profile)
+
+        with self._lock:
+            phase = self._phases.setdefault(name, {'calls': 0, 'errors': 0,
+                                                   'seconds': 0.0,
+                                                   'max_seconds': 0.0})
+            phase['calls'] += 1
+            phase['errors'] += int(failed)
+            phase['seconds'] += seconds
+            phase['max_seconds'] = max(phase['max_seconds'], seconds)
+
+            if memory['peak'] is not None:
+                phase['peak_memory_bytes'] = max(
+                    phase.get('peak_memory_bytes', 0), memory['peak'])
+                phase['memory_growth_bytes'] = max(
+                    phase.get('memory_growth_bytes', 0),
+                    memory['peak'] - start['peak'])
+            if self.memory:
+                phase['traced_peak_bytes'] = max(
+                    phase.get('traced_peak_bytes', 0),
+                    self._tracedPeak(start, memory))
+
+    def _sampleMemory(self):
+        """ Returns peak resident memory of the process, and memory traced
+        now and its peak, in bytes, or None for those we can't tell.
+        """
+        memory = {'peak': None, 'traced': None, 'traced_peak': None}
+        if resource is not None:
+            # maximum resident set size is in kilobytes on Linux
+            memory['peak'] = resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss * 1024
+        if self.memory:
+            memory['traced'], memory['traced_peak'] = \
+                tracemalloc.get_traced_memory()
+
+        return memory
+
+    def _tracedPeak(self, start, end):
+        """ Returns the most memory that was traced while a phase ran.
+        Peak of tracemalloc can't be reset on Python 2, so if a phase
+        didn't raise it, the most we know it had is the memory traced when
+        it started or ended.
+        """
+        if end['traced_peak'] > start['traced_peak']:
+            return end['traced_peak']
+
+        return max(start['traced'], end['traced'])
+
+    #public:
+    def phase(self, name):
+        """ Returns a context manager that times a phase """
+        return _Phase(self, name)
+
+    def count(self, name, value=1):
+        """ Adds value to a counter """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def getMetrics(self):
+        """ Returns all metrics as a dictionary """
+        with self._lock:
+            return {'phases': dict((name, dict(phase)) for name, phase
+                                   in self._phases.items()),
+                    'counters': dict(self._counters)}
+
+    def getProfile(self):
+        """ Returns profiles of all phases merged into pstats.Stats, or None
+        if nothing was profiled.
+        """
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return None
+
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+
+        return stats
+
+    def toJSON(self):
+        return json.dumps(self.getMetrics(), indent=2, sort_keys=True)
+
+    def toPrometheus(self):
+        """ Returns metrics in Prometheus text exposition format """
+        metrics = self.getMetrics()
+        lines = []
+
+        def _metric(name, kind, samples):
+            name = self._prefix + name
+            lines.append("# TYPE %s %s" % (name, kind))
+            for labels, value in samples:
+                if labels:
+                    lines.append('%s{phase="%s"} %r' % (name, labels, value))
+                else:
+                    lines.append("%s %r" % (name, value))
+
+        phases = sorted(metrics['phases'].items())
+        for field, name, kind in [('calls', 'phase_calls_total', 'counter'),
+                                  ('errors', 'phase_errors_total', 'counter'),
+                                  ('seconds', 'phase_seconds_total',
+                                   'counter'),
+                                  ('max_seconds', 'phase_max_seconds',
+                                   'gauge'),
+                                  ('peak_memory_bytes',
+                                   'phase_peak_memory_bytes', 'gauge'),
+                                  ('memory_growth_bytes',
+                                   'phase_memory_growth_bytes', 'gauge'),
+                                  ('traced_peak_bytes',
+                                   'phase_traced_peak_bytes', 'gauge')]:
+            samples = [(phase, values[field]) for phase, values in phases
+                       if field in values]
+            if samples:
+                _metric(name, kind, samples)
+
+        for name, value in sorted(metrics['counters'].items()):
+            _metric(name + '_total', 'counter', [(None, value)])
+
+        return "\n".join(lines) + "\n"
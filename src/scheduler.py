@@ -0,0 +1,237 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import heapq
+import threading
+import time
+
+
+class Scheduler(object):
+    """ Keeps products of a BugzillaDB fresh, updating every product about
+    as often as it changes.
+
+    Every product has a job that remembers when it was synchronized, when
+    it is due next and how many bugs change in it per hour, smoothed over
+    past synchronizations. Products are due again once about target bugs
+    are expected to have changed, but never sooner than mininterval and
+    never later than maxinterval seconds. Products where nothing changed
+    back off, their interval grows by backoff every time, and so do those
+    that failed.
+
+    A bounded number of worker threads, each with its own copy of the
+    database (see Database.clone), takes due products, the ones that change
+    the most first. Products we don't have yet are downloaded, the others
+    only updated. Jobs are saved to the database as metadata after every
+    synchronization, so a restarted scheduler carries on where it stopped.
+    """
+    #private:
+    _kind = 'schedule'
+
+    def __init__(self, bugdb, products=None, workers=4, target=10,
+                 mininterval=300, maxinterval=86400, backoff=2.0,
+                 smoothing=0.3):
+        if workers < 1:
+            raise ValueError("You must use at least one worker!")
+
+        self.bugdb = bugdb
+        self.workers = workers
+        self.target = target
+        self.mininterval = mininterval
+        self.maxinterval = maxinterval
+        self.backoff = backoff
+        self.smoothing = smoothing
+
+        self._jobs = {}
+        self._waiting = []
+        self._ready = []
+        self._condition = threading.Condition()
+        self._stopped = True
+        self._threads = []
+
+        if products is None:
+            products = bugdb.db.getListOfProducts()
+        for product in products:
+            self.addProduct(product)
+
+    #private:
+    def _newJob(self):
+        return {'last_sync': None, 'next_sync': time.time(),
+                'interval': self.mininterval, 'rate': 0.0, 'syncs': 0,
+                'changes': 0, 'failures': 0, 'error': None}
+
+    def _push(self, product):
+        heapq.heappush(self._waiting, (self._jobs[product]['next_sync'],
+                                       product))
+        self._condition.notify()
+
+    def _take(self):
+        """ Waits until a product is due and returns it, or returns None once
+        the scheduler is stopped. Of all due products, the one that changes
+        the most is taken.
+        """
+        with self._condition:
+            while not self._stopped:
+                now = time.time()
+                while self._waiting and self._waiting[0][0] <= now:
+                    due, product = heapq.heappop(self._waiting)
+                    heapq.heappush(self._ready, (-self._jobs[product]['rate'],
+                                                 due, product))
+                if self._ready:
+                    return heapq.heappop(self._ready)[2]
+
+                timeout = None
+                if self._waiting:
+                    timeout = self._waiting[0][0] - now
+                self._condition.wait(timeout)
+
+        return None
+
+    def _reschedule(self, job, changed, now, error=None):
+        """ Works out when a product is due next, given the number of bugs
+        that changed since it was synchronized, or the error it failed with.
+        """
+        if error is not None:
+            job['failures'] += 1
+            job['error'] = error
+            interval = job['interval'] * self.backoff
+        else:
+            if job['last_sync'] is None:
+                # the first sync downloads the whole product, which tells
+                # nothing about how often it changes, so the interval stays
+                # as it is until the next sync does
+                interval = job['interval']
+            else:
+                elapsed = max(now - job['last_sync'], 1.0)
+                job['rate'] = (self.smoothing * changed * 3600.0 / elapsed +
+                               (1 - self.smoothing) * job['rate'])
+
+                if job['rate'] > 0:
+                    interval = self.target * 3600.0 / job['rate']
+                else:
+                    interval = job['interval'] * self.backoff
+                if not changed:
+                    interval = max(interval, job['interval'] * self.backoff)
+
+            job['last_sync'] = now
+            job['syncs'] += 1
+            job['changes'] += changed
+            job['failures'] = 0
+            job['error'] = None
+
+        job['interval'] = min(max(interval, self.mininterval),
+                              self.maxinterval)
+        job['next_sync'] = now + job['interval']
+
+    def _sync(self, database, product):
+        """ Downloads or updates a product and returns the number of bugs
+        that changed, or raises an error.
+        """
+        with database.metrics.phase('scheduled_sync'):
+            if product not in database.getListOfProducts():
+                database.downloadProductBugs(product, strict=True)
+                return database.getProductStatistics(product)['num_of_bugs']
+
+            changed = database.updateProductBugs(product)
+
+        database.metrics.count('bugs_updated', changed)
+        return changed
+
+    def _work(self):
+        database = self.bugdb.db.clone()
+
+        while True:
+            product = self._take()
+            if product is None:
+                return
+
+            with self._condition:
+                if product not in self._jobs:
+                    continue
+                job = dict(self._jobs[product])
+
+            try:
+                changed = self._sync(database, product)
+                self._reschedule(job, changed, time.time())
+            except Exception as e:
+                self._reschedule(job, 0, time.time(),
+                                 "%s: %s" % (type(e).__name__, e))
+
+            with self._condition:
+                if product not in self._jobs:
+                    continue
+                self._jobs[product] = job
+                self._push(product)
+            database.saveMetadata(self._kind, product, job)
+
+    #public:
+    def addProduct(self, product):
+        """ Starts keeping a product fresh. Its job is loaded from the
+        database, if it was saved before, otherwise it is due right away.
+        """
+        product = str(product)
+        job = self.bugdb.db.loadMetadata(self._kind, product)
+
+        with self._condition:
+            if product in self._jobs:
+                return
+            self._jobs[product] = job or self._newJob()
+            self._push(product)
+
+    def removeProduct(self, product):
+        """ Stops keeping a product fresh. If it is being synchronized right
+        now, that synchronization is finished.
+        """
+        product = str(product)
+
+        with self._condition:
+            self._jobs.pop(product, None)
+            self._waiting = [entry for entry in self._waiting
+                             if entry[1] != product]
+            self._ready = [entry for entry in self._ready
+                           if entry[2] != product]
+            heapq.heapify(self._waiting)
+            heapq.heapify(self._ready)
+
+    def getJobs(self):
+        """ Returns a copy of every product's job """
+        with self._condition:
+            return dict((product, dict(job)) for product, job in
+                        self._jobs.items())
+
+    def start(self):
+        """ Starts worker threads and returns right away """
+        with self._condition:
+            if not self._stopped:
+                return
+            self._stopped = False
+
+        self._threads = []
+        for i in range(self.workers):
+            t = threading.Thread(target=self._work)
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        """ Stops worker threads, once they finish what they are doing """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def run(self, seconds=None):
+        """ Keeps products fresh for given number of seconds, or until
+        interrupted.
+        """
+        self.start()
+        try:
+            end = time.time() + (seconds or 0)
+            while seconds is None or time.time() < end:
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
@@ -0,0 +1,276 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import itertools
+import re
+import sqlite3
+import threading
+
+from .base import timeString
+
+
+class SearchIndex(object):
+    """ Full-text and field index over bugs of all products, whatever
+    database they are kept in.
+
+    Index is a SQLite file. Every bug is a row of a table with a column for
+    each of the fields we filter and count by, and its text fields are
+    indexed for full-text search with FTS5, which ranks matches with BM25.
+    Summary weighs the most, then component and product.
+
+    Databases add bugs to the index as they write them (see
+    Database.setIndex), so it is always as fresh as the databases are.
+    Bugs are matched by product and id, so a bug that is written again
+    replaces its old copy. Index is shared by all copies of a database, so
+    it can be written by many threads.
+    """
+    #private:
+    _batchSize = 1000
+    _textColumns = ['summary', 'component', 'product', 'status', 'severity',
+                    'resolution', 'assigned_to']
+    _weights = [4.0, 2.0, 2.0, 1.0, 1.0, 1.0, 1.0]
+    _columns = ['product', 'id', 'severity', 'status', 'resolution',
+                'priority', 'component', 'assigned_to', 'is_open',
+                'creation_time', 'last_change_time', 'summary']
+    _indexedColumns = ['severity', 'status', 'component', 'resolution',
+                       'priority', 'assigned_to', 'last_change_time']
+    _timeFields = ['creation_time', 'last_change_time']
+
+    #public:
+    fields = _columns[1:]
+    facets = ['product', 'severity', 'status', 'component']
+
+    def __init__(self, path='./search.sqlite'):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS bugs (rowid INTEGER PRIMARY KEY, %s, "
+            "UNIQUE (product, id))" % ", ".join(self._columns))
+        for column in self._indexedColumns:
+            self.conn.execute("CREATE INDEX IF NOT EXISTS bugs_%s ON bugs "
+                              "(%s)" % (column, column))
+
+        # full-text index holds no text of its own, it reads it from bugs
+        # table, and triggers keep it in step with that table
+        self.conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS text USING fts5(%s, "
+            "content='bugs', content_rowid='rowid')" %
+            ", ".join(self._textColumns))
+        columns = ", ".join(self._textColumns)
+        new = ", ".join("new." + column for column in self._textColumns)
+        old = ", ".join("old." + column for column in self._textColumns)
+        self.conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS bugs_insert AFTER INSERT ON bugs "
+            "BEGIN INSERT INTO text (rowid, %s) VALUES (new.rowid, %s); END"
+            % (columns, new))
+        self.conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS bugs_delete AFTER DELETE ON bugs "
+            "BEGIN INSERT INTO text (text, rowid, %s) VALUES "
+            "('delete', old.rowid, %s); END" % (columns, old))
+        # bugs that matched the text of the latest search, so facets
+        # are counted without matching it again for every one of them
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS matched "
+                          "(id INTEGER PRIMARY KEY)")
+        self.conn.commit()
+
+    #private:
+    def _row(self, product, bug):
+        row = [str(product)]
+        for column in self._columns[1:]:
+            value = bug.get(column)
+            if value is None:
+                pass
+            elif column in self._timeFields:
+                value = timeString(value)
+            elif column == 'is_open':
+                value = int(value)
+            row.append(value)
+
+        return row
+
+    def _match(self, text):
+        """ Turns text we search for into an FTS5 query that matches bugs
+        which have all of its words. Words are quoted, so punctuation in
+        them is never taken for FTS5 syntax, and a word that ends with *
+        matches every word that starts with it.
+        """
+        terms = []
+        for word in text.split():
+            prefix = word.endswith('*')
+            word = word.rstrip('*')
+            if not re.search(r'\w', word, re.UNICODE):
+                continue
+            term = '"%s"' % word.replace('"', '""')
+            terms.append(term + '*' if prefix else term)
+
+        return " ".join(terms)
+
+    def _where(self, filters):
+        """ Returns SQL conditions and their parameters that select bugs
+        which match filters, see search.
+        """
+        conditions = []
+        params = []
+
+        for field, condition in (filters or {}).items():
+            if field not in self._columns:
+                raise ValueError("Bugs can't be filtered by %s!" % field)
+
+            def _value(value):
+                if field in self._timeFields:
+                    return timeString(value)
+                elif field == 'is_open':
+                    return int(value)
+                return value
+
+            if isinstance(condition, tuple):
+                start, end = condition
+                conditions.append("bugs.%s IS NOT NULL" % field)
+                if start is not None:
+                    conditions.append("bugs.%s >= ?" % field)
+                    params.append(_value(start))
+                if end is not None:
+                    conditions.append("bugs.%s < ?" % field)
+                    params.append(_value(end))
+            elif isinstance(condition, list):
+                conditions.append("bugs.%s IN (%s)" % (
+                    field, ", ".join("?" * len(condition))))
+                params.extend(_value(value) for value in condition)
+            else:
+                conditions.append("bugs.%s = ?" % field)
+                params.append(_value(condition))
+
+        return " AND ".join(conditions) or "1", params
+
+    #public:
+    def add(self, product, bugs):
+        """ Adds bugs of a product to the index, replacing those that are
+        already there. Bugs can be given as any iterable of dictionaries.
+        """
+        bugs = iter(bugs)
+        while True:
+            rows = [self._row(product, bug) for bug in
+                    itertools.islice(bugs, self._batchSize)]
+            if not rows:
+                break
+
+            with self._lock:
+                with self.conn:
+                    self.conn.executemany("DELETE FROM bugs WHERE product = "
+                                          "? AND id = ?",
+                                          [row[:2] for row in rows])
+                    self.conn.executemany(
+                        "INSERT INTO bugs (%s) VALUES (%s)" % (
+                            ", ".join(self._columns),
+                            ", ".join("?" * len(self._columns))), rows)
+
+    def retainBugs(self, product, ids):
+        """ Removes bugs of a product from the index, except those with
+        given ids. Ids can be given as any iterable.
+        """
+        with self._lock:
+            with self.conn:
+                self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS retained "
+                                  "(id INTEGER PRIMARY KEY)")
+                self.conn.execute("DELETE FROM retained")
+                self.conn.executemany("INSERT OR IGNORE INTO retained "
+                                      "VALUES (?)", ((i,) for i in ids))
+                self.conn.execute("DELETE FROM bugs WHERE product = ? AND "
+                                  "id NOT IN (SELECT id FROM retained)",
+                                  (str(product),))
+                self.conn.execute("DELETE FROM retained")
+
+    def removeProduct(self, product):
+        """ Removes all bugs of a product from the index """
+        with self._lock:
+            with self.conn:
+                self.conn.execute("DELETE FROM bugs WHERE product = ?",
+                                  (str(product),))
+
+    def search(self, text=None, filters=None, facets=None, limit=20,
+               offset=0):
+        """ Searches bugs of all products.
+
+        Text selects bugs that have all of its words in any of their text
+        fields, and they are ranked by how well they match. Filters narrow
+        bugs down the way query of BugzillaDB.queryProductBugs does. Without
+        text, bugs are ordered by the time of their last change, newest
+        first.
+
+        Returns a dictionary that holds total number of bugs that matched,
+        a page of those bugs, starting at offset and at most limit long,
+        with their fields and rank (smaller is better), and, for every
+        facet field, number of matched bugs that have each of its values.
+        """
+        if facets is None:
+            facets = self.facets
+        for field in facets:
+            if field not in self._columns:
+                raise ValueError("Bugs can't be counted by %s!" % field)
+
+        match = self._match(text or '')
+        where, params = self._where(filters)
+        columns = ", ".join("bugs." + column for column in self._columns)
+
+        if match:
+            sql = ("SELECT %s, bm25(text, %s) AS rank FROM text JOIN bugs ON "
+                   "bugs.rowid = text.rowid WHERE text MATCH ? AND %s "
+                   "ORDER BY rank LIMIT ? OFFSET ?" % (
+                       columns, ", ".join(str(w) for w in self._weights),
+                       where))
+            page_params = [match] + params + [limit, offset]
+        else:
+            sql = ("SELECT %s, 0 AS rank FROM bugs WHERE %s ORDER BY "
+                   "last_change_time DESC LIMIT ? OFFSET ?" % (
+                       columns, where))
+            page_params = params + [limit, offset]
+
+        result = {'total': 0, 'bugs': [],
+                  'facets': dict((field, {}) for field in facets)}
+
+        with self._lock:
+            for row in self.conn.execute(sql, page_params):
+                bug = {'rank': row[-1]}
+                for column, value in zip(self._columns, row):
+                    if value is None:
+                        continue
+                    if column == 'is_open':
+                        value = bool(value)
+                    bug[column] = value
+                result['bugs'].append(bug)
+
+            if match:
+                with self.conn:
+                    self.conn.execute("DELETE FROM temp.matched")
+                    self.conn.execute("INSERT INTO temp.matched SELECT rowid "
+                                      "FROM text WHERE text MATCH ?",
+                                      (match,))
+                where += " AND bugs.rowid IN temp.matched"
+
+            # bugs are counted by all facets at once, in a single pass
+            grouped = ", ".join(facets)
+            if facets:
+                sql = "SELECT %s, COUNT(*) FROM bugs WHERE %s GROUP BY %s" % (
+                    grouped, where, grouped)
+            else:
+                sql = "SELECT COUNT(*) FROM bugs WHERE %s" % where
+
+            for row in self.conn.execute(sql, params):
+                result['total'] += row[-1]
+                for field, value in zip(facets, row):
+                    if value is None:
+                        continue
+                    counts = result['facets'][field]
+                    counts[value] = counts.get(value, 0) + row[-1]
+
+        return result
+
+    def getStatistics(self):
+        """ Returns number of bugs in the index, for each product """
+        with self._lock:
+            return dict(self.conn.execute("SELECT product, COUNT(*) FROM "
+                                          "bugs GROUP BY product"))
@@ -0,0 +1,252 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import array
+import calendar
+import datetime
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+
+class Snapshot(object):
+    """ Compact, binary, column oriented copy of the bugs of a product.
+
+    Only the fields that analysis works with are kept, every field in its
+    own column: ids, text fields as small integer codes into a list of
+    their values (0 if a bug doesn't have that field), is_open as 1, 0 or -1
+    if unknown and times as seconds since the epoch (-1 if a bug doesn't
+    have that time).
+
+    On disk, a snapshot starts with a header that holds a magic string,
+    the format version, the number of bugs, the length of the directory
+    that follows it and CRC-32 of the directory. Directory is a JSON
+    document that tells where every column starts and ends and its CRC-32,
+    values of text fields and whatever info the owner of the snapshot keeps
+    with it. Columns follow as little-endian arrays. Loaded snapshots are
+    memory mapped and a column is read, and its CRC-32 checked, only when
+    it is asked for, so reading severities never touches the times.
+    """
+    #private:
+    _magic = 'BZSNAP'
+    _version = 2
+    _header = struct.Struct('<6sHIII')
+    _epoch = datetime.datetime(1970, 1, 1)
+
+    _textFields = ['severity', 'status', 'resolution', 'priority',
+                   'component']
+    _timeFields = ['creation_time', 'last_change_time', 'cf_last_closed']
+    _typecodes = {'id': 'i', 'is_open': 'b'}
+
+    #public:
+    fields = ['id', 'is_open'] + _textFields + _timeFields
+
+    def __init__(self, info=None):
+        self.info = info or {}
+
+        self._num = 0
+        self._columns = {}
+        self._values = {}
+        self._codes = {}
+        self._map = None
+        self._offsets = {}
+
+        for field in self._textFields:
+            self._columns[field] = array.array('H')
+            self._values[field] = [None]
+            self._codes[field] = {}
+        for field in self._timeFields:
+            self._columns[field] = array.array('d')
+        for field, typecode in self._typecodes.items():
+            self._columns[field] = array.array(typecode)
+
+    def __len__(self):
+        return self._num
+
+    #private:
+    def _typecode(self, field):
+        if field in self._textFields:
+            return 'H'
+        elif field in self._timeFields:
+            return 'd'
+
+        return self._typecodes[field]
+
+    def _code(self, field, value):
+        """ Returns the code of a value of a text field, adding the value to
+        the field's values if it's a new one.
+        """
+        if value is None:
+            return 0
+
+        codes = self._codes[field]
+        code = codes.get(value)
+        if code is None:
+            values = self._values[field]
+            if len(values) > 0xffff:
+                raise ValueError("Too many values of %s!" % field)
+            code = codes[value] = len(values)
+            values.append(value)
+
+        return code
+
+    def _seconds(self, value):
+        if value is None:
+            return -1
+
+        return calendar.timegm(value.timetuple())
+
+    #public:
+    def column(self, field):
+        """ Returns a column as an array. Columns of a loaded snapshot are
+        read from the file when they are first asked for. Raises ValueError
+        if the column is damaged.
+        """
+        if field not in self._offsets:
+            return self._columns[field]
+
+        start, end, checksum = self._offsets[field]
+        data = self._map[start:end]
+        if zlib.crc32(data) & 0xffffffff != checksum:
+            raise ValueError("Column %s of the snapshot is damaged!" % field)
+        del self._offsets[field]
+
+        column = array.array(self._typecode(field))
+        column.fromstring(data)
+        if sys.byteorder != 'little':
+            column.byteswap()
+        self._columns[field] = column
+
+        return column
+
+    def values(self, field):
+        """ Returns values of a text field, indexed by their codes """
+        return self._values[field]
+
+    def append(self, bugs):
+        """ Adds bugs, given as dictionaries whose times are datetime
+        objects, to the snapshot.
+        """
+        for field in self._offsets.keys():
+            self.column(field)
+
+        for bug in bugs:
+            self._columns['id'].append(int(bug.get('id', -1)))
+
+            is_open = bug.get('is_open')
+            if isinstance(is_open, basestring):
+                is_open = is_open == 'True'
+            self._columns['is_open'].append(-1 if is_open is None
+                                            else int(is_open))
+
+            for field in self._textFields:
+                self._columns[field].append(self._code(field,
+                                                       bug.get(field)))
+            for field in self._timeFields:
+                self._columns[field].append(self._seconds(bug.get(field)))
+
+            self._num += 1
+
+    def records(self, fields):
+        """ Yields bugs one by one as dictionaries that hold given fields,
+        as XMLDatabase would read them. Fields a bug doesn't have are left
+        out.
+        """
+        columns = [(field, self.column(field), self._values.get(field))
+                   for field in fields]
+
+        for i in xrange(self._num):
+            record = {}
+            for field, column, values in columns:
+                value = column[i]
+                if values is not None:
+                    if value:
+                        record[field] = values[value]
+                elif value >= 0:
+                    if field == 'id':
+                        record[field] = value
+                    elif field == 'is_open':
+                        record[field] = bool(value)
+                    else:
+                        record[field] = self._epoch + datetime.timedelta(
+                            seconds=value)
+            yield record
+
+    def save(self, path):
+        """ Writes snapshot to a file. It is first written to a temporary
+        file which is then renamed, so a crash never leaves a half-written
+        snapshot behind.
+        """
+        offsets = {}
+        chunks = []
+        position = 0
+        for field in self.fields:
+            column = self.column(field)
+            if sys.byteorder != 'little':
+                column = array.array(column.typecode, column)
+                column.byteswap()
+            data = column.tostring()
+            offsets[field] = [position, position + len(data),
+                              zlib.crc32(data) & 0xffffffff]
+            # columns start at multiples of 8, for any tool that maps them
+            data += '\0' * (-len(data) % 8)
+            chunks.append(data)
+            position += len(data)
+
+        directory = json.dumps({'columns': offsets,
+                                'values': dict((field, self._values[field])
+                                               for field in self._textFields),
+                                'info': self.info})
+        directory += ' ' * (-(len(directory) + self._header.size) % 8)
+
+        checksum = zlib.crc32(directory)
+
+        with open(path + ".tmp", 'wb') as f:
+            f.write(self._header.pack(self._magic, self._version, self._num,
+                                      len(directory),
+                                      checksum & 0xffffffff))
+            f.write(directory)
+            for data in chunks:
+                f.write(data)
+        os.rename(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        """ Maps a snapshot file into memory and returns the snapshot, or
+        None if there is no file, or it was written by another version of
+        this format, or its directory is damaged. Columns are checked when
+        they are read, see column.
+        """
+        try:
+            with open(path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size < cls._header.size:
+                    return None
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError):
+            return None
+
+        magic, version, num, length, checksum = cls._header.unpack(
+            data[:cls._header.size])
+        if magic != cls._magic or version != cls._version:
+            return None
+
+        start = cls._header.size + length
+        if zlib.crc32(data[cls._header.size:start]) & 0xffffffff != checksum:
+            return None
+
+        directory = json.loads(data[cls._header.size:start])
+        snapshot = cls(directory['info'])
+        snapshot._num = num
+        snapshot._map = data
+        for field, (begin, end, crc) in directory['columns'].items():
+            snapshot._offsets[field] = (start + begin, start + end, crc)
+        for field, values in directory['values'].items():
+            snapshot._values[field] = values
+            snapshot._codes[field] = dict((value, code) for code, value in
+                                          enumerate(values) if code)
+
+        return snapshot
@@ -0,0 +1,142 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import array
+import calendar
+import itertools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class BugTable(object):
+    """ Compact, column oriented table of bugs held in memory.
+
+    Only the fields that analysis needs are loaded, and every field is kept
+    in its own array: products and severities as small integer codes, times
+    as seconds since the epoch (-1 if a bug doesn't have that time) and
+    is_open as 1, 0 or -1 if unknown. Bugs are loaded one by one and never
+    kept around as dictionaries, so many products fit into one process.
+
+    If NumPy is installed, counting and scoring are done with vectorized
+    operations over those arrays, otherwise with plain loops.
+    """
+    #private:
+    _timeFields = ['creation_time', 'last_change_time', 'cf_last_closed']
+
+    #public:
+    fields = ['id', 'severity', 'is_open'] + _timeFields
+
+    def __init__(self, severities):
+        self.severities = list(severities)
+        self.products = []
+
+        self._severityCodes = dict((severity, code) for code, severity
+                                   in enumerate(self.severities))
+
+        self.product = array.array('i')
+        self.id = array.array('i')
+        self.severity = array.array('b')
+        self.is_open = array.array('b')
+        for field in self._timeFields:
+            setattr(self, field, array.array('l'))
+
+    def __len__(self):
+        return len(self.id)
+
+    #private:
+    def _column(self, name):
+        """ Returns a column as a NumPy array that shares memory with our
+        array, or the array itself if there is no NumPy.
+        """
+        column = getattr(self, name)
+        if numpy is None:
+            return column
+        if len(column) == 0:
+            return numpy.zeros(0, dtype=column.typecode)
+
+        return numpy.frombuffer(column, dtype=column.typecode)
+
+    def _countMatrix(self):
+        """ Returns number of bugs of each severity for each product, as
+        a list of rows, one for each product. Last column counts bugs with
+        unknown severity.
+        """
+        width = len(self.severities) + 1
+
+        if numpy is None:
+            counts = [[0] * width for p in self.products]
+            # unknown severity is -1, which is the last column
+            for product, severity in itertools.izip(self.product,
+                                                    self.severity):
+                counts[product][severity] += 1
+            return counts
+
+        cells = (self._column('product').astype(numpy.int64) * width +
+                 self._column('severity').astype(numpy.int64) % width)
+        counts = numpy.bincount(cells, minlength=len(self.products) * width)
+
+        return counts.reshape(len(self.products), width).tolist()
+
+    #public:
+    def load(self, database, product):
+        """ Loads bugs of a product from a database, which can be either
+        BugzillaDB or a concrete database.
+        """
+        code = len(self.products)
+        self.products.append(str(product))
+
+        for bug in database.queryProductBugs(product, fields=self.fields):
+            self.product.append(code)
+            self.id.append(bug.get('id', -1))
+            self.severity.append(self._severityCodes.get(bug.get('severity'),
+                                                         -1))
+
+            is_open = bug.get('is_open')
+            self.is_open.append(-1 if is_open is None else int(is_open))
+
+            for field in self._timeFields:
+                value = bug.get(field)
+                if value is None:
+                    getattr(self, field).append(-1)
+                else:
+                    getattr(self, field).append(
+                        calendar.timegm(value.timetuple()))
+
+    def countsByProduct(self):
+        """ Returns number of bugs of each severity for every product """
+        counts = {}
+        for product, row in zip(self.products, self._countMatrix()):
+            counts[product] = dict(zip(self.severities, row))
+
+        return counts
+
+    def countBugsByType(self, product=None):
+        """ Returns number of bugs of each severity for a product, or for all
+        products together if none is given.
+        """
+        if product is not None:
+            return self.countsByProduct()[str(product)]
+
+        totals = [0] * len(self.severities)
+        for row in self._countMatrix():
+            for i in range(len(self.severities)):
+                totals[i] += row[i]
+
+        return dict(zip(self.severities, totals))
+
+    def scores(self, weights):
+        """ Returns score of every product, given weights of severities """
+        vector = [weights[severity] for severity in self.severities]
+        rows = self._countMatrix()
+
+        if numpy is None or not rows:
+            values = [sum(c * w for c, w in zip(row, vector))
+                      for row in rows]
+        else:
+            matrix = numpy.array(rows)[:, :len(vector)]
+            values = matrix.dot(numpy.array(vector, dtype=float)).tolist()
+
+        return dict(zip(self.products, values))
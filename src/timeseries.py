@@ -0,0 +1,179 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import datetime
+
+from .base import parseTime, timeString
+
+
+class TimeSeriesAnalyzer(object):
+    """ Computes how quality of products changes over time.
+
+    Bugs are put into windows, weeks or months, by the time they were
+    created and by the time they were closed. For every window we keep, in
+    total and by severity, number of opened and closed bugs and time it took
+    to close them. Open backlog and mean time to close are derived from that.
+
+    Windows are stored in the database as product's metadata, together with
+    the time of the latest creation or closure we have seen. Next time only
+    windows from that time on are computed again, from bugs created or closed
+    since, so history is never read twice. A bug that gets reopened after it
+    was counted as closed stays counted in the window it was closed in.
+    """
+    #private:
+    _version = 1
+    _periods = ['week', 'month']
+
+    def __init__(self, database, period='week'):
+        if period not in self._periods:
+            raise ValueError("Period must be one of: %s" %
+                             ", ".join(self._periods))
+
+        self.db = database
+        self.period = period
+
+    #private:
+    def _windowStart(self, time):
+        day = time.date()
+        if self.period == 'week':
+            return day - datetime.timedelta(days=day.weekday())
+
+        return day.replace(day=1)
+
+    def _nextWindow(self, day):
+        if self.period == 'week':
+            return day + datetime.timedelta(days=7)
+
+        if day.month == 12:
+            return day.replace(year=day.year + 1, month=1)
+
+        return day.replace(month=day.month + 1)
+
+    def _window(self, windows, time):
+        key = self._windowStart(time).isoformat()
+        if key not in windows:
+            windows[key] = {'opened': {}, 'closed': {}, 'close_seconds': {}}
+
+        return windows[key]
+
+    def _add(self, counts, severity, value):
+        counts[severity] = counts.get(severity, 0) + value
+
+    #public:
+    def update(self, product):
+        """ Brings windows of a product up to date and returns them """
+        product = str(product)
+        state = self.db.db.loadMetadata('timeseries', product)
+
+        if (state is None or state.get('version') != self._version or
+                state.get('period') != self.period):
+            state = {'version': self._version, 'period': self.period,
+                     'newest': '', 'windows': {}}
+
+        windows = state['windows']
+        since = None
+
+        if state['newest']:
+            # window that holds the newest time we have seen may have been
+            # incomplete, so it is computed again, with everything after it
+            since = datetime.datetime.combine(
+                self._windowStart(parseTime(state['newest'])),
+                datetime.time())
+            start = since.date().isoformat()
+            for key in windows.keys():
+                if key >= start:
+                    del windows[key]
+
+        newest = state['newest']
+        fields = ['severity', 'creation_time', 'cf_last_closed', 'is_open']
+
+        query = None if since is None else {'creation_time': (since, None)}
+        for bug in self.db.queryProductBugs(product, fields=fields,
+                                            query=query):
+            window = self._window(windows, bug['creation_time'])
+            self._add(window['opened'], bug.get('severity', 'unknown'), 1)
+            newest = max(newest, timeString(bug['creation_time']))
+
+        query = {'cf_last_closed': (since, None)}
+        for bug in self.db.queryProductBugs(product, fields=fields,
+                                            query=query):
+            if bug.get('is_open'):
+                continue
+
+            closed = bug['cf_last_closed']
+            window = self._window(windows, closed)
+            severity = bug.get('severity', 'unknown')
+            self._add(window['closed'], severity, 1)
+            if 'creation_time' in bug:
+                elapsed = closed - bug['creation_time']
+                self._add(window['close_seconds'], severity,
+                          elapsed.days*86400 + elapsed.seconds)
+            newest = max(newest, timeString(closed))
+
+        state['newest'] = newest
+        self.db.db.saveMetadata('timeseries', product, state)
+
+        return state
+
+    def getSeries(self, product):
+        """ Returns quality of a product over time, as a list with a row for
+        every window from the first bug until now. Every row holds the start
+        of the window, number of opened and closed bugs, number of bugs that
+        were open at the end of the window, mean time to close in seconds
+        (None if no bug was closed) and all of that by severity as well.
+        """
+        windows = self.update(product)['windows']
+        if not windows:
+            return []
+
+        severities = set()
+        for window in windows.values():
+            severities.update(window['opened'])
+            severities.update(window['closed'])
+
+        def _row(window, backlog, severity=None):
+            if severity is None:
+                opened = sum(window['opened'].values()) if window else 0
+                closed = sum(window['closed'].values()) if window else 0
+                seconds = sum(window['close_seconds'].values()) if window \
+                    else 0
+            else:
+                opened = window['opened'].get(severity, 0) if window else 0
+                closed = window['closed'].get(severity, 0) if window else 0
+                seconds = window['close_seconds'].get(severity, 0) \
+                    if window else 0
+
+            backlog += opened - closed
+            row = {'opened': opened, 'closed': closed, 'backlog': backlog,
+                   'mean_time_to_close': None}
+            if closed:
+                row['mean_time_to_close'] = seconds/float(closed)
+
+            return row
+
+        series = []
+        backlogs = dict.fromkeys(severities, 0)
+        backlog = 0
+
+        day = datetime.date(*map(int, min(windows).split('-')))
+        last = self._windowStart(datetime.datetime.now())
+        last = max(last, datetime.date(*map(int, max(windows).split('-'))))
+
+        while day <= last:
+            window = windows.get(day.isoformat())
+
+            row = _row(window, backlog)
+            backlog = row['backlog']
+            row['window'] = day.isoformat()
+            row['by_severity'] = {}
+
+            for severity in severities:
+                row['by_severity'][severity] = _row(window,
+                                                    backlogs[severity],
+                                                    severity)
+                backlogs[severity] = row['by_severity'][severity]['backlog']
+
+            series.append(row)
+            day = self._nextWindow(day)
+
+        return series
@@ -0,0 +1,152 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import httplib
+import threading
+import time
+import urlparse
+import xmlrpclib
+
+from pyzilla import BugZilla
+
+from .metrics import nullMetrics
+
+
+class Transport(object):
+    """ Makes clients that databases use to talk to Bugzilla.
+
+    This is a base class, it makes plain PyZilla clients. Derived classes
+    can change how requests get to Bugzilla, e.g. to reuse connections or
+    to talk to a stub server in benchmarks. Every client a transport makes
+    is used by a single thread, while the transport itself is shared by all
+    copies of a database.
+
+    Transports record requests they make in metrics they are given by the
+    database, see Database.setMetrics.
+    """
+    metrics = nullMetrics
+
+    def connect(self, url):
+        """ Returns a new client for Bugzilla at url """
+        return BugZilla(url, verbose=False)
+
+    def setMetrics(self, metrics):
+        self.metrics = metrics
+
+    def getStatistics(self):
+        """ Returns what the transport knows about requests it made """
+        return {}
+
+
+class HTTPTransport(Transport):
+    """ Talks to Bugzilla over persistent HTTP connections.
+
+    Every client keeps its connection open between requests, so TLS
+    handshake is paid once per client instead of once per request.
+    Responses are asked for gzipped and requests bigger than compress bytes
+    are gzipped as well, if compress is set (not every Bugzilla accepts
+    gzipped requests). Every request times out after
+    timeout seconds, and if rate is set, all clients together make at most
+    that many requests per second.
+    """
+    def __init__(self, timeout=60, rate=0, compress=None):
+        self.timeout = timeout
+        self.rate = rate
+        self.compress = compress
+
+        self._lock = threading.Lock()
+        self._nextRequest = 0.0
+        self._statistics = {'requests': 0, 'connections': 0,
+                            'bytes_sent': 0, 'bytes_received': 0,
+                            'throttled_seconds': 0.0}
+
+    #private:
+    def _count(self, name, value=1):
+        with self._lock:
+            self._statistics[name] += value
+        self.metrics.count('transport_' + name, value)
+
+    def _throttle(self):
+        """ Waits until the next request is allowed by the rate """
+        if not self.rate:
+            return
+
+        with self._lock:
+            now = time.time()
+            start = max(now, self._nextRequest)
+            self._nextRequest = start + 1.0 / self.rate
+            self._statistics['throttled_seconds'] += start - now
+
+        if start > now:
+            self.metrics.count('transport_throttled_seconds', start - now)
+            time.sleep(start - now)
+
+    #public:
+    def connect(self, url):
+        https = urlparse.urlparse(url).scheme == 'https'
+        return xmlrpclib.ServerProxy(url, _XMLRPCTransport(self, https))
+
+    def getStatistics(self):
+        with self._lock:
+            return dict(self._statistics)
+
+
+class _CountingResponse(object):
+    """ Wraps HTTP response and counts bytes that are read from it """
+    def __init__(self, response, transport):
+        self._response = response
+        self._transport = transport
+
+    def read(self, *args):
+        data = self._response.read(*args)
+        self._transport._count('bytes_received', len(data))
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+class _XMLRPCTransport(xmlrpclib.Transport):
+    """ XML-RPC transport of a single client of HTTPTransport """
+    def __init__(self, transport, https):
+        xmlrpclib.Transport.__init__(self)
+        self.encode_threshold = transport.compress
+        self._transport = transport
+        self._https = https
+
+    def make_connection(self, host):
+        if self._connection and host == self._connection[0]:
+            return self._connection[1]
+
+        chost, self._extra_headers, x509 = self.get_host_info(host)
+        if self._https:
+            connection = httplib.HTTPSConnection(
+                chost, None, timeout=self._transport.timeout, **(x509 or {}))
+        else:
+            connection = httplib.HTTPConnection(
+                chost, timeout=self._transport.timeout)
+
+        self._transport._count('connections')
+        self._connection = host, connection
+        return connection
+
+    def request(self, host, handler, request_body, verbose=0):
+        self._transport._throttle()
+        self._transport._count('requests')
+        return xmlrpclib.Transport.request(self, host, handler, request_body,
+                                           verbose)
+
+    def send_content(self, connection, request_body):
+        connection.putheader("Content-Type", "text/xml")
+        if (self.encode_threshold is not None and
+                self.encode_threshold < len(request_body)):
+            connection.putheader("Content-Encoding", "gzip")
+            request_body = xmlrpclib.gzip_encode(request_body)
+
+        self._transport._count('bytes_sent', len(request_body))
+        connection.putheader("Content-Length", str(len(request_body)))
+        connection.endheaders(request_body)
+
+    def parse_response(self, response):
+        return xmlrpclib.Transport.parse_response(
+            self, _CountingResponse(response, self._transport))
@@ -0,0 +1,243 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+""" Benchmarks databases and analyzers against a local stub Bugzilla.
+
+Products are made up by Corpus and served by StubBugzilla, so results
+don't depend on the network or on a real Bugzilla. Every benchmark is run
+a number of times and the best and mean times are written as JSON. Results
+can be compared with those of an earlier run, e.g.
+
+    PYTHONPATH=. python test/benchmark.py --output new.json --compare old.json
+
+which exits with an error if any benchmark got slower than allowed.
+"""
+
+import argparse
+import copy
+import datetime
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from src.base import BugzillaDB, MongoDatabase, SQLiteDatabase, XMLDatabase
+from src.analyzer import Analyzer, MongoAnalyzer, SQLiteAnalyzer, \
+    StreamAnalyzer
+from src.transport import HTTPTransport, Transport
+
+from corpus import Corpus
+from stub import StubBugzilla
+
+
+def makeDatabase(backend, url, options):
+    if options.transport == 'http':
+        transport = HTTPTransport()
+    else:
+        transport = Transport()
+
+    if backend == 'xml':
+        return XMLDatabase(url, 'benchmark', options.pagesize, transport,
+                           snapshots=options.snapshots)
+    elif backend == 'sqlite':
+        return SQLiteDatabase(url, 'benchmark', options.pagesize,
+                              transport=transport)
+    elif backend == 'mongo':
+        return MongoDatabase(url, 'benchmark', options.pagesize,
+                             transport=transport)
+
+    raise ValueError("Unknown backend: %s" % backend)
+
+
+def makeAnalyzers(backend):
+    analyzers = [('stream', StreamAnalyzer())]
+    if backend == 'mongo':
+        analyzers.append(('mongo', MongoAnalyzer()))
+    elif backend == 'sqlite':
+        analyzers.append(('sqlite', SQLiteAnalyzer()))
+
+    return analyzers
+
+
+def measure(results, backend, name, function, options, prepare=None):
+    """ Runs function the given number of times and records its best and
+    mean time. If prepare is given, it is called before every run and isn't
+    timed.
+    """
+    times = []
+    for i in range(options.repeat):
+        if prepare is not None:
+            prepare()
+        start = time.time()
+        function()
+        times.append(time.time() - start)
+
+    result = {'backend': backend, 'benchmark': name, 'seconds': min(times),
+              'mean': sum(times) / len(times), 'runs': len(times)}
+    results.append(result)
+    print "%-8s %-50s %10.4fs" % (backend, name, result['seconds'])
+
+
+def consume(iterable):
+    for item in iterable:
+        pass
+
+
+def benchmarkBackend(backend, database, corpus, options, results):
+    bugdb = BugzillaDB(database)
+    products = sorted(corpus.products)
+
+    measure(results, backend, 'downloadProductBugs',
+            lambda: [bugdb.db.downloadProductBugs(p, strict=True)
+                     for p in products], options)
+
+    def change():
+        for p in products:
+            corpus.changeProduct(p, options.changed, options.new)
+
+    measure(results, backend, 'updateProductBugs',
+            lambda: [bugdb.updateProductBugs(p) for p in products], options,
+            change)
+
+    measure(results, backend, 'queryProductBugs(lazy)',
+            lambda: [consume(bugdb.queryProductBugs(p, lazy=True))
+                     for p in products], options)
+    measure(results, backend, 'queryProductBugs(fields)',
+            lambda: [consume(bugdb.queryProductBugs(
+                p, fields=['severity', 'creation_time']))
+                     for p in products], options)
+    measure(results, backend, 'queryProductBugs(query)',
+            lambda: [consume(bugdb.queryProductBugs(
+                p, fields=['id'], query={'severity': ['critical', 'blocker'],
+                                         'is_open': True}))
+                     for p in products], options)
+
+    for name, analyzer in makeAnalyzers(backend):
+        for cached in [False, True]:
+            an = Analyzer(bugdb, analyzer, cached)
+            prefix = "%s%s." % (name, '(cached)' if cached else '')
+
+            for method in ['calculateProductScore', 'getNumberOfBugs',
+                           'getNumberOfBugsByType', 'getProductStatistics',
+                           'plotProductSeverityDistribution']:
+                measure(results, backend, prefix + method,
+                        lambda: [getattr(an, method)(p) for p in products],
+                        options)
+
+            measure(results, backend, prefix + 'cmpTwoProducts',
+                    lambda: an.cmpTwoProducts(products[0], products[-1]),
+                    options)
+            measure(results, backend, prefix + 'rankProducts',
+                    lambda: an.rankProducts(products), options)
+            measure(results, backend, prefix + 'loadBugTable',
+                    lambda: an.loadBugTable(products), options)
+
+    if backend == 'mongo':
+        bugdb.db.client.drop_database('benchmark')
+
+
+def compare(results, path, tolerance, noise):
+    """ Prints benchmarks that got slower than tolerance allows compared to
+    results in a file and returns their number. Benchmarks that got slower
+    by less than noise seconds are never counted, they are too fast to tell.
+    """
+    with open(path) as f:
+        baseline = json.load(f)
+
+    best = {}
+    for result in baseline['results']:
+        best[(result['backend'], result['benchmark'])] = result['seconds']
+
+    regressions = 0
+    for result in results:
+        key = (result['backend'], result['benchmark'])
+        if key not in best:
+            continue
+        if (result['seconds'] > best[key] * (1 + tolerance) and
+                result['seconds'] - best[key] > noise):
+            regressions += 1
+            print "Regression: %s %s took %.4fs instead of %.4fs." % (
+                key[0], key[1], result['seconds'], best[key])
+
+    print "%d regressions found." % regressions
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument('--products', type=int, default=3)
+    parser.add_argument('--bugs', type=int, default=2000,
+                        help="number of bugs of the biggest product")
+    parser.add_argument('--changed', type=int, default=50,
+                        help="bugs changed in every product before update")
+    parser.add_argument('--new', type=int, default=20,
+                        help="bugs created in every product before update")
+    parser.add_argument('--pagesize', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--backends', default='xml,sqlite,mongo')
+    parser.add_argument('--transport', choices=['http', 'pyzilla'],
+                        default='http')
+    parser.add_argument('--snapshots', action='store_true',
+                        help="keep binary snapshots of XML products")
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--compare', help="results of an earlier run")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown when comparing, 0.25 is 25%%")
+    parser.add_argument('--noise', type=float, default=0.005,
+                        help="slowdown in seconds that is always allowed")
+    options = parser.parse_args()
+
+    corpus = Corpus(options.seed)
+    for i in range(options.products):
+        # products get smaller and smaller, like real ones do
+        corpus.makeProduct("product%d" % i, max(options.bugs >> i, 1))
+
+    stub = StubBugzilla(corpus)
+    url = stub.start()
+
+    output = os.path.abspath(options.output)
+    workdir = tempfile.mkdtemp(prefix='benchmark')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+
+    results = []
+    try:
+        for backend in options.backends.split(','):
+            try:
+                database = makeDatabase(backend, url, options)
+            except Exception as e:
+                print "Skipping %s: %s" % (backend, e)
+                continue
+
+            # every backend starts from the same products
+            snapshot = copy.deepcopy(corpus.products)
+            benchmarkBackend(backend, database, corpus, options, results)
+            corpus.products = snapshot
+
+            # closes connections to the stub, so it can be stopped
+            database = None
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+        stub.stop()
+
+    report = {'time': datetime.datetime.now().isoformat(),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'options': vars(options),
+              'results': results}
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print "Results written to %s." % output
+
+    if options.compare and compare(results, options.compare,
+                                   options.tolerance, options.noise):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
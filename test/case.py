@@ -0,0 +1,82 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import contextlib
+import os
+import shutil
+import tempfile
+import unittest
+
+import src.base
+
+from corpus import Corpus
+from stub import StubBugzilla
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupt(database, pages):
+    """ Makes searches of a database fail with Interrupted after a number
+    of pages.
+    """
+    search = database._searchBugs
+    calls = []
+
+    def interrupted(query):
+        if len(calls) == pages:
+            raise Interrupted("Download interrupted.")
+        calls.append(query)
+        return search(query)
+
+    database._searchBugs = interrupted
+
+
+@contextlib.contextmanager
+def mockMongo():
+    """ Makes MongoDatabase use mongomock, with one store shared by all
+    clients, the way they would share a server.
+    """
+    store = mongomock.store.ServerStore()
+    client = src.base.MongoClient
+    src.base.MongoClient = lambda: mongomock.MongoClient(_store=store)
+    try:
+        yield
+    finally:
+        src.base.MongoClient = client
+
+
+class StubTestCase(unittest.TestCase):
+    """ Test that runs in its own directory against a stub Bugzilla which
+    serves products of a Corpus. Products are made in setUp, from the
+    products dictionary, which maps them to their numbers of bugs.
+    """
+    #private:
+    products = {}
+    seed = 1
+
+    def setUp(self):
+        self.corpus = Corpus(seed=self.seed)
+        for product, num_of_bugs in sorted(self.products.items()):
+            self.corpus.makeProduct(product, num_of_bugs)
+        self.stub = StubBugzilla(self.corpus)
+        self.url = self.stub.start()
+
+        self.cwd = os.getcwd()
+        self.workdir = tempfile.mkdtemp(prefix='bugzilla')
+        os.chdir(self.workdir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+        self.stub.stop()
+
+    def ids(self, product):
+        """ Returns sorted ids of product's bugs, as Bugzilla has them """
+        return sorted(bug['id'] for bug in self.corpus.products[product])
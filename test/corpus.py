@@ -0,0 +1,154 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import datetime
+import random
+import xmlrpclib
+
+
+class Corpus(object):
+    """ Synthetic Bugzilla products, for benchmarks.
+
+    Bugs have the same fields as those in test/gnome/galf.xml, with values
+    drawn from distributions that can be changed by passing a dictionary
+    that overrides some of the defaults below. Corpus is made from a seed,
+    so the same seed always makes the same bugs.
+    """
+    #private:
+    _distributions = {
+        'severity': {'normal': 55, 'major': 12, 'minor': 10, 'critical': 8,
+                     'enhancement': 8, 'trivial': 4, 'blocker': 3},
+        'open': {'NEW': 45, 'UNCONFIRMED': 30, 'ASSIGNED': 15,
+                 'REOPENED': 10},
+        'closed': {'RESOLVED': 80, 'VERIFIED': 15, 'CLOSED': 5},
+        'resolution': {'FIXED': 40, 'OBSOLETE': 20, 'DUPLICATE': 15,
+                       'INCOMPLETE': 10, 'NOTGNOME': 8, 'WONTFIX': 4,
+                       'INVALID': 3},
+        'priority': {'Normal': 80, 'High': 10, 'Low': 5, 'Urgent': 3,
+                     'Immediate': 2},
+        'components': 8,
+        'open_ratio': 0.3,
+        'start': datetime.datetime(2002, 8, 22),
+        'days': 3000,
+    }
+    _words = ['crash', 'when', 'opening', 'window', 'server', 'should',
+              'be', 'moved', 'to', 'libexec', 'display', 'launching',
+              'applications', 'second', 'appears', 'take', 'longer', 'panel',
+              'applet', 'memory', 'leak', 'in', 'preferences', 'dialog']
+
+    def __init__(self, seed=0, distributions=None):
+        self.seed = seed
+        self.distributions = dict(self._distributions)
+        self.distributions.update(distributions or {})
+        self.products = {}
+
+        self._random = random.Random(seed)
+        self._nextId = 90000
+
+    #private:
+    def _choice(self, name):
+        weights = self.distributions[name]
+        point = self._random.uniform(0, sum(weights.values()))
+        for value in sorted(weights):
+            point -= weights[value]
+            if point <= 0:
+                return value
+
+        return sorted(weights)[-1]
+
+    def _time(self, time):
+        return xmlrpclib.DateTime(time.strftime("%Y%m%dT%H:%M:%S"))
+
+    def _bug(self, product, created):
+        r = self._random
+        bugId = self._nextId
+        self._nextId += 1
+
+        severity = self._choice('severity')
+        priority = self._choice('priority')
+        component = "component %d" % r.randrange(
+            self.distributions['components'])
+        summary = " ".join(r.sample(self._words, r.randint(4, 10)))
+        is_open = r.random() < self.distributions['open_ratio']
+        changed = created + datetime.timedelta(seconds=r.randint(0, 86400 *
+                                                                 700))
+
+        if is_open:
+            status, resolution = self._choice('open'), ''
+        else:
+            status, resolution = self._choice('closed'), \
+                self._choice('resolution')
+
+        bug = {'id': bugId,
+               'product': product,
+               'severity': severity,
+               'status': status,
+               'resolution': resolution,
+               'priority': priority,
+               'component': component,
+               'summary': summary,
+               'alias': '',
+               'is_open': is_open,
+               'assigned_to': "%s-maint@gnome.bugs" % product,
+               'creation_time': self._time(created),
+               'last_change_time': self._time(changed),
+               'internals': {'bug_id': str(bugId),
+                             'product': product,
+                             'short_desc': summary,
+                             'bug_status': status,
+                             'bug_severity': severity,
+                             'priority': priority,
+                             'component': component,
+                             'resolution': resolution,
+                             'rep_platform': 'Other',
+                             'op_sys': 'All',
+                             'version': 'unspecified',
+                             'reporter_id': str(r.randint(1, 5000)),
+                             'creation_ts': created.strftime(
+                                 "%Y.%m.%d %H:%M"),
+                             'delta_ts': changed.strftime(
+                                 "%Y-%m-%d %H:%M:%S")}}
+        if not is_open:
+            bug['cf_last_closed'] = bug['last_change_time']
+
+        return bug
+
+    #public:
+    def makeProduct(self, product, num_of_bugs):
+        """ Makes a product with a given number of bugs, created one after
+        another over the days the corpus spans.
+        """
+        start = self.distributions['start']
+        step = self.distributions['days'] * 86400.0 / max(num_of_bugs, 1)
+
+        bugs = []
+        for i in range(num_of_bugs):
+            created = start + datetime.timedelta(seconds=int(i * step))
+            bugs.append(self._bug(product, created))
+
+        self.products[product] = bugs
+        return bugs
+
+    def changeProduct(self, product, changed, new):
+        """ Simulates activity on a product: given number of its bugs is
+        changed and given number of new bugs is created, all of them after
+        everything the product had so far.
+        """
+        bugs = self.products[product]
+        latest = max(datetime.datetime.strptime(bug['last_change_time'].value,
+                                                "%Y%m%dT%H:%M:%S")
+                     for bug in bugs)
+
+        for i, bug in enumerate(self._random.sample(bugs, min(changed,
+                                                              len(bugs)))):
+            bug['severity'] = self._choice('severity')
+            bug['last_change_time'] = self._time(
+                latest + datetime.timedelta(minutes=i + 1))
+
+        for i in range(new):
+            bug = self._bug(product, latest + datetime.timedelta(days=1,
+                                                                 minutes=i))
+            bug['last_change_time'] = bug['creation_time']
+            if 'cf_last_closed' in bug:
+                bug['cf_last_closed'] = bug['last_change_time']
+            bugs.append(bug)
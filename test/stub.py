@@ -0,0 +1,89 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import threading
+import SocketServer
+from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+
+class _Handler(SimpleXMLRPCRequestHandler):
+    # answer on any path, e.g. /xmlrpc.cgi, and keep connections open
+    rpc_paths = ()
+    protocol_version = 'HTTP/1.1'
+    encode_threshold = 1400
+
+
+class _Server(SocketServer.ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Bug(object):
+    def __init__(self, corpus):
+        self._corpus = corpus
+
+    def _time(self, value):
+        return str(getattr(value, 'value', value)).replace(':', '')
+
+    def search(self, query):
+        """ Supports the parameters that databases use: product, times
+        bugs were created or changed at or after, limit and offset.
+        """
+        bugs = self._corpus.products.get(query['product'], [])
+
+        for field in ['creation_time', 'last_change_time']:
+            if field in query:
+                since = self._time(query[field])
+                bugs = [bug for bug in bugs
+                        if self._time(bug[field]) >= since]
+
+        offset = query.get('offset', 0)
+        if 'limit' in query:
+            bugs = bugs[offset:offset + query['limit']]
+
+        return {'bugs': bugs}
+
+
+class _Product(object):
+    def __init__(self, corpus):
+        self._corpus = corpus
+
+    def get_selectable_products(self):
+        return {'ids': range(1, len(self._corpus.products) + 1)}
+
+    def get(self, query):
+        products = sorted(self._corpus.products)
+        return {'products': [{'id': i, 'name': products[i - 1]}
+                             for i in query['ids']]}
+
+
+class _API(object):
+    def __init__(self, corpus):
+        self.Bug = _Bug(corpus)
+        self.Product = _Product(corpus)
+
+
+class StubBugzilla(object):
+    """ Local stand-in for Bugzilla's XML-RPC interface that serves bugs of
+    a Corpus. It runs in a background thread, answers every request in its
+    own thread and gzips big responses, like a real Bugzilla behind Apache
+    would.
+    """
+    def __init__(self, corpus, host='127.0.0.1', port=0):
+        self._server = _Server((host, port), _Handler, logRequests=False,
+                               allow_none=True)
+        self._server.register_instance(_API(corpus), allow_dotted_names=True)
+        self._thread = None
+
+        self.url = "http://%s:%d/xmlrpc.cgi" % self._server.server_address
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
@@ -0,0 +1,61 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+""" Tests that analyzing many products by threads or processes gives the
+same results as analyzing them one by one, with databases given as they
+are or wrapped in BugzillaDB.
+
+    PYTHONPATH=. python test/test_analyzer.py
+"""
+
+import unittest
+
+from src.base import BugzillaDB, MongoDatabase, SQLiteDatabase, XMLDatabase
+from src.analyzer import Analyzer, MongoAnalyzer, SQLiteAnalyzer, \
+    StreamAnalyzer
+
+from case import StubTestCase, mockMongo, mongomock
+
+
+class AnalyzerTest(StubTestCase):
+    #private:
+    products = {'a': 120, 'b': 80, 'c': 40}
+
+    def _download(self, database):
+        for product in sorted(self.products):
+            database.downloadProductBugs(product, True)
+
+    def _assertModes(self, database, analyzer, modes):
+        for cached in modes:
+            an = Analyzer(database, analyzer, cached)
+            serial = an.rankProducts(sorted(self.products))
+            self.assertEqual(an.rankProducts(sorted(self.products),
+                                             workers=2), serial)
+            self.assertEqual(an.rankProducts(sorted(self.products),
+                                             processes=2), serial)
+
+    def _assertBackend(self, database, analyzer, modes=(True, False)):
+        self._download(database)
+        self._assertModes(database, analyzer, modes)
+        self._assertModes(BugzillaDB(database), analyzer, modes)
+
+    #public:
+    def testXML(self):
+        self._assertBackend(XMLDatabase(self.url, 'analyzer'),
+                            StreamAnalyzer())
+
+    def testSQLite(self):
+        self._assertBackend(SQLiteDatabase(self.url, 'analyzer'),
+                            SQLiteAnalyzer())
+
+    @unittest.skipIf(mongomock is None, "mongomock is not installed")
+    def testMongo(self):
+        # mongomock can't run aggregations the way MongoAnalyzer does, so
+        # only statistics that were saved with products are compared
+        with mockMongo():
+            self._assertBackend(MongoDatabase(self.url, 'analyzer'),
+                                MongoAnalyzer(), modes=[True])
+
+
+if __name__ == '__main__':
+    unittest.main()
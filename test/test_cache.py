@@ -0,0 +1,182 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+""" Tests that caches answer what they were given for as long as they
+should, and drop what was used least recently once they are full.
+
+    PYTHONPATH=. python test/test_cache.py
+"""
+
+import os
+import time
+import unittest
+import xmlrpclib
+
+from src.analyzer import Analyzer, SQLiteAnalyzer
+from src.base import SQLiteDatabase, XMLDatabase
+from src.cache import CachingTransport, DiskCache, ResultCache
+
+from case import StubTestCase
+
+
+class DiskCacheTest(StubTestCase):
+    #private:
+    products = {'a': 40}
+
+    _url = 'http://bugzilla.example.com/xmlrpc.cgi'
+    _response = {'bugs': [{'id': 1, 'summary': u'cr\xe2sh', 'is_open': True,
+                           'creation_time':
+                           xmlrpclib.DateTime('20020822T16:38:00')}]}
+
+    def _call(self, cache, params, method='Bug.search'):
+        calls = []
+
+        def function(*args):
+            calls.append(args)
+            return self._response
+
+        response = cache.call(self._url, method, params, function)
+        self.assertEqual(response, self._response)
+
+        return len(calls)
+
+    def _age(self, cache, params, seconds, method='Bug.search'):
+        """ Makes a cached response look older, or used longer ago """
+        ffile = cache._file(cache._key(self._url, method, params))
+        then = time.time() - seconds
+        os.utime(ffile, (then, then))
+
+    #public:
+    def testCall(self):
+        cache = DiskCache('./cache/')
+        params = ({'product': 'a', 'offset': 0},)
+        self.assertEqual(self._call(cache, params), 1)
+        self.assertEqual(self._call(cache, params), 0)
+        self.assertEqual(self._call(cache, ({'product': 'b'},)), 1)
+        self.assertEqual(cache.getStatistics(),
+                         {'hits': 1, 'misses': 2, 'evictions': 0})
+
+        # responses are on disk, so another cache finds them
+        self.assertEqual(self._call(DiskCache('./cache/'), params), 0)
+
+    def testExpiry(self):
+        cache = DiskCache('./cache/', ttls={'Bug.get': 0})
+        params = ({'product': 'a'},)
+        self._call(cache, params)
+        self._age(cache, params, 300)
+        self.assertEqual(self._call(cache, params), 0)
+        self._age(cache, params, 700)
+        self.assertEqual(self._call(cache, params), 1)
+
+        # methods without time to live are not cached
+        self.assertEqual(self._call(cache, params, 'Bug.get'), 1)
+        self.assertEqual(self._call(cache, params, 'Bug.get'), 1)
+
+    def testOffline(self):
+        params = ({'product': 'a'},)
+        self._call(DiskCache('./cache/'), params)
+        self._age(DiskCache('./cache/'), params, 7 * 86400)
+
+        cache = DiskCache('./cache/', offline=True)
+        self.assertEqual(self._call(cache, params), 0)
+        self.assertRaises(ValueError, self._call, cache, ({'product': 'b'},))
+
+    def testEviction(self):
+        cache = DiskCache('./cache/')
+        for i in range(4):
+            self._call(cache, ({'offset': i},))
+            self._age(cache, ({'offset': i},), 100 - i)
+        size = os.path.getsize(cache._file(cache._key(
+            self._url, 'Bug.search', ({'offset': 0},))))
+
+        # the oldest response was used last, so the second oldest goes
+        cache = DiskCache('./cache/', maxsize=int(4.5 * size))
+        self._call(cache, ({'offset': 0},))
+        self.assertEqual(self._call(cache, ({'offset': 4},)), 1)
+
+        self.assertEqual(cache.getStatistics()['evictions'], 1)
+        cache = DiskCache('./cache/', offline=True)
+        self.assertEqual(self._call(cache, ({'offset': 0},)), 0)
+        self.assertRaises(ValueError, self._call, cache, ({'offset': 1},))
+
+        cache.clear()
+        self.assertRaises(ValueError, self._call, cache, ({'offset': 0},))
+
+    def testTransport(self):
+        cache = DiskCache('./cache/')
+        database = XMLDatabase(self.url, 'online', 10,
+                               transport=CachingTransport(cache))
+        database.downloadProductBugs('a', True)
+        misses = cache.getStatistics()['misses']
+
+        # once Bugzilla is gone, the download can be replayed from the cache
+        self.stub.stop()
+        cache = DiskCache('./cache/', offline=True)
+        database = XMLDatabase(self.url, 'offline', 10,
+                               transport=CachingTransport(cache))
+        database.downloadProductBugs('a', True)
+        self.assertEqual(cache.getStatistics()['hits'], misses)
+        self.assertEqual(sorted(bug['id'] for bug in database.queryProductBugs(
+            'a', fields=['id'])), self.ids('a'))
+
+
+class ResultCacheTest(StubTestCase):
+    #private:
+    products = {'a': 40}
+
+    #public:
+    def testCall(self):
+        cache = ResultCache('./results/')
+        self.assertEqual(cache.get(['stats', 'a', 1]), (False, None))
+        cache.put(['stats', 'a', 1], {'bugs': [1, 2]})
+        self.assertEqual(cache.call(['stats', 'a', 1], lambda: 1 / 0),
+                         {'bugs': [1, 2]})
+        self.assertEqual(cache.call(['stats', 'a', 2], lambda: None), None)
+        self.assertEqual(cache.get(['stats', 'a', 2]), (True, None))
+
+        # whoever gets a result gets their own copy
+        found, stats = cache.get(['stats', 'a', 1])
+        stats['bugs'].append(3)
+        self.assertEqual(cache.get(['stats', 'a', 1]),
+                         (True, {'bugs': [1, 2]}))
+        self.assertEqual(cache.getStatistics(),
+                         {'hits': 4, 'misses': 2, 'evictions': 0,
+                          'disk_hits': 0})
+
+    def testDisk(self):
+        cache = ResultCache('./results/', maxentries=2)
+        for i in range(3):
+            cache.put(['stats', i], i)
+        self.assertEqual(cache.get(['stats', 0]), (True, 0))
+        self.assertEqual(cache.getStatistics()['disk_hits'], 1)
+
+        # results outlive the cache, damaged ones are missing
+        cache = ResultCache('./results/')
+        self.assertEqual(cache.get(['stats', 1]), (True, 1))
+        with open(cache._file(cache._key(['stats', 2])), 'wb') as f:
+            f.write('damaged')
+        self.assertEqual(cache.get(['stats', 2]), (False, None))
+
+        cache.clear()
+        self.assertEqual(cache.get(['stats', 1]), (False, None))
+
+    def testAnalyzer(self):
+        database = SQLiteDatabase(self.url, 'results')
+        database.downloadProductBugs('a', True)
+        cache = ResultCache('./results/')
+        an = Analyzer(database, SQLiteAnalyzer(), cached=False, cache=cache)
+
+        stats = an.getProductStatistics('a')
+        self.assertEqual(stats['num_of_bugs'], 40)
+        self.assertEqual(an.rankProducts(['a'])[0]['score'], stats['score'])
+        self.assertEqual(cache.getStatistics()['misses'], 1)
+
+        # results of a product that changed are not found again
+        self.corpus.changeProduct('a', 0, 5)
+        database.updateProductBugs('a')
+        self.assertEqual(an.getProductStatistics('a')['num_of_bugs'], 45)
+        self.assertEqual(cache.getStatistics()['misses'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+""" Tests that the change log tells what happened to bugs between
+downloads and updates of a product, whatever the database, and that it
+can be followed and summed up.
+
+    PYTHONPATH=. python test/test_changelog.py
+"""
+
+import datetime
+import random
+import unittest
+
+from src.base import MongoDatabase, SQLiteDatabase, XMLDatabase
+from src.changelog import ChangeLog
+
+from case import StubTestCase, mockMongo, mongomock
+
+
+class ChangeLogTest(StubTestCase):
+    #private:
+    def _bug(self, bugId, severity, day=1, is_open=True):
+        return {'id': bugId, 'severity': severity, 'is_open': is_open,
+                'creation_time': datetime.datetime(2010, 1, 1),
+                'last_change_time': datetime.datetime(2010, 1, day)}
+
+    def _entries(self, changelog, product='p', cursor=0):
+        return [(entry['event'], entry['id'], entry['fields'])
+                for position, entry in changelog.changes(product, cursor)]
+
+    #public:
+    def testReplace(self):
+        changelog = ChangeLog('./changes/')
+        # runs of 3 records, so most of them are sorted in temporary files
+        changelog._batchSize = 3
+        old = [self._bug(i, 'normal') for i in [9, 1, 7, 3, 5, 11, 2]]
+        self.assertEqual(changelog.record('p', [], old, replace=True), 7)
+
+        new = [self._bug(i, 'normal') for i in [4, 1, 12, 7, 2, 11]]
+        new[1] = self._bug(1, 'major', 2)
+        new[4] = self._bug(2, 'normal', 2, is_open=False)
+        random.Random(1).shuffle(new)
+        self.assertEqual(changelog.record('p', old, new, replace=True), 7)
+
+        entries = self._entries(changelog)
+        self.assertEqual(sorted(entries[:7]),
+                         [('created', i, {'severity': [None, 'normal'],
+                                          'is_open': [None, True]})
+                          for i in [1, 2, 3, 5, 7, 9, 11]])
+        self.assertEqual(entries[7:], [
+            ('changed', 1, {'severity': ['normal', 'major']}),
+            ('changed', 2, {'is_open': [True, False]}),
+            ('removed', 3, {'severity': ['normal', None],
+                            'is_open': [True, None]}),
+            ('created', 4, {'severity': [None, 'normal'],
+                            'is_open': [None, True]}),
+            ('removed', 5, {'severity': ['normal', None],
+                            'is_open': [True, None]}),
+            ('removed', 9, {'severity': ['normal', None],
+                            'is_open': [True, None]}),
+            ('created', 12, {'severity': [None, 'normal'],
+                             'is_open': [None, True]})])
+
+        self.assertEqual(changelog.distribution('p'), {'normal': 5,
+                                                       'major': 1})
+        self.assertEqual(changelog.distribution('p', field='is_open'),
+                         {True: 5, False: 1})
+        self.assertRaises(ValueError, changelog.distribution, 'p',
+                          field='summary')
+
+    def testUpdate(self):
+        changelog = ChangeLog('./changes/')
+        old = [self._bug(1, 'normal'), self._bug(2, 'normal')]
+        changelog.record('p', [], old)
+
+        # bugs that are not in an update are not removed
+        new = [self._bug(2, 'normal', 5), self._bug(3, 'minor', 6)]
+        self.assertEqual(changelog.record('p', old, new), 1)
+        self.assertEqual(self._entries(changelog)[2:], [
+            ('created', 3, {'severity': [None, 'minor'],
+                            'is_open': [None, True]})])
+
+        self.assertEqual(changelog.distribution('p'), {'normal': 2,
+                                                       'minor': 1})
+
+    def testFollow(self):
+        changelog = ChangeLog('./changes/')
+        self.assertEqual(list(changelog.changes('p')), [])
+
+        changelog.record('p', [], [self._bug(1, 'normal')])
+        cursor = list(changelog.changes('p'))[-1][0]
+        self.assertEqual(self._entries(changelog, cursor=cursor), [])
+
+        # an entry cut short by a crash is skipped, and so is a line that
+        # is still being written
+        with open(changelog._file('p'), 'ab') as f:
+            f.write('{"id": 2, "ev')
+        self.assertEqual(len(list(changelog.changes('p'))), 1)
+        changelog.record('p', [], [self._bug(3, 'minor', 9)])
+        with open(changelog._file('p'), 'ab') as f:
+            f.write('{"id": 4, "ev')
+
+        self.assertEqual(self._entries(changelog, cursor=cursor),
+                         [('created', 3, {'severity': [None, 'minor'],
+                                          'is_open': [None, True]})])
+        self.assertEqual(changelog.products(), ['p'])
+
+        # entries are timed by Bugzilla, so creations count then
+        self.assertEqual(changelog.distribution(
+            'p', datetime.datetime(2009, 12, 31)), {})
+        self.assertEqual(changelog.distribution(
+            'p', datetime.datetime(2010, 1, 1)), {'normal': 1, 'minor': 1})
+        self.assertEqual([entry['id'] for position, entry in changelog.changes(
+            'p', since=datetime.datetime(2010, 1, 1),
+            until=datetime.datetime(2010, 1, 2))], [1, 3])
+
+
+class DatabaseTest(StubTestCase):
+    """ Downloads a product, changes, removes and adds bugs and downloads
+    it again, in an order other than that of ids.
+    """
+    #private:
+    _product = 'log'
+    _bugs = 120
+
+    products = {_product: _bugs}
+
+    def _change(self):
+        bugs = self.corpus.products[self._product]
+        rand = random.Random(2)
+        changed = rand.sample(bugs, 10)
+        for bug in changed:
+            bug['severity'] = 'blocker' if bug['severity'] != 'blocker' \
+                else 'trivial'
+        removed = set(bug['id'] for bug in rand.sample(
+            [bug for bug in bugs if bug not in changed], 5))
+        bugs[:] = [bug for bug in bugs if bug['id'] not in removed]
+        self.corpus.changeProduct(self._product, 0, 8)
+        created = sorted(bug['id'] for bug in bugs[-8:])
+        rand.shuffle(bugs)
+
+        return sorted(bug['id'] for bug in changed), sorted(removed), created
+
+    def _events(self, changelog, cursor):
+        events = {}
+        for cursor, entry in changelog.changes(self._product, cursor):
+            events.setdefault(entry['event'], []).append(entry['id'])
+
+        return dict((event, sorted(ids)) for event, ids in events.items())
+
+    def _assertLogged(self, database):
+        changelog = ChangeLog('./changes/')
+        changelog._batchSize = 16
+        database.setChangeLog(changelog)
+
+        database.downloadProductBugs(self._product, True)
+        self.assertEqual(self._events(changelog, 0),
+                         {'created': self.ids(self._product)})
+        cursor = list(changelog.changes(self._product))[-1][0]
+
+        changed, removed, created = self._change()
+        database.downloadProductBugs(self._product, True)
+        self.assertEqual(self._events(changelog, cursor),
+                         {'changed': changed, 'removed': removed,
+                          'created': created})
+
+        severities = {}
+        for bug in self.corpus.products[self._product]:
+            severities[bug['severity']] = \
+                severities.get(bug['severity'], 0) + 1
+        self.assertEqual(changelog.distribution(self._product), severities)
+
+    #public:
+    def testXML(self):
+        self._assertLogged(XMLDatabase(self.url, 'log'))
+
+    def testXMLPages(self):
+        self._assertLogged(XMLDatabase(self.url, 'log', 25))
+
+    def testXMLSnapshots(self):
+        self._assertLogged(XMLDatabase(self.url, 'log', 25, snapshots=True))
+
+    def testSQLite(self):
+        self._assertLogged(SQLiteDatabase(self.url, 'log', 25))
+
+    @unittest.skipIf(mongomock is None, "mongomock is not installed")
+    def testMongo(self):
+        with mockMongo():
+            self._assertLogged(MongoDatabase(self.url, 'log', 25))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+""" Tests that the harvester downloads and updates many products at once,
+retries those that fail and keeps to its limit of requests per host.
+
+    PYTHONPATH=. python test/test_harvester.py
+"""
+
+import threading
+import time
+import unittest
+
+from src.base import SQLiteDatabase
+from src.harvester import Harvester
+
+from case import StubTestCase
+
+
+class HarvesterTest(StubTestCase):
+    #private:
+    products = {'a': 60, 'b': 40, 'c': 30, 'd': 20}
+
+    #public:
+    def testHarvest(self):
+        database = SQLiteDatabase(self.url, 'harvest', 10)
+        harvester = Harvester(workers=3, retries=2, backoff=0.01)
+        report = harvester.harvest(database, ['a', 'b', 'c', 'd', 'gone'])
+
+        self.assertEqual(sorted(report), ['a', 'b', 'c', 'd', 'gone'])
+        for product in ['a', 'b', 'c', 'd']:
+            self.assertEqual(report[product]['status'], 'ok')
+            self.assertEqual(report[product]['attempts'], 1)
+            self.assertEqual(report[product]['error'], None)
+            self.assertEqual(sorted(bug['id'] for bug in
+                                    database.queryProductBugs(
+                                        product, fields=['id'])),
+                             self.ids(product))
+
+        # a product Bugzilla doesn't have fails every time it is tried
+        self.assertEqual(report['gone']['status'], 'failed')
+        self.assertEqual(report['gone']['attempts'], 3)
+        self.assertEqual(report['gone']['error'],
+                         "ValueError: No bugs found for gone.")
+
+        self.corpus.changeProduct('a', 5, 3)
+        report = harvester.harvest(database, ['a', 'b'], update=True)
+        self.assertEqual(report['a']['status'], 'ok')
+        self.assertEqual(sorted(bug['id'] for bug in
+                                database.queryProductBugs('a',
+                                                          fields=['id'])),
+                         self.ids('a'))
+
+    def testHostSlots(self):
+        database = SQLiteDatabase(self.url, 'harvest')
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        download = SQLiteDatabase.downloadProductBugs
+
+        def counted(db, product, strict=False):
+            with lock:
+                running.append(product)
+                peak.append(len(running))
+            time.sleep(0.05)
+            try:
+                return download(db, product, strict)
+            finally:
+                with lock:
+                    running.remove(product)
+
+        SQLiteDatabase.downloadProductBugs = counted
+        try:
+            report = Harvester(workers=4, perhost=2).harvest(
+                database, sorted(self.products))
+        finally:
+            SQLiteDatabase.downloadProductBugs = download
+
+        self.assertTrue(all(entry['status'] == 'ok'
+                            for entry in report.values()))
+        self.assertEqual(max(peak), 2)
+
+    def testWorkers(self):
+        self.assertRaises(ValueError, Harvester, workers=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+""" Tests that metrics time and count phases of operations and tell how
+much memory each of them needed.
+
+    PYTHONPATH=. python test/test_metrics.py
+"""
+
+import unittest
+
+from src.base import BugzillaDB, SQLiteDatabase
+from src.metrics import MetricsRegistry, resource
+
+from case import StubTestCase
+
+
+class MetricsTest(StubTestCase):
+    #private:
+    products = {'a': 50}
+
+    #public:
+    def testPhases(self):
+        metrics = MetricsRegistry()
+        with metrics.phase('outer'):
+            for i in range(3):
+                with metrics.phase('inner'):
+                    metrics.count('things', 2)
+        try:
+            with metrics.phase('inner'):
+                raise IOError("failed")
+        except IOError:
+            pass
+
+        phases = metrics.getMetrics()['phases']
+        self.assertEqual(phases['outer']['calls'], 1)
+        self.assertEqual(phases['inner']['calls'], 4)
+        self.assertEqual(phases['inner']['errors'], 1)
+        self.assertTrue(phases['outer']['seconds'] >=
+                        phases['inner']['max_seconds'])
+        self.assertEqual(metrics.getMetrics()['counters'], {'things': 6})
+
+    @unittest.skipIf(resource is None, "resource module is not available")
+    def testPeakMemoryOfPhases(self):
+        metrics = MetricsRegistry()
+        with metrics.phase('small'):
+            small = range(10)
+        with metrics.phase('big'):
+            big = range(8 * 1024 * 1024)
+        del big, small
+        with metrics.phase('after'):
+            pass
+
+        phases = metrics.getMetrics()['phases']
+        self.assertTrue(phases['big']['memory_growth_bytes'] >
+                        32 * 1024 * 1024)
+        self.assertTrue(phases['small']['memory_growth_bytes'] <
+                        1024 * 1024)
+        self.assertEqual(phases['after']['memory_growth_bytes'], 0)
+        self.assertTrue(phases['after']['peak_memory_bytes'] >=
+                        phases['big']['peak_memory_bytes'])
+
+        prometheus = metrics.toPrometheus()
+        self.assertIn('bugzilla_phase_memory_growth_bytes{phase="big"}',
+                      prometheus)
+        self.assertIn('bugzilla_phase_peak_memory_bytes{phase="after"}',
+                      prometheus)
+
+    def testTracedPeak(self):
+        metrics = MetricsRegistry()
+        start = {'traced': 100, 'traced_peak': 500}
+        self.assertEqual(metrics._tracedPeak(
+            start, {'traced': 200, 'traced_peak': 900}), 900)
+        self.assertEqual(metrics._tracedPeak(
+            start, {'traced': 200, 'traced_peak': 500}), 200)
+
+    def testOperations(self):
+        metrics = MetricsRegistry()
+        bugdb = BugzillaDB(SQLiteDatabase(self.url, 'metrics'),
+                           metrics=metrics)
+        bugdb.downloadProductBugs('a')
+
+        result = metrics.getMetrics()
+        for phase in ['download', 'bugzilla_search', 'sqlite_write']:
+            self.assertEqual(result['phases'][phase]['errors'], 0)
+            if resource is not None:
+                self.assertIn('peak_memory_bytes', result['phases'][phase])
+        self.assertEqual(result['counters']['bugs_fetched'], 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+""" Tests that queries of bugs give the same bugs, with the same fields,
+whatever the database.
+
+    PYTHONPATH=. python test/test_query.py
+"""
+
+import datetime
+import unittest
+
+from src.base import MongoDatabase, SQLiteDatabase, XMLDatabase, parseTime
+
+from case import StubTestCase, mockMongo, mongomock
+
+
+class QueryTest(StubTestCase):
+    #private:
+    _product = 'query'
+
+    products = {_product: 150}
+
+    _queries = [{'severity': 'major'},
+                {'severity': ['major', 'critical'], 'is_open': True},
+                {'creation_time': (datetime.datetime(2004, 1, 1),
+                                   datetime.datetime(2006, 1, 1))},
+                {'creation_time': (None, datetime.datetime(2004, 1, 1))},
+                {'cf_last_closed': (None, None)},
+                {'cf_last_closed': (datetime.datetime(2005, 1, 1), None)},
+                {'alias': '', 'priority': 'Normal'}]
+
+    def _expected(self, query):
+        ids = []
+        for bug in self.corpus.products[self._product]:
+            for field, condition in query.items():
+                value = bug.get(field)
+                if field.endswith('_time') or field == 'cf_last_closed':
+                    value = parseTime(value) if value is not None else None
+                if isinstance(condition, tuple):
+                    start, end = condition
+                    if value is None or start is not None and value < start \
+                            or end is not None and value >= end:
+                        break
+                elif isinstance(condition, list):
+                    if value not in condition:
+                        break
+                elif value != condition:
+                    break
+            else:
+                ids.append(bug['id'])
+
+        return sorted(ids)
+
+    def _assertQueries(self, database):
+        database.downloadProductBugs(self._product, True)
+        for query in self._queries:
+            records = list(database.queryProductBugs(
+                self._product, fields=['id', 'severity'], query=query))
+            self.assertEqual(sorted(record['id'] for record in records),
+                             self._expected(query), query)
+            self.assertTrue(all(sorted(record) == ['id', 'severity']
+                                for record in records), query)
+
+    #public:
+    def testXML(self):
+        self._assertQueries(XMLDatabase(self.url, 'query'))
+
+    def testXMLSnapshots(self):
+        self._assertQueries(XMLDatabase(self.url, 'query', snapshots=True))
+
+    def testSQLite(self):
+        self._assertQueries(SQLiteDatabase(self.url, 'query'))
+
+    def testMongoQuery(self):
+        # translating a query needs no server
+        database = MongoDatabase.__new__(MongoDatabase)
+        self.assertEqual(database._mongoQuery({
+            'severity': ['major'], 'is_open': True,
+            'cf_last_closed': (None, None),
+            'creation_time': (None, datetime.datetime(2004, 1, 1))}), {
+            'severity': {'$in': ['major']}, 'is_open': True,
+            'cf_last_closed': {'$ne': None},
+            'creation_time': {'$lt': datetime.datetime(2004, 1, 1)}})
+
+    @unittest.skipIf(mongomock is None, "mongomock is not installed")
+    def testMongo(self):
+        with mockMongo():
+            database = MongoDatabase(self.url, 'query')
+            self._assertQueries(database)
+
+            # bugs whose value is null don't match, as in other databases
+            closed = self._expected({'cf_last_closed': (None, None)})
+            database.db[self._product].update_one(
+                {'id': closed[0]}, {'$set': {'cf_last_closed': None}})
+            self.assertEqual(sorted(bug['id'] for bug in
+                                    database.queryProductBugs(
+                                        self._product, fields=['id'],
+                                        query={'cf_last_closed':
+                                               (None, None)})),
+                             closed[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()
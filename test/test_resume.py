@@ -0,0 +1,131 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+""" Tests that interrupted paged downloads resume without losing or
+duplicating bugs, against a local stub Bugzilla.
+
+    PYTHONPATH=. python test/test_resume.py
+"""
+
+import unittest
+
+from src.base import MongoDatabase, SQLiteDatabase, XMLDatabase
+
+from case import Interrupted, StubTestCase, interrupt, mockMongo, \
+    mongomock
+
+
+class ResumeTest(StubTestCase):
+    #private:
+    _product = 'resume'
+    _bugs = 300
+    _pageSize = 100
+
+    products = {_product: _bugs}
+
+    def _database(self, backend, pagesize):
+        if backend == 'xml':
+            return XMLDatabase(self.url, 'resume', pagesize)
+        elif backend == 'mongo':
+            return MongoDatabase(self.url, 'resume', pagesize)
+        return SQLiteDatabase(self.url, 'resume', pagesize)
+
+    def _interruptCheckpoint(self, database, pages):
+        """ Makes a database fail with Interrupted after it stored a number
+        of pages, but before it saved their checkpoint.
+        """
+        save = database.saveMetadata
+        calls = []
+
+        def interrupted(kind, product, data):
+            if kind == 'checkpoint':
+                if len(calls) == pages:
+                    raise Interrupted("Download interrupted.")
+                calls.append(data)
+            save(kind, product, data)
+
+        database.saveMetadata = interrupted
+
+    def _ids(self, database):
+        return [bug['id'] for bug in
+                database.queryProductBugs(self._product, fields=['id'])]
+
+    def _assertComplete(self, database):
+        ids = self._ids(database)
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(sorted(ids), self.ids(self._product))
+        self.assertEqual(
+            database.loadMetadata('stats', self._product)['num_of_bugs'],
+            self._bugs)
+        self.assertEqual(database.loadMetadata('checkpoint', self._product),
+                         None)
+
+    def _resume(self, backend):
+        database = self._database(backend, self._pageSize)
+        interrupt(database, 1)
+        self.assertRaises(Interrupted, database.downloadProductBugs,
+                          self._product, True)
+        self.assertNotEqual(
+            database.loadMetadata('checkpoint', self._product), None)
+
+        database = self._database(backend, self._pageSize)
+        database.downloadProductBugs(self._product, True)
+        self._assertComplete(database)
+
+    def _resumeStoredPage(self, backend):
+        database = self._database(backend, self._pageSize)
+        self._interruptCheckpoint(database, 1)
+        self.assertRaises(Interrupted, database.downloadProductBugs,
+                          self._product, True)
+
+        # the second page was stored, but its checkpoint wasn't saved, so
+        # it is fetched and stored again
+        database = self._database(backend, self._pageSize)
+        database.downloadProductBugs(self._product, True)
+        self._assertComplete(database)
+
+    def _staleCheckpoint(self, backend):
+        database = self._database(backend, self._pageSize)
+        interrupt(database, 1)
+        self.assertRaises(Interrupted, database.downloadProductBugs,
+                          self._product, True)
+
+        # a download without pages leaves no checkpoint behind...
+        database = self._database(backend, 0)
+        database.downloadProductBugs(self._product, True)
+        self._assertComplete(database)
+
+        # ...so the next download in pages starts over
+        database = self._database(backend, self._pageSize)
+        database.downloadProductBugs(self._product, True)
+        self._assertComplete(database)
+
+    #public:
+    def testResumeXML(self):
+        self._resume('xml')
+
+    def testResumeSQLite(self):
+        self._resume('sqlite')
+
+    def testResumeStoredPageXML(self):
+        self._resumeStoredPage('xml')
+
+    def testResumeStoredPageSQLite(self):
+        self._resumeStoredPage('sqlite')
+
+    def testStaleCheckpointXML(self):
+        self._staleCheckpoint('xml')
+
+    def testStaleCheckpointSQLite(self):
+        self._staleCheckpoint('sqlite')
+
+    @unittest.skipIf(mongomock is None, "mongomock is not installed")
+    def testMongo(self):
+        with mockMongo():
+            for resume in [self._resume, self._resumeStoredPage,
+                           self._staleCheckpoint]:
+                resume('mongo')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+""" Tests how the scheduler spaces synchronizations of products and that
+it keeps them fresh against a stub Bugzilla.
+
+    PYTHONPATH=. python test/test_scheduler.py
+"""
+
+import time
+import unittest
+
+from src.base import BugzillaDB, SQLiteDatabase
+from src.scheduler import Scheduler
+
+from case import StubTestCase
+
+
+class RescheduleTest(unittest.TestCase):
+    #private:
+    def _scheduler(self):
+        return Scheduler(None, [], mininterval=300, maxinterval=86400,
+                         backoff=2.0, target=10)
+
+    #public:
+    def testIdleSyncsBackOff(self):
+        scheduler = self._scheduler()
+        job = scheduler._newJob()
+        now = 1000000.0
+
+        # first sync downloads the product, which tells nothing of its rate
+        scheduler._reschedule(job, 500, now)
+        self.assertEqual(job['interval'], 300)
+
+        intervals = []
+        for i in range(12):
+            now = job['next_sync']
+            scheduler._reschedule(job, 0, now)
+            intervals.append(job['interval'])
+            self.assertEqual(job['next_sync'], now + job['interval'])
+
+        self.assertEqual(intervals[:8], [600, 1200, 2400, 4800, 9600, 19200,
+                                         38400, 76800])
+        self.assertEqual(intervals[8:], [86400] * 4)
+
+    def testBusyProductsComeSooner(self):
+        scheduler = self._scheduler()
+        busy, quiet = scheduler._newJob(), scheduler._newJob()
+        now = 1000000.0
+        scheduler._reschedule(busy, 500, now)
+        scheduler._reschedule(quiet, 500, now)
+
+        for i in range(5):
+            now += 3600
+            scheduler._reschedule(busy, 1000, now)
+            scheduler._reschedule(quiet, 1, now)
+
+        self.assertEqual(busy['interval'], 300)
+        self.assertTrue(300 < quiet['interval'] < 86400)
+        self.assertTrue(busy['rate'] > quiet['rate'] > 0)
+
+    def testFailuresBackOff(self):
+        scheduler = self._scheduler()
+        job = scheduler._newJob()
+
+        scheduler._reschedule(job, 0, 1000000.0, "IOError: down")
+        scheduler._reschedule(job, 0, 1000300.0, "IOError: down")
+        self.assertEqual(job['interval'], 1200)
+        self.assertEqual(job['failures'], 2)
+        self.assertEqual(job['error'], "IOError: down")
+
+        scheduler._reschedule(job, 3, 1001500.0)
+        self.assertEqual(job['failures'], 0)
+        self.assertEqual(job['error'], None)
+
+
+class SchedulerTest(StubTestCase):
+    #private:
+    products = {'a': 60, 'b': 40}
+
+    #public:
+    def testRun(self):
+        bugdb = BugzillaDB(SQLiteDatabase(self.url, 'scheduler'))
+        scheduler = Scheduler(bugdb, ['a', 'b'], workers=2, mininterval=1)
+        scheduler.run(2)
+
+        self.assertEqual(sorted(bugdb.listTrackedProducts()), ['a', 'b'])
+        jobs = scheduler.getJobs()
+        for product in ['a', 'b']:
+            self.assertEqual(jobs[product]['error'], None)
+            self.assertTrue(jobs[product]['syncs'] >= 1)
+
+        # a new scheduler carries on with the saved jobs
+        again = Scheduler(bugdb, ['a', 'b'])
+        self.assertEqual(again.getJobs(), jobs)
+
+    def testRemoveProduct(self):
+        bugdb = BugzillaDB(SQLiteDatabase(self.url, 'scheduler'))
+        scheduler = Scheduler(bugdb, ['a', 'b'], workers=1, mininterval=1)
+        scheduler.start()
+        try:
+            scheduler.removeProduct('a')
+            time.sleep(1)
+            self.assertTrue(all(t.is_alive() for t in scheduler._threads))
+        finally:
+            scheduler.stop()
+
+        self.assertEqual(sorted(scheduler.getJobs()), ['b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
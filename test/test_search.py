@@ -0,0 +1,109 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+""" Tests that the search index finds and counts bugs of all products and
+stays in step with databases as they download products again.
+
+    PYTHONPATH=. python test/test_search.py
+"""
+
+import unittest
+
+from src.base import BugzillaDB, SQLiteDatabase, XMLDatabase
+from src.search import SearchIndex
+
+from case import Interrupted, StubTestCase, interrupt
+
+
+class SearchTest(StubTestCase):
+    #private:
+    products = {'a': 150, 'b': 60}
+
+    def _bugdb(self, backend, pagesize=0):
+        if backend == 'xml':
+            database = XMLDatabase(self.url, 'search', pagesize)
+        else:
+            database = SQLiteDatabase(self.url, 'search', pagesize)
+        return BugzillaDB(database, index=self.index)
+
+    def _indexed(self, product):
+        result = self.index.search(filters={'product': product},
+                                   facets=[], limit=1000)
+        return sorted(bug['id'] for bug in result['bugs'])
+
+    def _download(self, backend, pagesize):
+        bugdb = self._bugdb(backend, pagesize)
+        for product in sorted(self.products):
+            bugdb.db.downloadProductBugs(product, True)
+        return bugdb
+
+    def _assertFailedDownload(self, backend, pagesize):
+        bugdb = self._download(backend, pagesize)
+        interrupt(bugdb.db, 1 if pagesize else 0)
+        self.assertRaises(Interrupted, bugdb.db.downloadProductBugs, 'a',
+                          True)
+        self.assertEqual(self._indexed('a'), self.ids('a'))
+
+    def _assertGoneBugs(self, backend, pagesize):
+        bugdb = self._download(backend, pagesize)
+        gone = self.corpus.products['a'].pop(0)['id']
+        bugdb.db.downloadProductBugs('a', True)
+        self.assertEqual(self._indexed('a'), self.ids('a'))
+        self.assertNotIn(gone, self._indexed('a'))
+        self.assertEqual(self._indexed('b'), self.ids('b'))
+
+    #public:
+    def setUp(self):
+        StubTestCase.setUp(self)
+        self.index = SearchIndex('./index.sqlite')
+
+    def testSearch(self):
+        bugdb = self._download('sqlite', 0)
+        bugs = self.corpus.products['a'] + self.corpus.products['b']
+
+        result = bugdb.searchBugs(limit=1000)
+        self.assertEqual(result['total'], len(bugs))
+        self.assertEqual(result['facets']['product'], {'a': 150, 'b': 60})
+        severities = {}
+        for bug in bugs:
+            severities[bug['severity']] = severities.get(bug['severity'],
+                                                         0) + 1
+        self.assertEqual(result['facets']['severity'], severities)
+
+        critical = [bug['id'] for bug in bugs
+                    if bug['severity'] in ('critical', 'blocker')]
+        result = bugdb.searchBugs(filters={'severity': ['critical',
+                                                        'blocker']},
+                                  limit=1000)
+        self.assertEqual(sorted(bug['id'] for bug in result['bugs']),
+                         sorted(critical))
+
+        word = bugs[0]['summary'].split()[0]
+        result = bugdb.searchBugs(word, limit=1000)
+        self.assertEqual(sorted(bug['id'] for bug in result['bugs']),
+                         sorted(bug['id'] for bug in bugs
+                                if word in bug['summary'].split()))
+        ranks = [bug['rank'] for bug in result['bugs']]
+        self.assertEqual(ranks, sorted(ranks))
+
+    def testFailedDownloadXML(self):
+        self._assertFailedDownload('xml', 0)
+
+    def testFailedDownloadPagedXML(self):
+        self._assertFailedDownload('xml', 50)
+
+    def testFailedDownloadSQLite(self):
+        self._assertFailedDownload('sqlite', 50)
+
+    def testGoneBugsXML(self):
+        self._assertGoneBugs('xml', 0)
+
+    def testGoneBugsPagedXML(self):
+        self._assertGoneBugs('xml', 50)
+
+    def testGoneBugsSQLite(self):
+        self._assertGoneBugs('sqlite', 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
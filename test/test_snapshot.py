@@ -0,0 +1,161 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+""" Tests the snapshot format: snapshots must read back the bugs they were
+made of, refuse files they can't trust and be rebuilt by XMLDatabase when
+a column it needs is damaged.
+
+    PYTHONPATH=. python test/test_snapshot.py
+"""
+
+import datetime
+import json
+import unittest
+
+from src.base import XMLDatabase
+from src.metrics import MetricsRegistry
+from src.snapshot import Snapshot
+
+from case import StubTestCase
+
+
+def damage(path, position):
+    """ Flips the bits of a byte of a file """
+    with open(path, 'r+b') as f:
+        f.seek(position)
+        byte = f.read(1)
+        f.seek(position)
+        f.write(chr(ord(byte) ^ 0xff))
+
+
+def columnStart(path, field):
+    """ Returns where a column of a saved snapshot starts in its file """
+    with open(path, 'rb') as f:
+        data = f.read()
+    header = Snapshot._header.size
+    length = Snapshot._header.unpack(data[:header])[3]
+    directory = json.loads(data[header:header + length])
+    return header + length + directory['columns'][field][0]
+
+
+class SnapshotTest(StubTestCase):
+    #private:
+    _bugs = [{'id': 1, 'is_open': True, 'severity': 'major',
+              'status': 'NEW', 'resolution': '', 'priority': 'High',
+              'component': u'G\xfcI',
+              'creation_time': datetime.datetime(2002, 8, 22, 16, 38),
+              'last_change_time': datetime.datetime(2003, 1, 2, 3, 4, 5)},
+             {'id': 2, 'is_open': 'False', 'severity': 'normal',
+              'status': 'RESOLVED', 'resolution': 'FIXED',
+              'creation_time': datetime.datetime(1999, 12, 31, 23, 59, 59),
+              'cf_last_closed': datetime.datetime(2000, 1, 1)},
+             {'id': 3, 'severity': 'major'}]
+
+    def _snapshot(self):
+        snapshot = Snapshot({'num_of_bugs': len(self._bugs)})
+        snapshot.append(self._bugs)
+        snapshot.save('snapshot')
+        return Snapshot.load('snapshot')
+
+    #public:
+    def testRoundTrip(self):
+        snapshot = self._snapshot()
+        self.assertEqual(len(snapshot), 3)
+        self.assertEqual(snapshot.info, {'num_of_bugs': 3})
+
+        records = list(snapshot.records(Snapshot.fields))
+        expected = [dict(bug) for bug in self._bugs]
+        expected[1]['is_open'] = False
+        self.assertEqual(records, expected)
+
+        self.assertEqual(list(snapshot.records(['id', 'severity'])),
+                         [{'id': 1, 'severity': 'major'},
+                          {'id': 2, 'severity': 'normal'},
+                          {'id': 3, 'severity': 'major'}])
+        self.assertEqual(snapshot.values('severity'),
+                         [None, 'major', 'normal'])
+
+    def testAppendToLoaded(self):
+        snapshot = self._snapshot()
+        snapshot.append([{'id': 4, 'severity': 'minor'},
+                         {'id': 5, 'severity': 'major'}])
+        snapshot.save('snapshot')
+
+        records = list(Snapshot.load('snapshot').records(['id', 'severity']))
+        self.assertEqual([record['id'] for record in records],
+                         [1, 2, 3, 4, 5])
+        self.assertEqual([record['severity'] for record in records],
+                         ['major', 'normal', 'major', 'minor', 'major'])
+
+    def testUntrustedFiles(self):
+        self.assertEqual(Snapshot.load('missing'), None)
+
+        with open('short', 'wb') as f:
+            f.write('BZSNAP')
+        self.assertEqual(Snapshot.load('short'), None)
+
+        self._snapshot()
+        with open('snapshot', 'rb') as f:
+            data = f.read()
+        with open('version', 'wb') as f:
+            f.write(data[:6] + '\xff\xff' + data[8:])
+        self.assertEqual(Snapshot.load('version'), None)
+
+        damage('snapshot', Snapshot._header.size + 1)
+        self.assertEqual(Snapshot.load('snapshot'), None)
+
+    def testDamagedColumn(self):
+        self._snapshot()
+        damage('snapshot', columnStart('snapshot', 'severity'))
+
+        snapshot = Snapshot.load('snapshot')
+        self.assertEqual([record['id'] for record in
+                          snapshot.records(['id'])], [1, 2, 3])
+        self.assertRaises(ValueError, snapshot.column, 'severity')
+
+
+class RebuildTest(StubTestCase):
+    #private:
+    products = {'a': 200}
+
+    def _records(self, database, fields):
+        return sorted(database.queryProductBugs('a', fields=fields),
+                      key=lambda bug: bug['id'])
+
+    #public:
+    def testSnapshotMatchesXML(self):
+        database = XMLDatabase(self.url, 'snapshot', 50, snapshots=True)
+        database.downloadProductBugs('a', True)
+
+        plain = XMLDatabase(self.url, 'snapshot')
+        self.assertEqual(self._records(database, Snapshot.fields),
+                         self._records(plain, Snapshot.fields))
+
+    def testRebuildDamagedColumn(self):
+        database = XMLDatabase(self.url, 'snapshot', snapshots=True)
+        database.downloadProductBugs('a', True)
+        expected = self._records(database, ['id', 'severity'])
+
+        metrics = MetricsRegistry()
+        database.setMetrics(metrics)
+        path = database._metadataFile('snapshot', 'a')
+        damage(path, columnStart(path, 'severity'))
+
+        # the damaged column is not read, so the snapshot is used as it is
+        self.assertEqual(len(self._records(database, ['id', 'status'])), 200)
+        self.assertFalse('snapshot_build' in metrics.getMetrics()['phases'])
+
+        self.assertEqual(self._records(database, ['id', 'severity']),
+                         expected)
+        self.assertEqual(
+            metrics.getMetrics()['phases']['snapshot_build']['calls'], 1)
+
+        # ...and the rebuilt one is saved
+        self.assertEqual(self._records(database, ['id', 'severity']),
+                         expected)
+        self.assertEqual(
+            metrics.getMetrics()['phases']['snapshot_build']['calls'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+""" Tests that SQLiteDatabase keeps bugs as they came from Bugzilla, keeps
+its statistics right through updates and counts bugs the way other
+analyzers do.
+
+    PYTHONPATH=. python test/test_sqlite.py
+"""
+
+import unittest
+
+from src.analyzer import Analyzer, SQLiteAnalyzer, StreamAnalyzer
+from src.base import SQLiteDatabase, parseTime
+
+from case import StubTestCase
+
+
+class SQLiteTest(StubTestCase):
+    #private:
+    _product = 'sqlite'
+
+    products = {_product: 80, 'other': 10}
+
+    def _expected(self):
+        """ Returns bugs of the product as the database should read them
+        back, by id.
+        """
+        bugs = {}
+        for bug in self.corpus.products[self._product]:
+            bug = dict(bug)
+            for field in SQLiteDatabase._timeFields:
+                if field in bug:
+                    bug[field] = parseTime(bug[field])
+            bugs[bug['id']] = bug
+
+        return bugs
+
+    def _bugs(self, database):
+        return dict((bug['id'], bug) for bug in
+                    database.queryProductBugs(self._product, lazy=True))
+
+    #public:
+    def testRoundTrip(self):
+        database = SQLiteDatabase(self.url, 'sqlite')
+        database.downloadProductBugs(self._product, True)
+        database.downloadProductBugs('other', True)
+
+        expected = self._expected()
+        self.assertEqual(self._bugs(database), expected)
+        self.assertEqual(sorted(database.getListOfProducts()),
+                         ['other', self._product])
+
+        # columns give the same values as whole bugs
+        fields = ['id', 'severity', 'is_open', 'creation_time',
+                  'cf_last_closed']
+        for record in database.queryProductBugs(self._product,
+                                                fields=fields):
+            bug = expected[record['id']]
+            self.assertEqual(record, dict((field, bug[field])
+                                          for field in fields
+                                          if field in bug))
+
+    def testUpdate(self):
+        database = SQLiteDatabase(self.url, 'sqlite')
+        database.downloadProductBugs(self._product, True)
+        database.getProductStatistics(self._product)
+
+        self.corpus.changeProduct(self._product, 5, 3)
+        self.assertEqual(database.updateProductBugs(self._product), 8)
+        self.assertEqual(database.updateProductBugs(self._product), 0)
+        self.assertEqual(self._bugs(database), self._expected())
+
+        # statistics kept through the update are the ones made from scratch
+        stats = database.getProductStatistics(self._product)
+        self.assertEqual(stats['num_of_bugs'], 83)
+        database.removeMetadata('stats', self._product)
+        self.assertEqual(database.getProductStatistics(self._product), stats)
+
+    def testAnalyzer(self):
+        database = SQLiteDatabase(self.url, 'sqlite')
+        database.downloadProductBugs(self._product, True)
+
+        expected = Analyzer(database, StreamAnalyzer(), False)
+        analyzer = Analyzer(database, SQLiteAnalyzer(), False)
+        self.assertEqual(analyzer.getProductStatistics(self._product),
+                         expected.getProductStatistics(self._product))
+        self.assertEqual(Analyzer(database, SQLiteAnalyzer(), True)
+                         .getProductStatistics(self._product),
+                         expected.getProductStatistics(self._product))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+""" Tests the format XMLDatabase keeps bugs in: bugs must read back the
+same as they were written, and so must files written by earlier versions.
+
+    PYTHONPATH=. python test/test_xml.py
+"""
+
+import datetime
+import os
+import StringIO
+import unittest
+import xml.etree.ElementTree as ET
+import xmlrpclib
+
+from src.base import SQLiteDatabase, XMLDatabase, parseTime, timeString
+
+from case import StubTestCase
+
+
+class TimeTest(unittest.TestCase):
+    def testParseTime(self):
+        expected = datetime.datetime(2002, 8, 22, 16, 38, 0)
+        self.assertEqual(parseTime('20020822T16:38:00'), expected)
+        self.assertEqual(parseTime(xmlrpclib.DateTime('20020822T16:38:00')),
+                         expected)
+        self.assertEqual(parseTime(expected), expected)
+        # times of other widths are left to strptime
+        self.assertEqual(parseTime('20020822T6:38:00'),
+                         datetime.datetime(2002, 8, 22, 6, 38, 0))
+        self.assertRaises(ValueError, parseTime, '2002-08-22 16:38:00')
+
+    def testTimeString(self):
+        time = datetime.datetime(2002, 8, 22, 16, 38, 0)
+        self.assertEqual(timeString(time), '20020822T16:38:00')
+        self.assertEqual(timeString(xmlrpclib.DateTime('20020822T16:38:00')),
+                         '20020822T16:38:00')
+        self.assertEqual(timeString('20020822T16:38:00'), '20020822T16:38:00')
+
+
+class SerializerTest(unittest.TestCase):
+    #private:
+    def _roundTrip(self, bug):
+        database = XMLDatabase('http://localhost/', '')
+        f = StringIO.StringIO()
+        database.serialize(f, [bug])
+        return database._record(ET.fromstring(f.getvalue()), None)
+
+    #public:
+    def testRoundTrip(self):
+        bug = {'id': 91431, 'summary': u'crash in pr\xe9f\xe9rences <&>',
+               'is_open': False, 'is_confirmed': True, 'votes': 0,
+               'big': 10 ** 20, 'estimated_time': 1.5, 'tiny': 1e-20,
+               'creation_time': datetime.datetime(2002, 8, 22, 16, 38),
+               'cc': [u'a@example.com', u'b@example.com'], 'keywords': [],
+               'flags': [{'id': 3, 'status': '+'}, {}],
+               'internals': {'status': {'is_open': 0, 'value': 'NEW'},
+                             'empty': {}},
+               'custom': {}}
+        self.assertEqual(self._roundTrip(bug), bug)
+
+    def testTextIsNotGuessed(self):
+        bug = {'id': 1, 'summary': 'True', 'whiteboard': 'False',
+               'version': '1.5', 'platform': '', 'component': '0'}
+        self.assertEqual(self._roundTrip(bug), bug)
+
+    def testTypesOfValues(self):
+        bug = self._roundTrip({'id': 1, 'a': True, 'b': 2.0, 'c': 2,
+                               'd': {}})
+        for field, kind in [('a', bool), ('b', float), ('c', int),
+                            ('d', dict)]:
+            self.assertTrue(type(bug[field]) is kind, field)
+
+    def testEarlierFiles(self):
+        """ Files written before booleans were marked hold is_open as True
+        or False and nested dictionaries without a type.
+        """
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'gnome')
+        database = XMLDatabase('http://localhost/', '')
+        database._dbdir = path + '/'
+        database._productName = 'galf'
+
+        bugs = [database._record(bug, None) for bug in database.iterBugs()]
+        self.assertEqual(len(bugs), 9)
+        for bug in bugs:
+            self.assertTrue(bug['is_open'] is False)
+            self.assertEqual(bug['internals']['status']['is_open'], '0')
+            self.assertTrue(isinstance(bug['id'], int))
+            self.assertTrue(isinstance(bug['creation_time'],
+                                       datetime.datetime))
+
+
+class MissingProductTest(StubTestCase):
+    #private:
+    products = {'a': 10}
+
+    def _assertNoBugs(self, database):
+        self.assertEqual(list(database.queryProductBugs(
+            'missing', fields=['id', 'severity'])), [])
+        self.assertEqual(list(database.queryProductBugs(
+            'missing', fields=['id'], query={'severity': 'major'})), [])
+        self.assertEqual(
+            database.getProductStatistics('missing')['num_of_bugs'], 0)
+        self.assertEqual(database.updateProductBugs('missing'), 0)
+
+    #public:
+    def testXML(self):
+        self._assertNoBugs(XMLDatabase(self.url, 'xml'))
+
+    def testSnapshots(self):
+        self._assertNoBugs(XMLDatabase(self.url, 'xml', snapshots=True))
+
+    def testSQLite(self):
+        self._assertNoBugs(SQLiteDatabase(self.url, 'sqlite'))
+
+
+if __name__ == '__main__':
+    unittest.main()